@@ -0,0 +1,108 @@
+"""Helpers shared by the benchmarks"""
+
+import asyncio
+import base64
+import contextlib
+import os
+import struct
+import tempfile
+from typing import Iterator, Optional
+
+
+def _utf(s: str) -> bytes:
+    data = s.encode()
+    return struct.pack(">H", len(data)) + data
+
+
+def _nullable_utf(s: Optional[str]) -> bytes:
+    return b"\x00" if s is None else b"\x01" + _utf(s)
+
+
+def encode_track(
+    title: str, author: str = "Artist", source: str = "spotify", n: int = 0
+) -> str:
+    """A version 3 lavaplayer track, as Lavalink encodes it"""
+    body = (
+        bytes([3])
+        + _utf(title)
+        + _utf(author)
+        + struct.pack(">q", 200_000 + n)
+        + _utf(f"id{n}")
+        + b"\x00"
+        + _nullable_utf(f"https://open.spotify.com/track/{n}")
+        + _nullable_utf(f"https://i.scdn.co/image/{n}")
+        + _nullable_utf("ISRC00000001")
+        + _utf(source)
+    )
+    if source == "spotify":
+        # Album name, album url, artist url, artist artwork, preview url, is preview
+        body += (
+            _nullable_utf("Album")
+            + _nullable_utf(None)
+            + _nullable_utf("https://open.spotify.com/artist/1")
+            + _nullable_utf(None)
+            + _nullable_utf(None)
+            + b"\x00"
+        )
+    body += struct.pack(">q", 0)
+    return base64.b64encode(struct.pack(">i", (1 << 30) | len(body)) + body).decode()
+
+
+def encode_tracks(count: int, source: str = "spotify") -> list[str]:
+    return [
+        encode_track(f"Song title number {i}", f"Artist {i % 50}", source, i)
+        for i in range(count)
+    ]
+
+
+@contextlib.contextmanager
+def temp_workdir() -> Iterator[str]:
+    """Run in an empty directory, the databases are created there"""
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as path:
+        os.chdir(path)
+        try:
+            yield path
+        finally:
+            os.chdir(cwd)
+
+
+class FakeNode:
+    """A Lavalink node answering ``v4/decodetrack(s)`` after a delay"""
+
+    identifier = "fake"
+
+    def __init__(self, latency: float = 0.02, per_track: float = 0.0002):
+        self.latency = latency
+        self.per_track = per_track
+        self.requests: int = 0
+
+    async def send(self, method: str = "GET", *, path: str, data=None, params=None):
+        self.requests += 1
+        if path == "v4/decodetrack":
+            await asyncio.sleep(self.latency + self.per_track)
+            return self._decoded(params["encodedTrack"])
+        if path == "v4/decodetracks":
+            await asyncio.sleep(self.latency + self.per_track * len(data))
+            return [self._decoded(e) for e in data]
+        raise ValueError(f"Unexpected path {path}")
+
+    @staticmethod
+    def _decoded(encoded: str) -> dict:
+        return {
+            "encoded": encoded,
+            "info": {
+                "identifier": encoded[-12:],
+                "isSeekable": True,
+                "author": "Artist",
+                "length": 200_000,
+                "isStream": False,
+                "position": 0,
+                "title": "Title",
+                "uri": None,
+                "artworkUrl": None,
+                "isrc": None,
+                "sourceName": "unknown",
+            },
+            "pluginInfo": {},
+        }
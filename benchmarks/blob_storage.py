@@ -0,0 +1,126 @@
+"""On-disk size of userplaylists.db before and after the tracks move to
+content-addressed blobs (migration 5).
+
+A legacy database is filled with ``--rows`` tracks picked from
+``--distinct`` tracks with a Zipf-like popularity, half spotify and half
+youtube, 200 tracks per playlist. It's migrated up to version 4 with the
+metadata columns filled, measured, then migrated to the latest version and
+measured again. Both files are measured after ``VACUUM``.
+
+    python -m benchmarks.blob_storage [--rows 1000000] [--distinct 100000]
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import sqlite3
+import time
+from bot import dbmanager
+from ._fixtures import encode_track, temp_workdir
+
+TRACKS_PER_PLAYLIST = 200
+
+
+def create_legacy_database(rows: int, distinct: int) -> list[str]:
+    random.seed(1)
+    tracks = [
+        encode_track(
+            f"Some track title number {i}",
+            f"Artist {i % 5000}",
+            "spotify" if i % 2 else "youtube",
+            i,
+        )
+        for i in range(distinct)
+    ]
+    weights = [1 / (i + 1) ** 0.8 for i in range(distinct)]
+    picks = random.choices(range(distinct), weights, k=rows)
+    conn = sqlite3.connect(dbmanager.PLAYLISTS_DB)
+    conn.executescript(
+        """CREATE TABLE playlists (
+               id INTEGER PRIMARY KEY AUTOINCREMENT NOT NULL,
+               userid VARCHAR(100) NOT NULL,
+               name VARCHAR(80) NOT NULL,
+               description VARCHAR(100),
+               thumbnail_url VARCHAR(255)
+           );
+           CREATE TABLE tracks (
+               id INTEGER PRIMARY KEY AUTOINCREMENT NOT NULL,
+               plid INTEGER NOT NULL,
+               userid INTEGER NOT NULL,
+               encoded VARCHAR(255) NOT NULL
+           );"""
+    )
+    playlists = rows // TRACKS_PER_PLAYLIST + 1
+    conn.executemany(
+        "INSERT INTO playlists (userid, name) VALUES (?, 'playlist')",
+        ((str(i),) for i in range(1, playlists + 1)),
+    )
+    conn.executemany(
+        "INSERT INTO tracks (plid, userid, encoded) VALUES (?, ?, ?)",
+        (
+            (1 + j // TRACKS_PER_PLAYLIST, 1 + j // TRACKS_PER_PLAYLIST, tracks[p])
+            for j, p in enumerate(picks)
+        ),
+    )
+    conn.commit()
+    conn.close()
+    return tracks
+
+
+async def migrate_to(version: int):
+    migrations = dbmanager.MIGRATIONS[dbmanager.PLAYLISTS_DB]
+    dbmanager.MIGRATIONS[dbmanager.PLAYLISTS_DB] = [m for m in migrations if m[0] <= version]
+    try:
+        await dbmanager.migrate(dbmanager.PLAYLISTS_DB)
+    finally:
+        dbmanager.MIGRATIONS[dbmanager.PLAYLISTS_DB] = migrations
+        await dbmanager.close_pools()
+
+
+def fill_metadata(tracks: list[str]):
+    metadata = {e: dbmanager.track_metadata(e) for e in tracks}
+    conn = sqlite3.connect(dbmanager.PLAYLISTS_DB)
+    conn.executemany(
+        "UPDATE tracks SET title=?, author=?, length_ms=?, source=?, uri=? WHERE id=?",
+        ((*metadata[e], i) for i, e in conn.execute("SELECT id, encoded FROM tracks")),
+    )
+    conn.commit()
+    conn.close()
+
+
+def vacuumed_size() -> int:
+    conn = sqlite3.connect(dbmanager.PLAYLISTS_DB)
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    conn.execute("VACUUM")
+    conn.close()
+    return os.path.getsize(dbmanager.PLAYLISTS_DB)
+
+
+def main(rows: int, distinct: int):
+    print(f"{rows:,} rows over {distinct:,} distinct tracks")
+    tracks = create_legacy_database(rows, distinct)
+    asyncio.run(migrate_to(4))
+    fill_metadata(tracks)
+    before = vacuumed_size()
+
+    started = time.perf_counter()
+    asyncio.run(migrate_to(max(m[0] for m in dbmanager.MIGRATIONS[dbmanager.PLAYLISTS_DB])))
+    elapsed = time.perf_counter() - started
+    after = vacuumed_size()
+
+    conn = sqlite3.connect(dbmanager.PLAYLISTS_DB)
+    blobs, stored = conn.execute("SELECT COUNT(*), SUM(LENGTH(data)) FROM track_blobs").fetchone()
+    conn.close()
+    print(f"  before (encoded column)  {before / 2**20:8.1f} MiB")
+    print(f"  after  (track_blobs)     {after / 2**20:8.1f} MiB  ({after / before:.2f}x)")
+    print(f"  {blobs:,} blobs, {stored / 1e6:.1f} MB of track data, migrated in {elapsed:.1f}s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--distinct", type=int, default=100_000)
+    args = parser.parse_args()
+    with temp_workdir():
+        main(args.rows, args.distinct)
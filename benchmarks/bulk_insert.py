@@ -0,0 +1,73 @@
+"""Insert playlist tracks one row and one commit at a time, like the old
+``POST /playlist/{pl_id}/track`` loop, and in a single transaction, like
+``POST /playlist/{pl_id}/tracks``.
+
+The database is created in a temporary directory, run it on the disk the
+bot uses to include the fsync cost of every commit.
+
+    python -m benchmarks.bulk_insert [--sizes 10 100 10000]
+"""
+
+import argparse
+import asyncio
+import time
+from bot import dbmanager
+from ._fixtures import encode_tracks, temp_workdir
+
+INSERT_SQL = """INSERT INTO tracks (plid, userid, blob_id, position, title, author, length_ms, source, uri)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)"""
+
+
+async def per_row(pl_id: int, encoded: list[str]):
+    async with dbmanager.acquire() as conn:
+        for position, e in enumerate(encoded, start=1):
+            async with dbmanager.write_transaction(conn) as cur:
+                (blob_id,) = await dbmanager.store_track_blobs(conn, (e,))
+                await cur.execute(
+                    INSERT_SQL,
+                    (pl_id, 1, blob_id, position, *dbmanager.track_metadata(e)),
+                )
+
+
+async def bulk(pl_id: int, encoded: list[str]):
+    async with dbmanager.acquire() as conn, dbmanager.write_transaction(conn) as cur:
+        blob_ids = await dbmanager.store_track_blobs(conn, encoded)
+        await cur.executemany(
+            INSERT_SQL,
+            (
+                (pl_id, 1, blob_id, position, *dbmanager.track_metadata(e))
+                for position, (e, blob_id) in enumerate(zip(encoded, blob_ids), start=1)
+            ),
+        )
+
+
+async def main(sizes: list[int]):
+    await dbmanager.dbsetup()
+    async with dbmanager.acquire() as conn:
+        await conn.executemany(
+            "INSERT INTO playlists (id, userid, name) VALUES (?, '1', 'benchmark')",
+            [(i,) for i in range(1, 2 * len(sizes) + 1)],
+        )
+    pl_id = 0
+    for size in sizes:
+        rates = []
+        for insert in (per_row, bulk):
+            pl_id += 1
+            # Distinct tracks, so every run stores new blobs
+            encoded = encode_tracks(size * pl_id)[size * (pl_id - 1) :]
+            started = time.perf_counter()
+            await insert(pl_id, encoded)
+            rates.append(size / (time.perf_counter() - started))
+        print(
+            f"{size:6} tracks: per row {rates[0]:9,.0f} tracks/s, "
+            f"bulk {rates[1]:9,.0f} tracks/s ({rates[1] / rates[0]:.0f}x)"
+        )
+    await dbmanager.close_pools()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 10_000])
+    args = parser.parse_args()
+    with temp_workdir():
+        asyncio.run(main(args.sizes))
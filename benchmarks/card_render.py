@@ -0,0 +1,114 @@
+"""Now playing card throughput and event loop lag, rendered in the event
+loop and in the worker pool.
+
+Artwork and avatar are served by a local aiohttp server (640px JPEG). Cards
+are rendered in bursts of ``--burst`` distinct tracks while a task measures
+how late a 5 ms sleep wakes up, which is how long the loop was blocked.
+
+    python -m benchmarks.card_render [--cards 120] [--workers 0 2 4]
+"""
+
+import argparse
+import asyncio
+import io
+import random
+import statistics
+import tempfile
+import time
+from pathlib import Path
+from types import SimpleNamespace
+from aiohttp import web
+from PIL import Image
+from bot.artwork import artwork_fetcher
+from bot.cards import CardRenderer
+
+PORT = 8767
+BASE_URL = f"http://127.0.0.1:{PORT}"
+SOURCES = ("spotify", "youtube", "deezer")
+
+
+def jpeg(seed: int) -> bytes:
+    random.seed(seed)
+    image = Image.effect_noise((640, 640), 60).convert("RGB")
+    output = io.BytesIO()
+    image.save(output, "JPEG", quality=85)
+    return output.getvalue()
+
+
+def track(n: int) -> SimpleNamespace:
+    return SimpleNamespace(
+        identifier=f"id{n}",
+        source=SOURCES[n % len(SOURCES)],
+        artwork=f"{BASE_URL}/artwork/{n % 20}.jpg",
+        title=f"Track title {n}",
+        author="Artist",
+    )
+
+
+async def bench(workers: int, image_format: str, cards: int, burst: int):
+    renderer = CardRenderer()
+    renderer.start(workers, image_format)
+    renderer.max_pending = cards
+    avatar = f"{BASE_URL}/avatar.jpg"
+    # Spawn the workers and warm their layer caches
+    await asyncio.gather(*(renderer.render(track(-1 - i), avatar) for i in range(max(workers, 1) * 2)))
+
+    lags: list[float] = []
+    done = False
+
+    async def monitor():
+        while not done:
+            started = time.perf_counter()
+            await asyncio.sleep(0.005)
+            lags.append((time.perf_counter() - started - 0.005) * 1000)
+
+    monitor_task = asyncio.create_task(monitor())
+    started = time.perf_counter()
+    for first in range(0, cards, burst):
+        await asyncio.gather(
+            *(renderer.render(track(n), avatar) for n in range(first, first + burst))
+        )
+    elapsed = time.perf_counter() - started
+    done = True
+    await monitor_task
+    renderer.shutdown()
+
+    quantiles = statistics.quantiles(lags, n=100)
+    size = statistics.mean(len(card) for card in renderer.cache._data.values())
+    label = f"{workers} workers" if workers else "in the loop"
+    print(
+        f"  {label:12} {image_format:4}  {cards / elapsed:5.0f} cards/s  "
+        f"lag p50 {quantiles[49]:6.1f} ms  p99 {quantiles[98]:6.1f} ms  "
+        f"{size / 1024:5.1f} KiB/card"
+    )
+
+
+async def main(cards: int, burst: int, workers: list[int]):
+    image = jpeg(1)
+
+    async def serve_image(request):
+        return web.Response(body=image, content_type="image/jpeg")
+
+    app = web.Application()
+    app.router.add_get("/artwork/{name}", serve_image)
+    app.router.add_get("/avatar.jpg", serve_image)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", PORT).start()
+    with tempfile.TemporaryDirectory() as directory:
+        artwork_fetcher.directory = Path(directory)
+        print(f"{cards} cards in bursts of {burst}")
+        for count in workers:
+            await bench(count, "png", cards, burst)
+        await bench(max(workers), "webp", cards, burst)
+        await artwork_fetcher.close()
+    await runner.cleanup()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--cards", type=int, default=120)
+    parser.add_argument("--burst", type=int, default=8)
+    parser.add_argument("--workers", type=int, nargs="+", default=[0, 2, 4])
+    args = parser.parse_args()
+    asyncio.run(main(args.cards, args.burst, args.workers))
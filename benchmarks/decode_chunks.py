@@ -0,0 +1,72 @@
+"""Decode custom playlists of several sizes with one ``v4/decodetrack``
+request per track and with chunked ``v4/decodetracks`` requests.
+
+The tracks use a source the local decoder doesn't know, so every one of
+them is sent to the node, like before the in-process decoder existed. The
+per track path is skipped above ``--max-per-track`` tracks, it grows
+linearly.
+
+    python -m benchmarks.decode_chunks [--sizes 100 1000 10000] [--latency 0.02]
+"""
+
+import argparse
+import asyncio
+import time
+from bot import dbmanager
+from bot.decoder import decode_cache, decode_tracks
+from ._fixtures import FakeNode, encode_tracks, temp_workdir
+
+CHUNKED = ((100, 1), (100, 4), (50, 4))
+
+
+async def per_track(node: FakeNode, encoded: list[str]) -> list[dict]:
+    return [
+        await node.send(path="v4/decodetrack", params={"encodedTrack": e})
+        for e in encoded
+    ]
+
+
+async def clear_cache():
+    decode_cache.memory.clear()
+    async with dbmanager.acquire(dbmanager.DECODE_CACHE_DB) as conn:
+        await conn.execute("DELETE FROM decoded_tracks")
+
+
+async def main(sizes: list[int], latency: float, max_per_track: int):
+    await dbmanager.dbsetup()
+    print(f"{latency * 1000:.0f} ms per request, time in ms (requests)")
+    columns = ["per track"] + [f"{size}x{concurrency}" for size, concurrency in CHUNKED]
+    print(f"  {'tracks':>6}" + "".join(f"{c:>18}" for c in columns))
+    for tracks in sizes:
+        encoded = encode_tracks(tracks, source="unknown")
+        cells = []
+        if tracks <= max_per_track:
+            node = FakeNode(latency)
+            started = time.perf_counter()
+            await per_track(node, encoded)
+            elapsed = time.perf_counter() - started
+            cells.append(f"{elapsed * 1000:.0f} ({node.requests})")
+        else:
+            cells.append("-")
+        for chunk_size, concurrency in CHUNKED:
+            await clear_cache()
+            node = FakeNode(latency)
+            started = time.perf_counter()
+            result = await decode_tracks(
+                node, encoded, chunk_size=chunk_size, concurrency=concurrency
+            )
+            elapsed = time.perf_counter() - started
+            assert [t["encoded"] for t in result] == encoded
+            cells.append(f"{elapsed * 1000:.0f} ({node.requests})")
+        print(f"  {tracks:>6}" + "".join(f"{c:>18}" for c in cells))
+    await dbmanager.close_pools()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1_000, 10_000])
+    parser.add_argument("--latency", type=float, default=0.02)
+    parser.add_argument("--max-per-track", type=int, default=10_000)
+    args = parser.parse_args()
+    with temp_workdir():
+        asyncio.run(main(args.sizes, args.latency, args.max_per_track))
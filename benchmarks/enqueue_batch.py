@@ -0,0 +1,102 @@
+"""Queue a custom playlist like the old loop, one ``put_wait`` per track
+with its own copy of the playlist info, and like the playlist cog, in one
+``CustomPlayer.enqueue_many`` call with the playlist info shared.
+
+Both queue into a :class:`bot.queue.CompactQueue`. The queue update events
+are counted instead of dispatched, the memory kept by the queue and the
+peak are measured with tracemalloc.
+
+    python -m benchmarks.enqueue_batch [--tracks 10000]
+"""
+
+import argparse
+import asyncio
+import gc
+import time
+import tracemalloc
+import wavelink
+from bot.player import CustomPlayer, user_data_extras
+from bot.queue import CompactQueue
+from bot.trackcodec import decode_many
+from ._fixtures import encode_tracks
+
+
+class FakeClient:
+    def __init__(self):
+        self.events = 0
+
+    def dispatch(self, event: str, *args):
+        self.events += 1
+
+
+class FakePlayer:
+    enqueue_many = CustomPlayer.enqueue_many
+
+    def __init__(self):
+        self.queue = CompactQueue()
+        self.client = FakeClient()
+
+
+def playlist_tracks(count: int) -> list[tuple[int, wavelink.Playable]]:
+    encoded = encode_tracks(count // 2) + encode_tracks(count - count // 2, "youtube")
+    return [(tid, wavelink.Playable(raw)) for tid, raw in enumerate(decode_many(encoded), start=1)]
+
+
+async def per_track(player: FakePlayer, rows, pl_info: dict):
+    for tid, track in rows:
+        track.extras = wavelink.ExtrasNamespace(
+            requester_id=1, customPlaylist={**pl_info, "trackId": tid}
+        )
+        await player.queue.put_wait(track)
+        player.client.dispatch("player_queue_update", player, 1)
+
+
+async def batch(player: FakePlayer, rows, pl_info: dict):
+    tracks = []
+    for tid, track in rows:
+        track.extras = wavelink.ExtrasNamespace(
+            requester_id=1, trackId=tid, customPlaylist=pl_info
+        )
+        tracks.append(track)
+    await player.enqueue_many(tracks)
+
+
+async def main(tracks: int):
+    pl_info = {
+        "plId": 1,
+        "name": "Some playlist name",
+        "description": "A description of the playlist that is a bit longer",
+        "ownerId": 123456789012345678,
+        "totalTracks": tracks,
+        "artworkUrl": "https://example.com/thumbnails/playlist.png",
+    }
+    print(f"{tracks} tracks, half spotify and half youtube")
+    user_data = []
+    for name, enqueue in (("put_wait per track", per_track), ("enqueue_many", batch)):
+        rows = playlist_tracks(tracks)
+        player = FakePlayer()
+        gc.collect()
+        tracemalloc.start()
+        started = time.perf_counter()
+        await enqueue(player, rows, pl_info)
+        elapsed = time.perf_counter() - started
+        # Drop the playables, only the queue is kept
+        del rows
+        gc.collect()
+        kept, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        assert len(player.queue) == tracks
+        print(
+            f"  {name:20} {elapsed * 1000:7.1f} ms  queue {kept / 2**20:6.2f} MiB  "
+            f"peak {peak / 2**20:6.2f} MiB  {player.client.events:5} events"
+        )
+        user_data.append(dict(user_data_extras(player.queue[tracks - 1].extras)))
+    # Lavalink gets the same userData either way
+    assert user_data[0] == user_data[1]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tracks", type=int, default=10_000)
+    args = parser.parse_args()
+    asyncio.run(main(args.tracks))
@@ -0,0 +1,64 @@
+"""Memory of a queue of decoded tracks in ``wavelink.Queue`` and in
+:class:`bot.queue.CompactQueue`, and the cost of rehydrating an entry when
+it's played.
+
+The tracks are spotify tracks decoded by :mod:`bot.trackcodec`, all sharing
+one extras namespace like a queued playlist.
+
+    python -m benchmarks.queue_memory [--tracks 5000]
+"""
+
+import argparse
+import asyncio
+import gc
+import time
+import tracemalloc
+import wavelink
+from bot.queue import CompactQueue, QueueEntry
+from bot.trackcodec import decode_many
+from ._fixtures import encode_tracks
+
+
+def playables(encoded: list[str]) -> list[wavelink.Playable]:
+    extras = wavelink.ExtrasNamespace(requester_id=1)
+    tracks = []
+    for raw in decode_many(encoded):
+        track = wavelink.Playable(raw)
+        track.extras = extras
+        tracks.append(track)
+    return tracks
+
+
+async def main(count: int):
+    encoded = encode_tracks(count)
+    print(f"{count} spotify tracks")
+    for queue_class in (wavelink.Queue, CompactQueue):
+        gc.collect()
+        tracemalloc.start()
+        queue = queue_class()
+        await queue.put_wait(playables(encoded))
+        gc.collect()
+        current, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print(
+            f"  {queue_class.__name__:12} {current / 2**20:6.2f} MiB  "
+            f"{current / count:6.0f} B/track"
+        )
+        del queue
+
+    queue = CompactQueue()
+    await queue.put_wait(playables(encoded))
+    entries = list(queue)
+    assert all(isinstance(e, QueueEntry) for e in entries)
+    started = time.perf_counter()
+    for entry in entries:
+        entry.to_playable()
+    elapsed = time.perf_counter() - started
+    print(f"  rehydrate    {elapsed / count * 1e6:6.1f} us/track")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tracks", type=int, default=5_000)
+    args = parser.parse_args()
+    asyncio.run(main(args.tracks))
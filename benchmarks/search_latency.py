@@ -0,0 +1,71 @@
+"""Latency of album, playlist and artist searches when ``v4/loadsearch``
+returns the tracks inline and when every result has to be loaded again.
+
+The node is faked: every request waits ``--latency`` seconds, the round trip
+to a Lavalink node in another region.
+
+    python -m benchmarks.search_latency [--latency 0.08]
+"""
+
+import argparse
+import asyncio
+import time
+from bot.enums import SearchType
+from bot.search import SearchService
+from bot.trackcodec import decode_many
+from ._fixtures import FakeNode, encode_tracks
+
+TRACKS = 20
+
+
+class SearchNode(FakeNode):
+    """A node answering ``v4/loadsearch`` and ``v4/loadtracks``"""
+
+    def __init__(self, latency: float, inline: bool):
+        super().__init__(latency)
+        self.inline = inline
+        self.tracks = decode_many(encode_tracks(TRACKS))
+
+    async def send(self, method: str = "GET", *, path: str, data=None, params=None):
+        self.requests += 1
+        await asyncio.sleep(self.latency)
+        info = {"name": "Result", "selectedTrack": -1}
+        if path == "v4/loadsearch":
+            kind = params["types"][0]
+            plugin_info = {
+                "url": f"https://open.spotify.com/{kind}/1",
+                "type": kind,
+                "totalTracks": TRACKS,
+            }
+            tracks = self.tracks if self.inline else []
+            return {f"{kind}s": [{"info": info, "pluginInfo": plugin_info, "tracks": tracks}]}
+        if path == "v4/loadtracks":
+            return {
+                "loadType": "playlist",
+                "data": {"info": info, "pluginInfo": {}, "tracks": self.tracks},
+            }
+        raise ValueError(f"Unexpected path {path}")
+
+
+async def main(latency: float):
+    print(f"{latency * 1000:.0f} ms per request, {TRACKS} tracks per result")
+    for search_type in (SearchType.Album, SearchType.Playlist, SearchType.Artist):
+        for inline in (False, True):
+            node = SearchNode(latency, inline)
+            started = time.perf_counter()
+            result = await SearchService().search(
+                "query", search_type=search_type, node=node
+            )
+            elapsed = time.perf_counter() - started
+            assert len(result) == TRACKS
+            print(
+                f"  {search_type.name:18} {'inline' if inline else 'reload':6} "
+                f"{elapsed * 1000:6.0f} ms  {node.requests} requests"
+            )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--latency", type=float, default=0.08)
+    args = parser.parse_args()
+    asyncio.run(main(args.latency))
@@ -0,0 +1,60 @@
+"""Decode tracks with the in-process decoder and with ``v4/decodetracks``.
+
+The node is faked: every request waits ``--latency`` seconds plus
+``--per-track`` seconds per track, which stands for Lavalink's own decoding
+and the JSON of the answer.
+
+    python -m benchmarks.track_codec [--tracks 10000]
+"""
+
+import argparse
+import asyncio
+import time
+from bot.decoder import DECODE_CHUNK_SIZE, DECODE_CONCURRENCY, chunked
+from bot.trackcodec import decode_many
+from ._fixtures import FakeNode, encode_tracks
+
+
+async def remote(node: FakeNode, encoded: list[str]) -> list[dict]:
+    semaphore = asyncio.Semaphore(DECODE_CONCURRENCY)
+
+    async def decode_chunk(chunk):
+        async with semaphore:
+            return await node.send("POST", path="v4/decodetracks", data=chunk)
+
+    results = await asyncio.gather(
+        *(decode_chunk(c) for c in chunked(encoded, DECODE_CHUNK_SIZE))
+    )
+    return [t for chunk in results for t in chunk]
+
+
+async def main(tracks: int, latency: float, per_track: float):
+    encoded = encode_tracks(tracks // 2) + encode_tracks(tracks - tracks // 2, "youtube")
+    print(f"{tracks} tracks, half spotify and half youtube")
+
+    started = time.perf_counter()
+    decoded = decode_many(encoded)
+    elapsed = time.perf_counter() - started
+    assert all(d is not None for d in decoded)
+    print(
+        f"  trackcodec.decode_many  {elapsed * 1000:8.1f} ms  "
+        f"{elapsed / tracks * 1e6:5.1f} us/track  0 requests"
+    )
+
+    node = FakeNode(latency, per_track)
+    started = time.perf_counter()
+    await remote(node, encoded)
+    elapsed = time.perf_counter() - started
+    print(
+        f"  v4/decodetracks         {elapsed * 1000:8.1f} ms  "
+        f"{elapsed / tracks * 1e6:5.1f} us/track  {node.requests} requests"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tracks", type=int, default=10_000)
+    parser.add_argument("--latency", type=float, default=0.02)
+    parser.add_argument("--per-track", type=float, default=0.00005)
+    args = parser.parse_args()
+    asyncio.run(main(args.tracks, args.latency, args.per_track))
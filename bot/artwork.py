@@ -0,0 +1,190 @@
+"""Artwork fetcher.
+
+Images are downloaded with a shared session, within a deadline and a size
+limit, then downscaled to thumbnails stored on disk. The least recently
+used thumbnails are deleted when the cache is full.
+"""
+
+import asyncio
+import hashlib
+import io
+import logging
+import os
+from pathlib import Path
+from typing import Optional
+import aiohttp
+from easy_pil import Editor
+from PIL import Image
+
+logger = logging.getLogger("bot")
+
+ARTWORK_DIR = "artworkcache"
+THUMBNAIL_SIZE = (100, 100)
+FETCH_TIMEOUT = aiohttp.ClientTimeout(total=5, sock_connect=2)
+MAX_ARTWORK_BYTES = 5 * 1024 * 1024
+CHUNK_SIZE = 64 * 1024
+
+
+class ArtworkTooLargeError(Exception):
+    pass
+
+
+def make_thumbnail(data: bytes) -> bytes:
+    """Downscale an image to a PNG thumbnail"""
+    image = Image.open(io.BytesIO(data)).convert("RGBA")
+    output = io.BytesIO()
+    Editor(image).resize(THUMBNAIL_SIZE).image.save(output, "PNG")
+    return output.getvalue()
+
+
+class ArtworkFetcher:
+    """Fetch artwork thumbnails.
+
+    Thumbnails are stored in ``directory``, named after the hash of their URL.
+    At most ``max_files`` thumbnails are kept, the least recently used ones
+    are deleted first. Concurrent requests of the same URL share one download.
+    """
+
+    def __init__(self, directory: str = ARTWORK_DIR, max_files: int = 20_000):
+        self.directory = Path(directory)
+        self.max_files = max_files
+        self.hits: int = 0
+        self.misses: int = 0
+        self.coalesced: int = 0
+        self.failures: int = 0
+        self._files: Optional[int] = None
+        self._disk_lock = asyncio.Lock()
+        self._inflight: dict[str, asyncio.Task] = {}
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                timeout=FETCH_TIMEOUT,
+                connector=aiohttp.TCPConnector(limit=32, keepalive_timeout=30),
+            )
+        return self._session
+
+    async def close(self):
+        """|coro|
+
+        Cancel the pending downloads and close the session"""
+        for task in tuple(self._inflight.values()):
+            task.cancel()
+        if self._session is not None:
+            await self._session.close()
+
+    def _path(self, url: str) -> Path:
+        name = hashlib.blake2b(url.encode(), digest_size=16).hexdigest()
+        return self.directory / f"{name}.png"
+
+    def _read(self, path: Path) -> Optional[bytes]:
+        try:
+            data = path.read_bytes()
+            # The mtime is the last use of the thumbnail
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return data
+
+    async def get(self, url: str) -> Optional[bytes]:
+        """|coro|
+
+        The thumbnail of an image, ``None`` if it can't be fetched"""
+        data = await asyncio.to_thread(self._read, self._path(url))
+        if data is not None:
+            self.hits += 1
+            return data
+        task = self._inflight.get(url)
+        if task is None:
+            self.misses += 1
+            task = self._start(url)
+        else:
+            self.coalesced += 1
+        # A cancelled caller doesn't cancel the download of the others
+        return await asyncio.shield(task)
+
+    def prefetch(self, url: str):
+        """Download the thumbnail of an image in the background"""
+        if url not in self._inflight:
+            self._start(url, check_disk=True)
+
+    def _start(self, url: str, *, check_disk: bool = False) -> asyncio.Task:
+        task = asyncio.create_task(self._fetch(url, check_disk))
+        self._inflight[url] = task
+        task.add_done_callback(lambda _: self._inflight.pop(url, None))
+        return task
+
+    async def _fetch(self, url: str, check_disk: bool) -> Optional[bytes]:
+        path = self._path(url)
+        try:
+            if check_disk and await asyncio.to_thread(path.exists):
+                return None
+            data = await self._download(url)
+            thumbnail = await asyncio.to_thread(make_thumbnail, data)
+            await self._store(path, thumbnail)
+        except (aiohttp.ClientError, asyncio.TimeoutError, ArtworkTooLargeError, OSError) as e:
+            self.failures += 1
+            logger.warning("Can't fetch artwork %s: %r", url, e)
+            return None
+        return thumbnail
+
+    async def _download(self, url: str) -> bytes:
+        async with self.session.get(url) as response:
+            response.raise_for_status()
+            if (response.content_length or 0) > MAX_ARTWORK_BYTES:
+                raise ArtworkTooLargeError(response.content_length)
+            data = bytearray()
+            async for chunk in response.content.iter_chunked(CHUNK_SIZE):
+                data += chunk
+                if len(data) > MAX_ARTWORK_BYTES:
+                    raise ArtworkTooLargeError(len(data))
+            return bytes(data)
+
+    async def _store(self, path: Path, thumbnail: bytes):
+        # The disk is used from threads, the lock keeps the file count exact
+        # while the directory is scanned
+        async with self._disk_lock:
+            if self._files is None:
+                self._files = await asyncio.to_thread(self._count_files)
+            await asyncio.to_thread(self._write, path, thumbnail)
+            self._files += 1
+            if self._files > self.max_files:
+                self._files = await asyncio.to_thread(self._evict)
+
+    def _count_files(self) -> int:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        return sum(1 for _ in self.directory.glob("*.png"))
+
+    @staticmethod
+    def _write(path: Path, thumbnail: bytes):
+        tmp = path.with_suffix(".tmp")
+        tmp.write_bytes(thumbnail)
+        os.replace(tmp, path)
+
+    def _evict(self) -> int:
+        """Delete the least recently used thumbnails, returns how many are left"""
+        # Delete 10% more than needed so the directory isn't scanned on every store
+        files = []
+        for path in self.directory.glob("*.png"):
+            try:
+                files.append((path.stat().st_mtime, path))
+            except FileNotFoundError:
+                pass
+        files = [path for _, path in sorted(files)]
+        excess = len(files) - int(self.max_files * 0.9)
+        for path in files[:max(excess, 0)]:
+            path.unlink(missing_ok=True)
+        return len(files) - max(excess, 0)
+
+
+artwork_fetcher = ArtworkFetcher()
+
+
+__all__ = [
+    "ArtworkFetcher",
+    "ArtworkTooLargeError",
+    "artwork_fetcher",
+    "make_thumbnail",
+]
@@ -0,0 +1,188 @@
+"""``/play`` query suggestions.
+
+Suggestions come from a sorted prefix index of recently played tracks and
+of the tracks stored in custom playlists. Lavalink is only searched when
+the index doesn't have enough suggestions and the user stopped typing.
+"""
+
+import asyncio
+import bisect
+import logging
+import time
+from collections import OrderedDict
+from typing import Iterable, Optional
+import wavelink
+from discord import app_commands
+from . import dbmanager
+from .search import URL_REGEX, normalize_query, search_service
+
+logger = logging.getLogger("bot")
+
+MAX_CHOICES = 25
+# Discord limits choice names and values to 100 characters
+CHOICE_LENGTH = 100
+# Shorter prefixes are answered from the index only
+MIN_SEARCH_LENGTH = 3
+DEBOUNCE = 0.4
+# Discord drops autocomplete answers sent after 3 seconds
+DEADLINE = 2.5
+
+
+def track_choice(
+    title: str, author: Optional[str], uri: Optional[str]
+) -> app_commands.Choice[str]:
+    """The choice of a track, its value is the track link when it fits"""
+    name = (f"{author} - {title}" if author else title)[:CHOICE_LENGTH]
+    value = uri if uri and len(uri) <= CHOICE_LENGTH else name
+    return app_commands.Choice(name=name, value=value)
+
+
+class PrefixIndex:
+    """A sorted array of ``(key, value)`` pairs searched with bisect.
+
+    Every entry is indexed by its title and by ``"author title"``. At most
+    ``max_entries`` entries are kept, the least recently added are dropped.
+    """
+
+    def __init__(self, max_entries: int = 50_000):
+        self.max_entries = max_entries
+        self._keys: list[tuple[str, str]] = []
+        # value -> (choice name, index keys), in insertion order
+        self._entries: OrderedDict[str, tuple[str, tuple[str, ...]]] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def add(self, title: str, author: Optional[str], uri: Optional[str]):
+        """Add a track, or mark it as recently added"""
+        for key in self._new_keys(title, author, uri):
+            bisect.insort(self._keys, key)
+        self._evict()
+
+    def extend(self, tracks: Iterable[tuple[str, Optional[str], Optional[str]]]):
+        """Add many ``(title, author, uri)`` tracks, the index is sorted once"""
+        for track in tracks:
+            self._keys.extend(self._new_keys(*track))
+        self._keys.sort()
+        self._evict()
+
+    def _new_keys(
+        self, title: str, author: Optional[str], uri: Optional[str]
+    ) -> tuple[tuple[str, str], ...]:
+        choice = track_choice(title, author, uri)
+        value = choice.value
+        if value in self._entries:
+            self._entries.move_to_end(value)
+            return ()
+        keys = tuple(
+            {normalize_query(title), normalize_query(f"{author or ''} {title}")}
+        )
+        self._entries[value] = (choice.name, keys)
+        return tuple((key, value) for key in keys)
+
+    def _evict(self):
+        while len(self._entries) > self.max_entries:
+            self._remove(*self._entries.popitem(last=False))
+
+    def _remove(self, value: str, entry: tuple[str, tuple[str, ...]]):
+        for key in entry[1]:
+            i = bisect.bisect_left(self._keys, (key, value))
+            if i < len(self._keys) and self._keys[i] == (key, value):
+                del self._keys[i]
+
+    def lookup(self, prefix: str, limit: int = MAX_CHOICES) -> list[app_commands.Choice[str]]:
+        """Suggestions whose title or ``"author title"`` starts with ``prefix``"""
+        prefix = normalize_query(prefix)
+        choices: dict[str, app_commands.Choice[str]] = {}
+        i = bisect.bisect_left(self._keys, (prefix, ""))
+        while i < len(self._keys) and len(choices) < limit:
+            key, value = self._keys[i]
+            if not key.startswith(prefix):
+                break
+            if value not in choices:
+                choices[value] = app_commands.Choice(name=self._entries[value][0], value=value)
+            i += 1
+        return list(choices.values())
+
+
+class QuerySuggester:
+    """Suggest ``/play`` queries"""
+
+    def __init__(self, min_local: int = 5):
+        self.index = PrefixIndex()
+        self.min_local = min_local
+        self.local_answers: int = 0
+        self.searches: int = 0
+        self.timeouts: int = 0
+        self._latest: dict[int, float] = {}
+
+    async def load(self, limit: int = 20_000):
+        """|coro|
+
+        Index the most recently stored playlist tracks"""
+        async with dbmanager.acquire() as conn:
+            rows = await conn.fetchall(
+                """SELECT title, author, uri FROM tracks WHERE title IS NOT NULL
+                   GROUP BY title, author ORDER BY MAX(id) DESC LIMIT ?""",
+                (limit,),
+            )
+        # The most recently stored tracks are added last
+        self.index.extend(reversed(rows))
+
+    def add_track(self, track: wavelink.Playable):
+        self.index.add(track.title, track.author, track.uri)
+
+    async def suggest(
+        self, user_id: int, current: str, source: Optional[str] = None
+    ) -> list[app_commands.Choice[str]]:
+        """|coro|
+
+        Suggestions for what a user is typing"""
+        started = time.monotonic()
+        if URL_REGEX.match(current.strip()):
+            return []
+        choices = self.index.lookup(current)
+        if len(choices) >= self.min_local or len(current.strip()) < MIN_SEARCH_LENGTH:
+            self.local_answers += 1
+            return choices
+
+        # Only the last keystroke of a user is searched
+        self._latest[user_id] = started
+        await asyncio.sleep(DEBOUNCE)
+        if self._latest.get(user_id) != started:
+            return choices
+        del self._latest[user_id]
+
+        self.searches += 1
+        timeout = DEADLINE - (time.monotonic() - started)
+        try:
+            result = await asyncio.wait_for(
+                search_service.search(current, source=source), timeout
+            )
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            return choices
+        except wavelink.WavelinkException as e:
+            logger.warning("Autocomplete search failed for %r: %s", current, e)
+            return choices
+
+        values = {c.value for c in choices}
+        for track in result:
+            if len(choices) >= MAX_CHOICES:
+                break
+            choice = track_choice(track.title, track.author, track.uri)
+            if choice.value not in values:
+                values.add(choice.value)
+                choices.append(choice)
+        return choices
+
+
+query_suggester = QuerySuggester()
+
+
+__all__ = [
+    "track_choice",
+    "PrefixIndex",
+    "QuerySuggester",
+    "query_suggester",
+]
@@ -0,0 +1,137 @@
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Optional
+
+
+class LRUCache:
+    """A bounded least-recently-used cache.
+
+    The cache holds at most ``maxsize`` items. If ``max_bytes`` is set, the
+    size of every value (``sizeof(value)``, ``len`` by default) is accounted
+    and the least recently used items are evicted to stay under the limit.
+    """
+
+    def __init__(
+        self,
+        maxsize: int,
+        *,
+        max_bytes: Optional[int] = None,
+        sizeof: Callable[[Any], int] = len,
+    ):
+        self.maxsize = maxsize
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self._data: OrderedDict[Hashable, Any] = OrderedDict()
+        self._sizes: dict[Hashable, int] = {}
+        self.nbytes: int = 0
+        self.hits: int = 0
+        self.misses: int = 0
+        self.evictions: int = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._data
+
+    @property
+    def hit_ratio(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def get(self, key: Hashable, default=None):
+        """Get a value and mark it as recently used"""
+        try:
+            value = self._data[key]
+        except KeyError:
+            self.misses += 1
+            return default
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: Hashable, value: Any):
+        """Add or replace a value, evicting old items if needed"""
+        if key in self._data:
+            self.pop(key)
+        self._data[key] = value
+        if self.max_bytes is not None:
+            size = self.sizeof(value)
+            self._sizes[key] = size
+            self.nbytes += size
+        self._evict()
+
+    def pop(self, key: Hashable, default=None):
+        """Remove a value without counting a hit or miss"""
+        if key not in self._data:
+            return default
+        self.nbytes -= self._sizes.pop(key, 0)
+        return self._data.pop(key)
+
+    def clear(self):
+        self._data.clear()
+        self._sizes.clear()
+        self.nbytes = 0
+
+    def _evict(self):
+        while len(self._data) > self.maxsize or (
+            self.max_bytes is not None
+            and self.nbytes > self.max_bytes
+            and len(self._data) > 1
+        ):
+            key, _ = self._data.popitem(last=False)
+            self.nbytes -= self._sizes.pop(key, 0)
+            self.evictions += 1
+
+
+class TTLCache(LRUCache):
+    """A :class:`LRUCache` whose items expire ``ttl`` seconds after being set.
+
+    Expired items are dropped when they're looked up or evicted.
+    """
+
+    def __init__(
+        self,
+        maxsize: int,
+        ttl: float,
+        *,
+        max_bytes: Optional[int] = None,
+        sizeof: Callable[[Any], int] = len,
+        timer: Callable[[], float] = time.monotonic,
+    ):
+        super().__init__(
+            maxsize, max_bytes=max_bytes, sizeof=lambda item: sizeof(item[1])
+        )
+        self.ttl = ttl
+        self.timer = timer
+
+    def __contains__(self, key: Hashable) -> bool:
+        item = self._data.get(key)
+        return item is not None and item[0] > self.timer()
+
+    def get(self, key: Hashable, default=None):
+        """Get a value that hasn't expired and mark it as recently used"""
+        item = self._data.get(key)
+        if item is not None and item[0] <= self.timer():
+            super().pop(key)
+            item = None
+        if item is None:
+            self.misses += 1
+            return default
+        self._data.move_to_end(key)
+        self.hits += 1
+        return item[1]
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        """Add or replace a value, it expires after ``ttl`` seconds (the cache ``ttl`` by default)"""
+        super().set(key, (self.timer() + (self.ttl if ttl is None else ttl), value))
+
+    def pop(self, key: Hashable, default=None):
+        item = super().pop(key)
+        return default if item is None else item[1]
+
+
+__all__ = [
+    "LRUCache",
+    "TTLCache",
+]
@@ -0,0 +1,218 @@
+"""Now playing cards.
+
+:func:`render_card` is a pure function of the track metadata and images, it
+runs in a process pool so Pillow doesn't block the event loop. The static
+layers of a card (background, source logo, color bar, bot avatar and texts)
+are drawn once per source in every worker, and finished cards are cached
+as image bytes by :class:`CardRenderer`.
+"""
+
+import asyncio
+import functools
+import io
+import logging
+import multiprocessing
+from concurrent.futures import Executor, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Literal, Optional
+from PIL import Image
+from easy_pil import Editor, Font
+from wavelink import Playable
+from .artwork import artwork_fetcher
+from .cache import LRUCache
+from .misc import get_color_from_source, get_logo_path_from_source, truncate_string
+
+logger = logging.getLogger("bot")
+
+BG_PATH = "./bot/img/track_start_bg.png"
+BG_SIZE = (350, 180)
+LOGO_SIZE = (30, 30)
+TRACK_IMG_SIZE = (100, 100)
+BOT_LOGO_SIZE = (25, 25)
+
+FONT_BOLD = Font.poppins(variant="bold", size=15)
+FONT_LIGHT = Font.poppins(size=16, variant="light")
+FONT_ITALIC = Font.poppins(size=14, variant="italic")
+
+ImageFormat = Literal["png", "webp"]
+WEBP_QUALITY = 85
+
+
+@functools.cache
+def _background() -> Image.Image:
+    return Editor(BG_PATH).resize(BG_SIZE).image
+
+
+@functools.cache
+def _logo(path: str) -> Image.Image:
+    return Editor(path).circle_image().resize(LOGO_SIZE).image
+
+
+@functools.lru_cache(maxsize=32)
+def _base_layer(source: str, avatar: Optional[bytes]) -> Image.Image:
+    bg = Editor(_background().copy())
+    bg.paste(_logo(get_logo_path_from_source(source)), (10, 10))
+    bg.text((50, 17), "Now playing...", font=FONT_BOLD, color="white")
+    bg.rectangle((7, 47), width=105, height=106, color="lightgray", stroke_width=1)
+    color_rgb = get_color_from_source(source).to_rgb()
+    bg.rectangle((0, 0), width=3, height=180, color=color_rgb, stroke_width=1)
+    if avatar:
+        bot_logo = Editor(Image.open(io.BytesIO(avatar)).convert("RGBA"))
+        bg.paste(bot_logo.circle_image().resize(BOT_LOGO_SIZE), (195, 145))
+    bg.text((225, 150), "RumbleBot", font=FONT_LIGHT, color="white")
+    return bg.image
+
+
+def render_card(
+    source: str,
+    title: str,
+    author: str,
+    artwork: Optional[bytes],
+    avatar: Optional[bytes],
+    image_format: ImageFormat = "png",
+) -> bytes:
+    """Render a now playing card, ``artwork`` is a thumbnail from :mod:`bot.artwork`"""
+    bg = Editor(_base_layer(source, avatar).copy())
+    if artwork:
+        track_img = Image.open(io.BytesIO(artwork)).convert("RGBA")
+        bg.paste(Editor(track_img).resize(TRACK_IMG_SIZE), (10, 50))
+    bg.text((120, 70), truncate_string(title), font=FONT_LIGHT, color="white")
+    bg.text((120, 100), truncate_string(author), font=FONT_ITALIC, color="white")
+    output = io.BytesIO()
+    if image_format == "webp":
+        bg.image.save(output, "WEBP", quality=WEBP_QUALITY)
+    else:
+        bg.image.save(output, "PNG")
+    return output.getvalue()
+
+
+class CardRenderer:
+    """Render now playing cards.
+
+    Cards are rendered by ``workers`` processes (in the event loop if it's
+    ``0``), at most ``max_pending`` renders can wait for a worker. The pool
+    is started again when a worker dies.
+    Cards are cached by ``(track identifier, source)`` in an LRU holding at
+    most ``max_cards`` cards and ``max_bytes`` bytes.
+    """
+
+    def __init__(self, max_cards: int = 512, max_bytes: int = 32 * 1024 * 1024):
+        self.cache = LRUCache(max_cards, max_bytes=max_bytes)
+        self.image_format: ImageFormat = "png"
+        self.max_pending: int = 4
+        self.renders: int = 0
+        self.overloads: int = 0
+        self.failures: int = 0
+        self.pending: int = 0
+        self.workers: int = 0
+        self._executor: Optional[Executor] = None
+        self._avatar: Optional[bytes] = None
+        self._avatar_url: Optional[str] = None
+
+    @property
+    def filename(self) -> str:
+        return f"img.{self.image_format}"
+
+    def start(self, workers: int = 2, image_format: ImageFormat = "png"):
+        """Start the worker processes"""
+        self.shutdown()
+        if image_format != self.image_format:
+            self.cache.clear()
+        self.image_format = image_format
+        self.workers = workers
+        self.max_pending = max(workers, 1) * 4
+        if workers > 0:
+            self._executor = ProcessPoolExecutor(
+                workers, mp_context=multiprocessing.get_context("spawn")
+            )
+
+    def _restart(self, broken: Executor):
+        # Concurrent renders of a broken pool only restart it once
+        if self._executor is not broken:
+            return
+        logger.warning("A card worker died, starting the pool again")
+        broken.shutdown(wait=False, cancel_futures=True)
+        self._executor = ProcessPoolExecutor(
+            self.workers, mp_context=multiprocessing.get_context("spawn")
+        )
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    async def close(self):
+        """|coro|
+
+        Stop the workers and the artwork downloads"""
+        self.shutdown()
+        await artwork_fetcher.close()
+
+    async def set_avatar(self, url: str):
+        """|coro|
+
+        Download the bot avatar, cached cards are dropped when it changes"""
+        if url == self._avatar_url:
+            return
+        avatar = await artwork_fetcher.get(url)
+        if avatar is None:
+            return
+        self._avatar = avatar
+        self._avatar_url = url
+        self.cache.clear()
+
+    async def render(self, track: Playable, avatar_url: str) -> Optional[bytes]:
+        """|coro|
+
+        The card of a track, ``None`` if the workers are overloaded or it
+        can't be rendered"""
+        key = (track.identifier, track.source)
+        card = self.cache.get(key)
+        if card is not None:
+            return card
+        if self.pending >= self.max_pending:
+            self.overloads += 1
+            return None
+
+        self.pending += 1
+        executor = self._executor
+        try:
+            await self.set_avatar(avatar_url)
+            artwork = await artwork_fetcher.get(track.artwork) if track.artwork else None
+            args = (
+                track.source,
+                track.title,
+                track.author,
+                artwork,
+                self._avatar,
+                self.image_format,
+            )
+            if executor is None:
+                card = render_card(*args)
+            else:
+                loop = asyncio.get_running_loop()
+                card = await loop.run_in_executor(executor, render_card, *args)
+        except Exception as e:
+            # The menu is sent with a text embed instead
+            self.failures += 1
+            logger.warning(
+                "Can't render the card of %s (%s): %r", track.identifier, track.source, e
+            )
+            if isinstance(e, BrokenProcessPool):
+                self._restart(executor)
+            return None
+        finally:
+            self.pending -= 1
+        self.renders += 1
+        self.cache.set(key, card)
+        return card
+
+
+card_renderer = CardRenderer()
+
+
+__all__ = [
+    "render_card",
+    "CardRenderer",
+    "card_renderer",
+]
@@ -1,7 +1,439 @@
+import asyncio
+import base64
+import binascii
+import contextlib
+import hashlib
+import logging
+import sqlite3
+import zlib
+from typing import AsyncIterator, Awaitable, Callable, Iterable, Sequence
 import asqlite
+from .trackcodec import decode_many, track_hash
+
+logger = logging.getLogger("bot")
+
+PLAYLISTS_DB = "userplaylists.db"
+COOLDOWNS_DB = "dynamiccooldowns.db"
+DECODE_CACHE_DB = "decodecache.db"
+
+POOL_SIZE = 4
+CACHED_STATEMENTS = 256
+MMAP_SIZE = 64 * 1024 * 1024
+SQL_VARS_LIMIT = 500
+
+# Kinds of track blobs
+BLOB_RAW = 0
+BLOB_ZLIB = 1
+# Not canonical base64, the text is stored as is
+BLOB_TEXT = 2
+COMPRESS_TRACK_BLOBS = True
+
+_pools: dict[str, asqlite.Pool] = {}
+_pools_lock = asyncio.Lock()
+
+
+def _init_connection(conn: sqlite3.Connection):
+    # asqlite already enables WAL mode and foreign keys
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(f"PRAGMA mmap_size={MMAP_SIZE}")
+
+
+async def get_pool(database: str) -> asqlite.Pool:
+    """|coro|
+
+    Get the connection pool of a database file, it's created on first use"""
+    pool = _pools.get(database)
+    if pool is not None:
+        return pool
+    async with _pools_lock:
+        if database not in _pools:
+            _pools[database] = await asqlite.create_pool(
+                database,
+                size=POOL_SIZE,
+                init=_init_connection,
+                cached_statements=CACHED_STATEMENTS,
+            )
+        return _pools[database]
+
+
+@contextlib.asynccontextmanager
+async def acquire(database: str = PLAYLISTS_DB) -> AsyncIterator[asqlite.ProxiedConnection]:
+    """Acquire a long-lived connection from the database pool
+
+    .. code-block:: python3
+
+        async with dbmanager.acquire(dbmanager.COOLDOWNS_DB) as conn:
+            ...
+    """
+    pool = await get_pool(database)
+    async with pool.acquire() as conn:
+        yield conn
+
+
+@contextlib.asynccontextmanager
+async def write_transaction(conn: asqlite.Connection) -> AsyncIterator[asqlite.Cursor]:
+    """A transaction holding the write lock from its start, committed on exit
+
+    In WAL mode, a transaction that reads before it writes can't take the
+    write lock once another connection has written. SQLite then fails it
+    with ``database is locked`` without waiting for the busy timeout.
+    ``BEGIN IMMEDIATE`` waits for the lock first, so the writers queue up.
+
+    .. code-block:: python3
+
+        async with dbmanager.acquire() as conn, dbmanager.write_transaction(conn) as cur:
+            ...
+    """
+    async with conn.cursor() as cur:
+        await cur.execute("BEGIN IMMEDIATE")
+        try:
+            yield cur
+        except BaseException:
+            await conn.rollback()
+            raise
+        await conn.commit()
+
+
+async def close_pools():
+    """|coro|
+
+    Close every connection pool"""
+    async with _pools_lock:
+        pools = tuple(_pools.values())
+        _pools.clear()
+    await asyncio.gather(*(p.close() for p in pools))
+
+
+def pack_track(encoded: str) -> tuple[bytes, int, bytes]:
+    """``(hash, kind, data)`` of the blob storing a base64 track"""
+    try:
+        raw = base64.b64decode(encoded, validate=True)
+    except (binascii.Error, ValueError):
+        raw = None
+    if raw is None or base64.b64encode(raw).decode() != encoded:
+        data = encoded.encode()
+        return hashlib.blake2b(data, digest_size=16, person=b"text").digest(), BLOB_TEXT, data
+    key = track_hash(encoded)
+    if COMPRESS_TRACK_BLOBS:
+        compressed = zlib.compress(raw, 9)
+        if len(compressed) < len(raw):
+            return key, BLOB_ZLIB, compressed
+    return key, BLOB_RAW, raw
+
+
+def unpack_track(kind: int, data: bytes) -> str:
+    """Base64 track stored in a blob"""
+    if kind == BLOB_TEXT:
+        return data.decode()
+    if kind == BLOB_ZLIB:
+        data = zlib.decompress(data)
+    return base64.b64encode(data).decode()
+
+
+async def store_track_blobs(
+    conn: asqlite.Connection, encoded: Sequence[str]
+) -> list[int]:
+    """|coro|
+
+    Store base64 tracks in ``track_blobs``, the same track is only stored once.
+
+    Returns the blob id of every track"""
+    packed = [pack_track(e) for e in encoded]
+    await conn.executemany(
+        "INSERT OR IGNORE INTO track_blobs (hash, kind, data) VALUES (?, ?, ?)",
+        packed,
+    )
+    keys = list(dict.fromkeys(p[0] for p in packed))
+    ids: dict[bytes, int] = {}
+    for i in range(0, len(keys), SQL_VARS_LIMIT):
+        chunk = keys[i : i + SQL_VARS_LIMIT]
+        rows = await conn.fetchall(
+            f"SELECT hash, id FROM track_blobs WHERE hash IN ({', '.join('?' * len(chunk))})",
+            tuple(chunk),
+        )
+        ids.update((r[0], r[1]) for r in rows)
+    return [ids[p[0]] for p in packed]
+
+
+async def delete_orphan_blobs(blob_ids: Iterable[int], batch_size: int = 500) -> int:
+    """|coro|
+
+    Delete the blobs of ``blob_ids`` which aren't used by any track anymore,
+    ``batch_size`` blobs per transaction.
+
+    Returns the number of deleted blobs"""
+    blob_ids = list(set(blob_ids))
+    deleted = 0
+    for i in range(0, len(blob_ids), batch_size):
+        chunk = blob_ids[i : i + batch_size]
+        async with acquire(PLAYLISTS_DB) as conn, write_transaction(conn) as cur:
+            await cur.execute(
+                f"""DELETE FROM track_blobs WHERE id IN ({', '.join('?' * len(chunk))})
+                    AND NOT EXISTS (SELECT 1 FROM tracks WHERE blob_id = track_blobs.id)""",
+                tuple(chunk),
+            )
+            deleted += cur.get_cursor().rowcount
+        await asyncio.sleep(0)
+    return deleted
+
+
+async def _migrate_track_blobs(conn: asqlite.Connection, batch_size: int = 1000):
+    # Move the encoded tracks to track_blobs, tracks now reference them by id
+    await conn.execute(
+        """CREATE TABLE track_blobs (
+               id INTEGER PRIMARY KEY NOT NULL,
+               hash BLOB NOT NULL UNIQUE,
+               kind INTEGER NOT NULL,
+               data BLOB NOT NULL
+           )"""
+    )
+    await conn.execute(
+        """CREATE TABLE tracks_new (
+               id INTEGER PRIMARY KEY AUTOINCREMENT NOT NULL,
+               plid INTEGER NOT NULL REFERENCES playlists (id) ON DELETE CASCADE,
+               userid INTEGER NOT NULL,
+               blob_id INTEGER NOT NULL REFERENCES track_blobs (id),
+               position INTEGER NOT NULL DEFAULT 0,
+               title TEXT,
+               author TEXT,
+               length_ms INTEGER,
+               source TEXT,
+               uri TEXT
+           )"""
+    )
+    last_id = 0
+    while True:
+        rows = await conn.fetchall(
+            """SELECT id, plid, userid, encoded, position, title, author, length_ms, source, uri
+               FROM tracks WHERE id > ? ORDER BY id LIMIT ?""",
+            (last_id, batch_size),
+        )
+        if not rows:
+            break
+        blob_ids = await store_track_blobs(conn, [r[3] for r in rows])
+        await conn.executemany(
+            """INSERT INTO tracks_new (id, plid, userid, blob_id, position, title, author, length_ms, source, uri)
+               VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+            [(r[0], r[1], r[2], b, *tuple(r)[4:]) for r, b in zip(rows, blob_ids)],
+        )
+        last_id = rows[-1][0]
+    await conn.execute("DROP TABLE tracks")
+    await conn.execute("ALTER TABLE tracks_new RENAME TO tracks")
+    await conn.execute(
+        "CREATE INDEX idx_tracks_plid_position ON tracks (plid, position)"
+    )
+    await conn.execute("CREATE INDEX idx_tracks_blob_id ON tracks (blob_id)")
+
+
+Migration = str | Callable[[asqlite.Connection], Awaitable[None]]
+
+# Schema migrations of every database: (version, script or coroutine function).
+# The current version of a database is stored in its ``user_version`` pragma.
+MIGRATIONS: dict[str, list[tuple[int, Migration]]] = {
+    PLAYLISTS_DB: [
+        (
+            1,
+            """CREATE INDEX IF NOT EXISTS idx_playlists_userid_id ON playlists (userid, id);
+               CREATE INDEX IF NOT EXISTS idx_tracks_plid ON tracks (plid);""",
+        ),
+        (
+            2,
+            """ALTER TABLE tracks ADD COLUMN position INTEGER NOT NULL DEFAULT 0;
+               UPDATE tracks SET position = id;
+               DROP INDEX idx_tracks_plid;
+               CREATE INDEX idx_tracks_plid_position ON tracks (plid, position);""",
+        ),
+        (
+            3,
+            """CREATE TABLE tracks_new (
+                   id INTEGER PRIMARY KEY AUTOINCREMENT NOT NULL,
+                   plid INTEGER NOT NULL REFERENCES playlists (id) ON DELETE CASCADE,
+                   userid INTEGER NOT NULL,
+                   encoded VARCHAR(255) NOT NULL,
+                   position INTEGER NOT NULL DEFAULT 0
+               );
+               INSERT INTO tracks_new (id, plid, userid, encoded, position)
+                   SELECT id, plid, userid, encoded, position FROM tracks
+                   WHERE plid IN (SELECT id FROM playlists);
+               DROP TABLE tracks;
+               ALTER TABLE tracks_new RENAME TO tracks;
+               CREATE INDEX idx_tracks_plid_position ON tracks (plid, position);""",
+        ),
+        (
+            4,
+            """ALTER TABLE tracks ADD COLUMN title TEXT;
+               ALTER TABLE tracks ADD COLUMN author TEXT;
+               ALTER TABLE tracks ADD COLUMN length_ms INTEGER;
+               ALTER TABLE tracks ADD COLUMN source TEXT;
+               ALTER TABLE tracks ADD COLUMN uri TEXT;""",
+        ),
+        (5, _migrate_track_blobs),
+        (
+            6,
+            """ALTER TABLE tracks ADD COLUMN metadata_failed INTEGER NOT NULL DEFAULT 0;
+               CREATE INDEX idx_tracks_missing_metadata ON tracks (id)
+                   WHERE title IS NULL AND metadata_failed = 0;""",
+        ),
+    ],
+    COOLDOWNS_DB: [
+        (
+            1,
+            """CREATE TABLE cooldowns_new (
+                   userid INTEGER PRIMARY KEY NOT NULL,
+                   expires_at REAL NOT NULL
+               ) WITHOUT ROWID;
+               INSERT INTO cooldowns_new (userid, expires_at)
+                   SELECT CAST(userid AS INTEGER), MAX(expires_at) FROM cooldowns
+                   GROUP BY CAST(userid AS INTEGER);
+               DROP TABLE cooldowns;
+               ALTER TABLE cooldowns_new RENAME TO cooldowns;
+               CREATE INDEX idx_cooldowns_expires_at ON cooldowns (expires_at);""",
+        ),
+    ],
+    DECODE_CACHE_DB: [
+        (
+            1,
+            """ALTER TABLE decoded_tracks ADD COLUMN last_used INTEGER NOT NULL DEFAULT 0;
+               CREATE INDEX idx_decoded_tracks_last_used ON decoded_tracks (last_used);""",
+        ),
+    ],
+}
+
+
+async def migrate(database: str):
+    """|coro|
+
+    Apply the pending migrations of a database, each one in its own transaction"""
+    async with acquire(database) as conn:
+        version = (await conn.fetchone("PRAGMA user_version"))[0]
+        for target, migration in MIGRATIONS.get(database, ()):
+            if target <= version:
+                continue
+            try:
+                if isinstance(migration, str):
+                    await conn.executescript(
+                        f"BEGIN;\n{migration}\nPRAGMA user_version = {target};\nCOMMIT;"
+                    )
+                else:
+                    async with conn.transaction():
+                        await migration(conn)
+                        await conn.execute(f"PRAGMA user_version = {target}")
+            except sqlite3.Error:
+                if conn.get_connection().in_transaction:
+                    await conn.rollback()
+                raise
+            version = target
+
+
+async def database_size(conn: asqlite.Connection) -> tuple[int, int]:
+    """|coro|
+
+    ``(size in bytes, free pages)`` of a database"""
+    pages = (await conn.fetchone("PRAGMA page_count"))[0]
+    page_size = (await conn.fetchone("PRAGMA page_size"))[0]
+    free = (await conn.fetchone("PRAGMA freelist_count"))[0]
+    return pages * page_size, free
+
+
+async def enable_incremental_vacuum(database: str):
+    """|coro|
+
+    Switch a database to ``auto_vacuum=INCREMENTAL``.
+
+    Existing databases are rebuilt with ``VACUUM``, it can't run in a transaction"""
+    async with acquire(database) as conn:
+        if (await conn.fetchone("PRAGMA auto_vacuum"))[0] == 2:
+            return
+        size, free = await database_size(conn)
+        await conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        await conn.execute("VACUUM")
+        new_size, new_free = await database_size(conn)
+    logger.info(
+        "Rebuilt %s with incremental vacuum: %d -> %d bytes, %d -> %d free pages",
+        database, size, new_size, free, new_free,
+    )
+
+
+async def incremental_vacuum(database: str) -> int:
+    """|coro|
+
+    Give the free pages of a database back to the filesystem.
+
+    Returns the number of reclaimed pages"""
+    async with acquire(database) as conn:
+        size, before = await database_size(conn)
+        # Every step of the pragma frees a page
+        await conn.fetchall("PRAGMA incremental_vacuum")
+        new_size, after = await database_size(conn)
+    if before != after:
+        logger.info(
+            "Vacuumed %s: %d -> %d bytes, %d -> %d free pages",
+            database, size, new_size, before, after,
+        )
+    return before - after
+
+
+def track_metadata(encoded: str) -> tuple:
+    """``(title, author, length_ms, source, uri)`` of a base64 track"""
+    return _metadata_from_decoded(decode_many((encoded,))[0])
+
+
+def _metadata_from_decoded(data: dict | None) -> tuple:
+    if data is None:
+        return (None, None, None, None, None)
+    info = data["info"]
+    return (
+        info["title"],
+        info["author"],
+        info["length"],
+        info["sourceName"],
+        info["uri"],
+    )
+
+
+async def backfill_track_metadata(batch_size: int = 500) -> int:
+    """|coro|
+
+    Fill the metadata columns of the tracks inserted before they existed.
+    Tracks that can't be decoded are marked with ``metadata_failed`` so
+    they're only tried once.
+
+    Returns the number of updated tracks"""
+    updated = 0
+    last_id = 0
+    while True:
+        async with acquire(PLAYLISTS_DB) as conn:
+            rows = await conn.fetchall(
+                """SELECT t.id, b.kind, b.data FROM tracks t JOIN track_blobs b ON b.id = t.blob_id
+                   WHERE t.id > ? AND t.title IS NULL AND t.metadata_failed = 0
+                   ORDER BY t.id LIMIT ?""",
+                (last_id, batch_size),
+            )
+            if not rows:
+                return updated
+            last_id = rows[-1][0]
+            decoded = decode_many(unpack_track(r[1], r[2]) for r in rows)
+            params = [
+                (*_metadata_from_decoded(d), r[0])
+                for r, d in zip(rows, decoded)
+                if d is not None
+            ]
+            failed = [(r[0],) for r, d in zip(rows, decoded) if d is None]
+            async with write_transaction(conn):
+                await conn.executemany(
+                    "UPDATE tracks SET title=?, author=?, length_ms=?, source=?, uri=? WHERE id=?",
+                    params,
+                )
+                await conn.executemany(
+                    "UPDATE tracks SET metadata_failed=1 WHERE id=?", failed
+                )
+            updated += len(params)
+        # Let other queries use the database between batches
+        await asyncio.sleep(0)
+
 
 async def dbsetup():
-    async with asqlite.connect("userplaylists.db") as conn:
+    async with acquire(PLAYLISTS_DB) as conn:
         async with conn.cursor() as cur:
             await cur.execute(
                 """CREATE TABLE IF NOT EXISTS playlists (
@@ -21,7 +453,9 @@ async def dbsetup():
                                   )"""
             )
             await conn.commit()
-    async with asqlite.connect("dynamiccooldowns.db") as conn:
+    await migrate(PLAYLISTS_DB)
+    await enable_incremental_vacuum(COOLDOWNS_DB)
+    async with acquire(COOLDOWNS_DB) as conn:
         async with conn.cursor() as cur:
             await cur.execute(
                 """CREATE TABLE IF NOT EXISTS cooldowns (
@@ -30,4 +464,15 @@ async def dbsetup():
                                   )"""
 
             )
-            await conn.commit() 
+            await conn.commit()
+    await migrate(COOLDOWNS_DB)
+    async with acquire(DECODE_CACHE_DB) as conn:
+        async with conn.cursor() as cur:
+            await cur.execute(
+                """CREATE TABLE IF NOT EXISTS decoded_tracks (
+                                  hash BLOB PRIMARY KEY NOT NULL,
+                                  info TEXT NOT NULL
+                                  )"""
+            )
+            await conn.commit()
+    await migrate(DECODE_CACHE_DB)
@@ -0,0 +1,237 @@
+import asyncio
+import json
+import logging
+import time
+from typing import AsyncIterator, Optional, Sequence
+import wavelink
+from . import dbmanager
+from .cache import LRUCache
+from .trackcodec import decode_many, track_hash
+
+logger = logging.getLogger("bot")
+DECODE_CHUNK_SIZE = 100
+DECODE_CONCURRENCY = 4
+
+
+def chunked(items: Sequence, size: int) -> list[Sequence]:
+    """Split a sequence in chunks of ``size`` items"""
+    return [items[i : i + size] for i in range(0, len(items), size)]
+
+
+class DecodeCache:
+    """Two-tier cache of decoded tracks.
+
+    Decoded tracks are kept in an in-memory LRU, backed by a SQLite table
+    which keeps at most ``max_rows`` tracks. When it's full, the least
+    recently used tenth of it is evicted.
+    """
+
+    SQL_VARS_LIMIT = 500
+    # Hits are written to the table in batches
+    TOUCH_BATCH = 500
+
+    def __init__(self, maxsize: int = 10_000, max_rows: int = 500_000):
+        self.memory = LRUCache(maxsize)
+        self.max_rows = max_rows
+        self.disk_hits: int = 0
+        self.misses: int = 0
+        self.bytes_saved: int = 0
+        self.evictions: int = 0
+        # Rows in the table, counted once then kept up to date
+        self._rows: Optional[int] = None
+        # Hashes used since the last write -> time of their last use
+        self._touched: dict[bytes, int] = {}
+        self._write_lock = asyncio.Lock()
+
+    @property
+    def hits(self) -> int:
+        return self.memory.hits + self.disk_hits
+
+    @property
+    def hit_ratio(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    async def get_many(self, encoded: Sequence[str]) -> list[Optional[dict]]:
+        """|coro|
+
+        Look up many tracks, misses are ``None``"""
+        results: list[Optional[dict]] = [None] * len(encoded)
+        keys = [track_hash(e) for e in encoded]
+        now = int(time.time())
+        missing: dict[bytes, list[int]] = {}
+        for i, key in enumerate(keys):
+            info = self.memory.get(key)
+            if info is not None:
+                results[i] = {"encoded": encoded[i], **info}
+                self._touched[key] = now
+            else:
+                missing.setdefault(key, []).append(i)
+
+        if missing:
+            async with dbmanager.acquire(dbmanager.DECODE_CACHE_DB) as conn:
+                for chunk in chunked(tuple(missing), self.SQL_VARS_LIMIT):
+                    rows = await conn.fetchall(
+                        f"SELECT hash, info FROM decoded_tracks WHERE hash IN ({', '.join('?' * len(chunk))})",
+                        tuple(chunk),
+                    )
+                    for key, info in rows:
+                        info = json.loads(info)
+                        self.memory.set(key, info)
+                        self._touched[key] = now
+                        for i in missing.pop(key):
+                            results[i] = {"encoded": encoded[i], **info}
+                            self.disk_hits += 1
+
+        for i, result in enumerate(results):
+            if result is None:
+                self.misses += 1
+            else:
+                self.bytes_saved += len(encoded[i])
+        if len(self._touched) >= self.TOUCH_BATCH:
+            await self.put_many(())
+        return results
+
+    async def put_many(self, tracks: Sequence[dict]):
+        """|coro|
+
+        Store decoded tracks, and the last use of the tracks found since the
+        last call"""
+        now = int(time.time())
+        rows = []
+        for track in tracks:
+            key = track_hash(track["encoded"])
+            info = {k: v for k, v in track.items() if k != "encoded"}
+            self.memory.set(key, info)
+            rows.append((key, json.dumps(info), now))
+        if not rows and not self._touched:
+            return
+        async with (
+            self._write_lock,
+            dbmanager.acquire(dbmanager.DECODE_CACHE_DB) as conn,
+            conn.transaction(),
+        ):
+            touched, self._touched = self._touched, {}
+            await conn.executemany(
+                "UPDATE decoded_tracks SET last_used=? WHERE hash=?",
+                ((used, key) for key, used in touched.items()),
+            )
+            if not rows:
+                return
+            if self._rows is None:
+                self._rows = (await conn.fetchone("SELECT COUNT(*) FROM decoded_tracks"))[0]
+            cur = await conn.executemany(
+                "INSERT OR IGNORE INTO decoded_tracks (hash, info, last_used) VALUES (?, ?, ?)",
+                rows,
+            )
+            self._rows += cur.get_cursor().rowcount
+            if self._rows > self.max_rows:
+                # Evict more than needed so the next writes don't evict again
+                excess = self._rows - self.max_rows + self.max_rows // 10
+                cur = await conn.execute(
+                    """DELETE FROM decoded_tracks WHERE hash IN (
+                           SELECT hash FROM decoded_tracks ORDER BY last_used LIMIT ?
+                       )""",
+                    (excess,),
+                )
+                deleted = cur.get_cursor().rowcount
+                self._rows -= deleted
+                self.evictions += deleted
+
+
+decode_cache = DecodeCache()
+
+
+def _decode_chunk_tasks(
+    node: wavelink.Node, encoded: Sequence[str], chunk_size: int, concurrency: int
+) -> list[asyncio.Task]:
+    # Bounds the cache lookups too, so a long playlist doesn't queue a pool
+    # waiter per chunk. Chunks get it in order.
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def decode_chunk(chunk: Sequence[str]) -> list[Optional[dict]]:
+        async with semaphore:
+            decoded = await decode_cache.get_many(chunk)
+            missing = [i for i, t in enumerate(decoded) if t is None]
+            if not missing:
+                return decoded
+            for i, t in zip(missing, decode_many([chunk[i] for i in missing])):
+                decoded[i] = t
+            remote = [i for i in missing if decoded[i] is None]
+            if remote:
+                # Unknown track versions or sources are decoded by the node
+                data = await node.send(
+                    "POST", path="v4/decodetracks", data=[chunk[i] for i in remote]
+                )
+                if len(data) == len(remote):
+                    for i, t in zip(remote, data):
+                        decoded[i] = t
+                else:
+                    logger.warning(
+                        "Node %s decoded %s of %s tracks",
+                        node.identifier, len(data), len(remote),
+                    )
+                    by_encoded = {t["encoded"]: t for t in data}
+                    for i in remote:
+                        decoded[i] = by_encoded.get(chunk[i])
+            await decode_cache.put_many(
+                [decoded[i] for i in missing if decoded[i] is not None]
+            )
+            return decoded
+
+    return [
+        asyncio.create_task(decode_chunk(c)) for c in chunked(encoded, chunk_size)
+    ]
+
+
+async def decode_tracks(
+    node: wavelink.Node,
+    encoded: Sequence[str],
+    *,
+    chunk_size: int = DECODE_CHUNK_SIZE,
+    concurrency: int = DECODE_CONCURRENCY,
+) -> list[Optional[dict]]:
+    """|coro|
+
+    Decode base64 tracks.
+
+    Tracks are looked up in the decode cache first, then decoded locally
+    when possible, the rest is sent to the node's ``v4/decodetracks``
+    endpoint in chunks of ``chunk_size``, with at most ``concurrency``
+    chunks in flight. The result keeps the input order, tracks the node
+    didn't decode are ``None``.
+    """
+    if not encoded:
+        return []
+    results = await asyncio.gather(
+        *_decode_chunk_tasks(node, encoded, chunk_size, concurrency)
+    )
+    return [track for chunk in results for track in chunk]
+
+
+async def iter_decoded_chunks(
+    node: wavelink.Node,
+    encoded: Sequence[str],
+    *,
+    chunk_size: int = DECODE_CHUNK_SIZE,
+    concurrency: int = DECODE_CONCURRENCY,
+) -> AsyncIterator[list[Optional[dict]]]:
+    """Same as :func:`decode_tracks`, but yields every decoded chunk in order
+    as soon as it's ready"""
+    tasks = _decode_chunk_tasks(node, encoded, chunk_size, concurrency)
+    try:
+        for task in tasks:
+            yield await task
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+__all__ = [
+    "decode_tracks",
+    "iter_decoded_chunks",
+    "decode_cache",
+    "DecodeCache",
+    "track_hash",
+    "chunked",
+]
@@ -0,0 +1,73 @@
+import asyncio
+import logging
+import discord
+
+logger = logging.getLogger("bot")
+
+# Message edits share a rate limit bucket per channel
+EDIT_INTERVAL = 1.0
+
+
+class EditScheduler:
+    """Edit messages in the background.
+
+    Edits are sent one at a time per channel, at most one every ``interval``
+    seconds. Edits of a message that is still waiting are merged, so only
+    its latest state is sent.
+    """
+
+    def __init__(self, interval: float = EDIT_INTERVAL):
+        self.interval = interval
+        self.requested: int = 0
+        self.sent: int = 0
+        self.coalesced: int = 0
+        self.rate_limited: int = 0
+        self._pending: dict[int, dict[int, tuple[discord.Message, dict]]] = {}
+        self._workers: dict[int, asyncio.Task] = {}
+
+    def edit(self, message: discord.Message, **fields):
+        """Schedule a ``message.edit(**fields)``"""
+        self.requested += 1
+        channel_id = message.channel.id
+        pending = self._pending.setdefault(channel_id, {})
+        if message.id in pending:
+            self.coalesced += 1
+            fields = {**pending[message.id][1], **fields}
+        pending[message.id] = (message, fields)
+        if channel_id not in self._workers:
+            self._workers[channel_id] = asyncio.create_task(self._run(channel_id))
+
+    async def _run(self, channel_id: int):
+        pending = self._pending[channel_id]
+        try:
+            while pending:
+                message_id = next(iter(pending))
+                message, fields = pending.pop(message_id)
+                try:
+                    await message.edit(**fields)
+                    self.sent += 1
+                except discord.RateLimited as e:
+                    self.rate_limited += 1
+                    # Retry later, merged with the edits requested meanwhile
+                    if message_id in pending:
+                        fields = {**fields, **pending[message_id][1]}
+                    pending[message_id] = (message, fields)
+                    await asyncio.sleep(e.retry_after)
+                except discord.NotFound:
+                    pass
+                except discord.HTTPException as e:
+                    logger.warning("Can't edit message %s: %s", message_id, e)
+                await asyncio.sleep(self.interval)
+        finally:
+            self._workers.pop(channel_id, None)
+            if not pending:
+                self._pending.pop(channel_id, None)
+
+
+edit_scheduler = EditScheduler()
+
+
+__all__ = [
+    "EditScheduler",
+    "edit_scheduler",
+]
@@ -1,11 +1,14 @@
+import functools
+import heapq
 import time
 from typing import Optional
-import asqlite
 import discord
 import wavelink
 from discord import app_commands
 import bot.player as customplayer
+import bot.dbmanager as dbmanager
 from bot.enums import SourceEmoji
+from bot.nodes import node_scheduler
 from discord import app_commands
 
 
@@ -18,6 +21,8 @@ SOURCES: list[app_commands.Choice[str]] = [
 
 TEN_SECONDS_CD_CMDS = {"play", "add-track", "replay"}
 SIX_SECONDS_CD_CMDS = {"check-vote", "create", "ls", "manage", "stats", "queue", "nowplaying", "playfile"} 
+# Cooldown reduction given by a top.gg vote, in seconds
+VOTE_DURATION = 43200
 
 # Exceptions
 
@@ -42,6 +47,54 @@ class TopGGButton(discord.ui.Button):
         )
 
 
+class VoteCache:
+    """Vote expiry time of every user who voted recently.
+
+    Expired votes are evicted lazily, with a heap ordered by expiry time.
+    """
+
+    def __init__(self):
+        self._expiries: dict[int, float] = {}
+        self._heap: list[tuple[float, int]] = []
+
+    def __len__(self) -> int:
+        return len(self._expiries)
+
+    def set(self, user_id: int, expires_at: float):
+        """Set the vote expiry time of a user"""
+        if expires_at <= self._expiries.get(user_id, 0):
+            return
+        self._expiries[user_id] = expires_at
+        heapq.heappush(self._heap, (expires_at, user_id))
+
+    def has_voted(self, user_id: int) -> bool:
+        self._evict(time.time())
+        return user_id in self._expiries
+
+    def _evict(self, now: float):
+        heap = self._heap
+        while heap and heap[0][0] <= now:
+            expires_at, user_id = heapq.heappop(heap)
+            # The user may have voted again since this entry was pushed
+            if self._expiries.get(user_id) == expires_at:
+                del self._expiries[user_id]
+
+    async def load(self):
+        """|coro|
+
+        Load the votes stored in the database"""
+        async with dbmanager.acquire(dbmanager.COOLDOWNS_DB) as conn:
+            rows = await conn.fetchall(
+                "SELECT userid, expires_at FROM cooldowns WHERE expires_at > ?",
+                (time.time(),),
+            )
+        for user_id, expires_at in rows:
+            self.set(int(user_id), expires_at)
+
+
+vote_cache = VoteCache()
+
+
 # decorators
 def new_get_player():
     async def c(interaction: discord.Interaction):
@@ -88,7 +141,10 @@ def new_get_player():
 
                 try:
                     player = await interaction.user.voice.channel.connect(
-                        cls=customplayer.CustomPlayer
+                        cls=functools.partial(
+                            customplayer.CustomPlayer,
+                            nodes=[node_scheduler.best("player")],
+                        )
                     )
                     player.store("channel", interaction.channel)
                     player.autoplay = wavelink.AutoPlayMode.partial
@@ -128,25 +184,14 @@ def new_get_player():
 
 async def cooldown_for_vote(interaction: discord.Interaction) -> Optional[app_commands.Cooldown]:
     """Check if the user has voted and set a cooldown"""
-    async with asqlite.connect("dynamiccooldowns.db") as conn:
-        async with conn.cursor() as cursor:
-            await cursor.execute(
-                "SELECT expires_at FROM cooldowns WHERE userid = ?",
-                (interaction.user.id,)
-            )
-            result = await cursor.fetchone()
-            if interaction.command.name not in TEN_SECONDS_CD_CMDS | SIX_SECONDS_CD_CMDS:
-                return None
-            if result and result[0] > time.time(): # Cooldown reduction
-                if interaction.command.name in TEN_SECONDS_CD_CMDS:
-                    return app_commands.Cooldown(1,5)
-                elif interaction.command.name in SIX_SECONDS_CD_CMDS: 
-                    return  app_commands.Cooldown(1,3)
-            if interaction.command.name in TEN_SECONDS_CD_CMDS:
-                    return app_commands.Cooldown(1,10)
-            elif interaction.command.name in SIX_SECONDS_CD_CMDS:
-                return app_commands.Cooldown(1,6)
-      
+    name = interaction.command.name
+    if name in TEN_SECONDS_CD_CMDS:
+        # Cooldown reduction
+        return app_commands.Cooldown(1, 5 if vote_cache.has_voted(interaction.user.id) else 10)
+    if name in SIX_SECONDS_CD_CMDS:
+        return app_commands.Cooldown(1, 3 if vote_cache.has_voted(interaction.user.id) else 6)
+    return None
+
 
 async def cog_app_command_error_handler(interaction, error):
     if isinstance(error, app_commands.CommandOnCooldown):
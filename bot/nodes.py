@@ -0,0 +1,280 @@
+"""Load-aware Lavalink node selection and failover.
+
+Every node is probed with ``GET v4/stats``, which gives its players, CPU
+load and REST latency. Frame stats are only sent in websocket ``stats``
+events, those don't say which node sent them so they're matched to a node
+by its uptime.
+
+Players are moved to another node when their node disconnects or keeps
+having a frame deficit.
+"""
+
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Literal, Optional
+import aiohttp
+import wavelink
+
+logger = logging.getLogger("bot")
+
+PROBE_INTERVAL = 30
+PROBE_TIMEOUT = 5
+# A node is unhealthy after this many failed probes in a row
+MAX_PROBE_FAILURES = 2
+# Stats events are matched to the node whose start time is this close (seconds)
+UPTIME_TOLERANCE = 5
+# Lavalink sends 3000 frames per player per minute
+FRAMES_PER_MINUTE = 3000
+# Score points per millisecond of REST latency
+LATENCY_WEIGHT = 0.2
+# A node is degraded after this many stats events in a row with a frame
+# deficit above 10%, stats events are sent every minute
+DEGRADED_DEFICIT = FRAMES_PER_MINUTE // 10
+DEGRADED_REPORTS = 3
+MIGRATE_TIMEOUT = 10
+MIGRATE_CONCURRENCY = 5
+
+Purpose = Literal["player", "search", "decode", "failover"]
+
+
+class NodeLoad:
+    """Last known load of a node"""
+
+    __slots__ = (
+        "players",
+        "playing",
+        "system_load",
+        "lavalink_load",
+        "deficit",
+        "nulled",
+        "latency",
+        "started_at",
+        "probed_at",
+        "failures",
+        "deficit_reports",
+    )
+
+    def __init__(self):
+        self.players: int = 0
+        self.playing: int = 0
+        self.system_load: float = 0.0
+        self.lavalink_load: float = 0.0
+        self.deficit: int = 0
+        self.nulled: int = 0
+        # REST latency in milliseconds
+        self.latency: Optional[float] = None
+        self.started_at: Optional[float] = None
+        self.probed_at: Optional[float] = None
+        self.failures: int = 0
+        # Stats events in a row with a frame deficit
+        self.deficit_reports: int = 0
+
+    def update(self, stats: wavelink.StatsEventPayload | wavelink.StatsResponsePayload):
+        self.players = stats.players
+        self.playing = stats.playing
+        self.system_load = stats.cpu.system_load
+        self.lavalink_load = stats.cpu.lavalink_load
+        self.started_at = time.time() - stats.uptime / 1000
+        if stats.playing == 0 or (
+            stats.frames is None and isinstance(stats, wavelink.StatsEventPayload)
+        ):
+            # Nothing is sending audio, the deficit of the players that were
+            # moved away doesn't count anymore and the node can be used again
+            self.deficit = 0
+            self.nulled = 0
+            self.deficit_reports = 0
+        elif stats.frames is not None:
+            self.deficit = stats.frames.deficit
+            self.nulled = stats.frames.nulled
+            if self.deficit > DEGRADED_DEFICIT:
+                self.deficit_reports += 1
+            else:
+                self.deficit_reports = 0
+
+    @property
+    def degraded(self) -> bool:
+        return self.deficit_reports >= DEGRADED_REPORTS
+
+
+class NodeScheduler:
+    """Pick the least loaded healthy node.
+
+    The score of a node grows with its playing players, CPU load, frame
+    deficit and REST latency, the node with the lowest score is picked.
+    """
+
+    def __init__(self, probe_interval: float = PROBE_INTERVAL):
+        self.probe_interval = probe_interval
+        self.loads: dict[str, NodeLoad] = {}
+        # (time, purpose, node identifier, score)
+        self.placements: deque[tuple[float, Purpose, str, float]] = deque(maxlen=20)
+        # (purpose, node identifier) -> number of placements
+        self.counts: dict[tuple[Purpose, str], int] = {}
+        self.migrations: int = 0
+        self.failed_migrations: int = 0
+        # Guild ids of the players being moved
+        self._migrating: set[int] = set()
+        self._task: Optional[asyncio.Task] = None
+
+    def load(self, node: wavelink.Node) -> NodeLoad:
+        load = self.loads.get(node.identifier)
+        if load is None:
+            load = self.loads[node.identifier] = NodeLoad()
+        return load
+
+    def healthy(self, node: wavelink.Node) -> bool:
+        return (
+            node.status is wavelink.NodeStatus.CONNECTED
+            and self.load(node).failures < MAX_PROBE_FAILURES
+            and not self.load(node).degraded
+        )
+
+    def score(self, node: wavelink.Node) -> float:
+        load = self.load(node)
+        # Players created since the last probe are counted too
+        playing = max(load.playing, len(node.players))
+        cpu = 1.05 ** (100 * load.system_load) * 10 - 10
+        deficit = 1.03 ** (500 * load.deficit / FRAMES_PER_MINUTE) * 600 - 600
+        nulled = (1.03 ** (500 * load.nulled / FRAMES_PER_MINUTE) * 300 - 300) * 2
+        latency = (load.latency or 0.0) * LATENCY_WEIGHT
+        return playing + cpu + deficit + nulled + latency
+
+    def best(self, purpose: Purpose = "search", *, exclude: tuple[str, ...] = ()) -> wavelink.Node:
+        """The node to use for a new player or a REST request
+
+        Raises: InvalidNodeException
+        """
+        nodes = [
+            n
+            for n in wavelink.Pool.nodes.values()
+            if n.identifier not in exclude and self.healthy(n)
+        ]
+        if not nodes:
+            # Every node failed its last probes, let wavelink pick a connected one
+            return wavelink.Pool.get_node()
+        scores = {n.identifier: self.score(n) for n in nodes}
+        node = min(nodes, key=lambda n: scores[n.identifier])
+        self.placements.append((time.time(), purpose, node.identifier, scores[node.identifier]))
+        key = (purpose, node.identifier)
+        self.counts[key] = self.counts.get(key, 0) + 1
+        return node
+
+    def on_stats(self, stats: wavelink.StatsEventPayload) -> Optional[wavelink.Node]:
+        """Record a websocket ``stats`` event, the node is returned if it just became degraded"""
+        nodes = [
+            n for n in wavelink.Pool.nodes.values()
+            if n.status is wavelink.NodeStatus.CONNECTED
+        ]
+        if len(nodes) > 1:
+            started_at = time.time() - stats.uptime / 1000
+            nodes = [
+                n
+                for n in nodes
+                if self.load(n).started_at is not None
+                and abs(self.load(n).started_at - started_at) <= UPTIME_TOLERANCE
+            ]
+        # Ambiguous events are ignored, the next probe updates the nodes
+        if len(nodes) != 1:
+            return None
+        load = self.load(nodes[0])
+        load.update(stats)
+        return nodes[0] if load.deficit_reports == DEGRADED_REPORTS else None
+
+    async def evacuate(
+        self, node: wavelink.Node, players: list[wavelink.Player], *, disconnect: bool = False
+    ) -> int:
+        """|coro|
+
+        Move players off a node, returns how many were moved. Players that
+        can't be moved are disconnected if ``disconnect`` is set."""
+        semaphore = asyncio.Semaphore(MIGRATE_CONCURRENCY)
+        # wavelink can report the same disconnection twice
+        players = [
+            p for p in players if p.node is node and p.guild.id not in self._migrating
+        ]
+        self._migrating.update(p.guild.id for p in players)
+
+        async def move(player: wavelink.Player) -> bool:
+            async with semaphore:
+                try:
+                    target = self.best("failover", exclude=(node.identifier,))
+                    if target.identifier == node.identifier:
+                        raise wavelink.InvalidNodeException("No other node is available")
+                    await asyncio.wait_for(player.migrate(target), MIGRATE_TIMEOUT)
+                except (RuntimeError, wavelink.WavelinkException, asyncio.TimeoutError) as e:
+                    logger.warning(
+                        "Can't move player %s off node %s: %r", player.guild.id, node.identifier, e
+                    )
+                    if disconnect:
+                        await player.disconnect()
+                    return False
+                finally:
+                    self._migrating.discard(player.guild.id)
+                return True
+
+        if not players:
+            return 0
+        results = await asyncio.gather(*(move(p) for p in players))
+        moved = sum(results)
+        self.migrations += moved
+        self.failed_migrations += len(results) - moved
+        logger.info("Moved %s/%s players off node %s", moved, len(results), node.identifier)
+        return moved
+
+    async def probe(self, node: wavelink.Node):
+        """|coro|
+
+        Fetch the stats of a node and measure its REST latency"""
+        load = self.load(node)
+        started = time.perf_counter()
+        try:
+            stats = await asyncio.wait_for(node.fetch_stats(), PROBE_TIMEOUT)
+        except (wavelink.WavelinkException, aiohttp.ClientError, asyncio.TimeoutError) as e:
+            load.failures += 1
+            logger.warning("Probe of node %s failed: %r", node.identifier, e)
+            return
+        load.latency = (time.perf_counter() - started) * 1000
+        load.probed_at = time.time()
+        load.failures = 0
+        # REST stats don't have frame stats, keep the ones of the last event
+        load.update(stats)
+
+    async def probe_all(self):
+        """|coro|"""
+        await asyncio.gather(
+            *(
+                self.probe(n)
+                for n in wavelink.Pool.nodes.values()
+                if n.status is wavelink.NodeStatus.CONNECTED
+            )
+        )
+
+    def start(self):
+        """Start probing the nodes in the background"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._probe_loop())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _probe_loop(self):
+        while True:
+            try:
+                await self.probe_all()
+            except Exception:
+                logger.exception("Node probes failed")
+            await asyncio.sleep(self.probe_interval)
+
+
+node_scheduler = NodeScheduler()
+
+
+__all__ = [
+    "NodeLoad",
+    "NodeScheduler",
+    "node_scheduler",
+]
@@ -1,20 +1,132 @@
+import asyncio
 import wavelink
 import discord
 import datetime
+import logging
+from collections import deque
+from typing import Any, Coroutine, Iterable
+from .queue import CompactQueue, QueueEntry, compact, rehydrate
+
+logger = logging.getLogger("bot")
+
+
+def user_data_extras(extras: wavelink.ExtrasNamespace) -> wavelink.ExtrasNamespace:
+    """The extras of a track as they're sent to Lavalink as its userData.
+
+    Queued tracks of a custom playlist share one ``customPlaylist`` dict and
+    keep their ``trackId`` next to it, Lavalink gets the ``trackId`` inside
+    ``customPlaylist``."""
+    data = dict(extras)
+    if "trackId" not in data or "customPlaylist" not in data:
+        return extras
+    track_id = data.pop("trackId")
+    data["customPlaylist"] = {**data["customPlaylist"], "trackId": track_id}
+    return wavelink.ExtrasNamespace(data)
+
 
 class CustomPlayer(wavelink.Player):
+    # How many played tracks are kept for "previous"
+    history_depth: int = 50
 
     def __init__(
         self, client: discord.Client, channel, *, nodes: list | None = None
     ) -> None:
         super().__init__(client, channel, nodes=nodes)
         self.__stored_data = {}
-        self.backpack: list[wavelink.Playable] = []
+        self.queue: CompactQueue = CompactQueue()
+        self.backpack: deque[wavelink.Playable | QueueEntry] = deque(
+            maxlen=self.history_depth
+        )
+        # Background tasks, cancelled when the player is cleaned up
+        self._tasks: set[asyncio.Task] = set()
+
+    async def play(self, track: wavelink.Playable, **kwargs) -> wavelink.Playable:
+        """|coro|
+
+        Play a track, see ``wavelink.Player.play``"""
+        track.extras = user_data_extras(track.extras)
+        return await super().play(track, **kwargs)
+
+    async def migrate(self, node: wavelink.Node):
+        """|coro|
+
+        Move the player to another node. The current track is resumed at
+        the same position with the same pause state, volume and filters.
+        The queue, backpack and stored data stay on the player.
+
+        Raises: RuntimeError, InvalidNodeException, LavalinkException
+        """
+        history = len(self.queue.history)
+        await self.switch_node(node)
+        # switch_node plays the current track again, it's already in the history
+        if len(self.queue.history) > history:
+            del self.queue.history[-1]
+
+    def create_task(self, coro: Coroutine, *, name: str | None = None) -> asyncio.Task:
+        """Run a coroutine in the background while the player is connected.
+
+        The task is referenced until it's done, its exception is logged and
+        it's cancelled when the player disconnects"""
+        task = asyncio.create_task(coro, name=name)
+        self._tasks.add(task)
+        task.add_done_callback(self._task_done)
+        return task
+
+    def _task_done(self, task: asyncio.Task):
+        self._tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.error(
+                "Task %s of player %s failed",
+                task.get_name(),
+                self.guild.id if self.guild else None,
+                exc_info=task.exception(),
+            )
+
+    def cancel_tasks(self):
+        """Cancel the background tasks of the player"""
+        current = asyncio.current_task()
+        for task in tuple(self._tasks):
+            if task is not current:
+                task.cancel()
+
+    def cleanup(self) -> None:
+        # Called by wavelink on every disconnection, but not when switching nodes
+        self.cancel_tasks()
+        super().cleanup()
+
+    def remember(self, track: wavelink.Playable):
+        """Add a played track to the backpack, the oldest one is dropped when it's full"""
+        self.backpack.append(compact(track))
 
     def store(self, key: str, value):
         """Store any key=value in the player's dict"""
         self.__stored_data[key] = value
 
+    async def enqueue_many(
+        self,
+        tracks: Iterable[wavelink.Playable],
+        *,
+        extras: wavelink.ExtrasNamespace | dict[str, Any] | None = None,
+    ) -> int:
+        """|coro|
+
+        Add tracks to the end of the queue in one operation and dispatch one
+        ``on_player_queue_update(player, added)`` event.
+
+        If ``extras`` is given, every track gets the same namespace: it's
+        shared, not copied, so it must not be modified afterwards."""
+        tracks = list(tracks)
+        if not tracks:
+            return 0
+        if extras is not None:
+            if not isinstance(extras, wavelink.ExtrasNamespace):
+                extras = wavelink.ExtrasNamespace(extras)
+            for track in tracks:
+                track.extras = extras
+        added = await self.queue.put_wait(tracks)
+        self.client.dispatch("player_queue_update", self, added)
+        return added
+
     def get_formatted_track_album(self, t: wavelink.Playable):
         return (
             f"[{t.album.name}]({t.album.url})"
@@ -86,14 +198,13 @@ class CustomPlayer(wavelink.Player):
         
         Raises: IndexError
         """
-        index = len(self.backpack) - 1
-        if index < 0:
+        if not self.backpack:
             raise IndexError()
         
         if self.current:
             self.queue.put_at(0,self.current)
-        await self.play(self.backpack[index])
-        del self.backpack[index]
+        await self.play(rehydrate(self.backpack[-1]))
+        self.backpack.pop()
         
     
 
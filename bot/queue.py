@@ -0,0 +1,196 @@
+"""Compact player queue.
+
+Queued tracks are stored as :class:`QueueEntry`, which only keep the encoded
+track and the fields shown in the queue. They are decoded back into a
+``wavelink.Playable`` by :mod:`bot.trackcodec` when they're played.
+"""
+
+from typing import Any, Iterable, Optional
+from wavelink import ExtrasNamespace, Playable, Playlist, Queue
+from .trackcodec import (
+    LAVASRC_SOURCES,
+    PLAIN_SOURCES,
+    PROBE_SOURCES,
+    TrackDecodeError,
+    decode_track,
+)
+
+# Tracks of other sources are kept as they are
+COMPACT_SOURCES = PLAIN_SOURCES | PROBE_SOURCES | LAVASRC_SOURCES
+
+
+class QueueEntry:
+    """A queued track"""
+
+    __slots__ = (
+        "encoded",
+        "identifier",
+        "title",
+        "author",
+        "length",
+        "is_stream",
+        "uri",
+        "artwork",
+        "source",
+        "extras",
+    )
+
+    def __init__(
+        self,
+        encoded: str,
+        identifier: str,
+        title: str,
+        author: str,
+        length: int,
+        is_stream: bool,
+        uri: Optional[str],
+        artwork: Optional[str],
+        source: str,
+        extras: ExtrasNamespace,
+    ):
+        self.encoded = encoded
+        self.identifier = identifier
+        self.title = title
+        self.author = author
+        self.length = length
+        self.is_stream = is_stream
+        self.uri = uri
+        self.artwork = artwork
+        self.source = source
+        self.extras = extras
+
+    @classmethod
+    def from_playable(cls, track: Playable) -> "QueueEntry":
+        return cls(
+            track.encoded,
+            track.identifier,
+            track.title,
+            track.author,
+            track.length,
+            track.is_stream,
+            track.uri,
+            track.artwork,
+            track.source,
+            track.extras,
+        )
+
+    def to_playable(self) -> Playable:
+        """Decode the entry into a ``wavelink.Playable``"""
+        try:
+            data = decode_track(self.encoded)
+        except TrackDecodeError:
+            # Album and artist info is lost
+            data = {
+                "encoded": self.encoded,
+                "info": {
+                    "identifier": self.identifier,
+                    "isSeekable": not self.is_stream,
+                    "author": self.author,
+                    "length": self.length,
+                    "isStream": self.is_stream,
+                    "position": 0,
+                    "title": self.title,
+                    "uri": self.uri,
+                    "artworkUrl": self.artwork,
+                    "isrc": None,
+                    "sourceName": self.source,
+                },
+                "pluginInfo": {},
+            }
+        track = Playable(data)
+        track.extras = self.extras
+        return track
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, (QueueEntry, Playable)):
+            return NotImplemented
+        # Same key as __hash__, equal entries must have the same hash
+        return self.encoded == other.encoded
+
+    def __hash__(self) -> int:
+        return hash(self.encoded)
+
+    def __str__(self) -> str:
+        return self.title
+
+    def __repr__(self) -> str:
+        return f"QueueEntry(source={self.source}, title={self.title}, identifier={self.identifier})"
+
+
+def compact(track: Playable | QueueEntry) -> Playable | QueueEntry:
+    """The :class:`QueueEntry` of a track, if it can be decoded back"""
+    if isinstance(track, Playable) and track.encoded and track.source in COMPACT_SOURCES:
+        return QueueEntry.from_playable(track)
+    return track
+
+
+def rehydrate(track: Playable | QueueEntry) -> Playable:
+    """The ``wavelink.Playable`` of a queued track"""
+    if isinstance(track, QueueEntry):
+        return track.to_playable()
+    return track
+
+
+class CompactQueue(Queue):
+    """A ``wavelink.Queue`` storing :class:`QueueEntry` instead of ``Playable``.
+
+    Indexing and iterating return entries, they have the same display fields
+    as ``Playable``. :meth:`get` and :meth:`get_at` return playables.
+    """
+
+    def __init__(self, *, history: bool = True) -> None:
+        super().__init__(history=False)
+        self._history = CompactQueue(history=False) if history else None
+
+    @staticmethod
+    def _check_compatibility(item: object) -> bool:
+        if not isinstance(item, (Playable, QueueEntry)):
+            raise TypeError("This queue is restricted to Playable objects.")
+        return True
+
+    @staticmethod
+    def _compact(item: Any) -> Any:
+        if isinstance(item, Iterable):
+            return [compact(t) if isinstance(t, Playable) else t for t in item]
+        return compact(item) if isinstance(item, Playable) else item
+
+    def __setitem__(self, index, value: Playable | QueueEntry, /) -> None:
+        super().__setitem__(index, self._compact(value))
+
+    def put(
+        self, item: list[Playable] | Playable | Playlist, /, *, atomic: bool = True
+    ) -> int:
+        return super().put(self._compact(item), atomic=atomic)
+
+    async def put_wait(
+        self, item: list[Playable] | Playable | Playlist, /, *, atomic: bool = True
+    ) -> int:
+        return await super().put_wait(self._compact(item), atomic=atomic)
+
+    def put_at(self, index: int, value: Playable | QueueEntry, /) -> None:
+        super().put_at(index, self._compact(value))
+
+    def get(self) -> Playable:
+        track = super().get()
+        if isinstance(track, QueueEntry):
+            track = self._loaded = track.to_playable()
+        return track
+
+    def get_at(self, index: int, /) -> Playable:
+        track = super().get_at(index)
+        if isinstance(track, QueueEntry):
+            track = self._loaded = track.to_playable()
+        return track
+
+    def copy(self) -> "CompactQueue":
+        copy_queue = CompactQueue(history=self.history is not None)
+        copy_queue._items = self._items.copy()
+        return copy_queue
+
+
+__all__ = [
+    "QueueEntry",
+    "CompactQueue",
+    "compact",
+    "rehydrate",
+]
@@ -0,0 +1,215 @@
+"""Shared Lavalink search.
+
+Results are cached by normalised query as raw Lavalink payloads, new
+``wavelink.Playable`` objects are built on every call so the extras set by
+a player don't leak to the others. Concurrent identical searches share one
+request.
+"""
+
+import asyncio
+import re
+from typing import Optional
+import wavelink
+from .cache import TTLCache
+from .enums import SearchType
+from .nodes import node_scheduler
+
+URL_REGEX = re.compile(
+    r"https?:\/\/(www\.)?[-a-zA-Z0-9@:%._\+~#=]{1,256}\.[a-zA-Z0-9()]{1,6}\b([-a-zA-Z0-9()@:%_\+.~#?&//=]*)"
+)
+
+DEFAULT_SOURCE = "spsearch:"
+# Sources supported by LavaSrc's loadsearch endpoint
+LOADSEARCH_SOURCES = frozenset({"spsearch:", "dzsearch:", "amsearch:"})
+LOADSEARCH_TYPES = {
+    SearchType.Album: "albums",
+    SearchType.Playlist: "playlists",
+    SearchType.Artist: "artists",
+}
+
+SEARCH_TTL = 600
+EMPTY_TTL = 30
+# Rough size of a track payload, used to bound the cache memory
+TRACK_PAYLOAD_SIZE = 1024
+
+EMPTY_PAYLOAD = {"loadType": "empty", "data": {}}
+
+
+def normalize_source(source: Optional[str]) -> str:
+    """``"SPSearch"`` -> ``"spsearch:"``"""
+    if not source:
+        return DEFAULT_SOURCE
+    return f"{source.strip().lower().removesuffix(':')}:"
+
+
+def normalize_query(query: str) -> str:
+    """Strip, collapse whitespace and casefold a search query"""
+    return " ".join(query.split()).casefold()
+
+
+def payload_tracks(payload: dict) -> int:
+    """Number of tracks of a loadtracks payload"""
+    match payload["loadType"]:
+        case "track":
+            return 1
+        case "search":
+            return len(payload["data"])
+        case "playlist":
+            return len(payload["data"]["tracks"])
+    return 0
+
+
+def to_search(payload: dict) -> wavelink.Search:
+    """Build a ``wavelink.Search`` from a loadtracks payload"""
+    match payload["loadType"]:
+        case "track":
+            return [wavelink.Playable(payload["data"])]
+        case "search":
+            return [wavelink.Playable(t) for t in payload["data"]]
+        case "playlist":
+            return wavelink.Playlist(payload["data"])
+        case "error":
+            raise wavelink.LavalinkLoadException(data=payload["data"])
+    return []
+
+
+class SearchService:
+    """Search tracks, albums, playlists and artists.
+
+    Results are kept in a TTL+LRU cache for ``ttl`` seconds, empty results
+    for ``empty_ttl`` seconds.
+    """
+
+    def __init__(
+        self,
+        maxsize: int = 2000,
+        ttl: float = SEARCH_TTL,
+        empty_ttl: float = EMPTY_TTL,
+        max_bytes: int = 64 * 1024 * 1024,
+    ):
+        self.cache = TTLCache(
+            maxsize,
+            ttl,
+            max_bytes=max_bytes,
+            sizeof=lambda p: max(payload_tracks(p), 1) * TRACK_PAYLOAD_SIZE,
+        )
+        self.empty_ttl = empty_ttl
+        self.searches: int = 0
+        self.requests: int = 0
+        self.coalesced: int = 0
+        # Album, playlist and artist searches resolved without loading their URL
+        self.single_requests: int = 0
+        self._inflight: dict[tuple, asyncio.Task] = {}
+
+    @property
+    def hit_ratio(self) -> float:
+        """Share of the searches answered without a new Lavalink request"""
+        served = self.cache.hits + self.coalesced
+        return served / self.searches if self.searches else 0.0
+
+    @staticmethod
+    def cache_key(
+        query: str, source: Optional[str], search_type: SearchType
+    ) -> tuple[str, str, str]:
+        query = query.strip()
+        if URL_REGEX.match(query):
+            return ("url", "", query)
+        source = normalize_source(source)
+        if search_type is not SearchType.Track and source not in LOADSEARCH_SOURCES:
+            source = DEFAULT_SOURCE
+        return (search_type.value, source, normalize_query(query))
+
+    async def search(
+        self,
+        query: str,
+        *,
+        source: Optional[str] = None,
+        search_type: SearchType = SearchType.Track,
+        node: Optional[wavelink.Node] = None,
+    ) -> wavelink.Search:
+        """|coro|
+
+        Search a query or load a link, ``source`` and ``search_type`` are
+        ignored for links.
+
+        Raises: LavalinkLoadException
+        """
+        self.searches += 1
+        key = self.cache_key(query, source, search_type)
+        payload = self.cache.get(key)
+        if payload is None:
+            task = self._inflight.get(key)
+            if task is None:
+                node = node or node_scheduler.best("search")
+                task = asyncio.create_task(self._fetch(key, query.strip(), node))
+                self._inflight[key] = task
+                task.add_done_callback(lambda _: self._inflight.pop(key, None))
+            else:
+                self.coalesced += 1
+            # A cancelled caller doesn't cancel the search of the others
+            payload = await asyncio.shield(task)
+        return to_search(payload)
+
+    async def _fetch(
+        self, key: tuple[str, str, str], query: str, node: wavelink.Node
+    ) -> dict:
+        # The key is only normalised for the cache, the node gets the query
+        # as it was typed
+        kind, source, _ = key
+        if kind == "url":
+            payload = await self._load(node, query)
+        elif kind == SearchType.Track.value:
+            payload = await self._load(node, f"{source}{query}")
+        else:
+            payload = await self._load_search(node, f"{source}{query}", SearchType(kind))
+
+        if payload["loadType"] == "error":
+            return payload
+        if payload_tracks(payload) == 0:
+            self.cache.set(key, payload, ttl=self.empty_ttl)
+        elif not (payload["loadType"] == "track" and payload["data"]["info"]["isStream"]):
+            self.cache.set(key, payload)
+        return payload
+
+    async def _load(self, node: wavelink.Node, identifier: str) -> dict:
+        self.requests += 1
+        return await node.send(path="v4/loadtracks", params={"identifier": identifier})
+
+    async def _load_search(
+        self, node: wavelink.Node, search: str, search_type: SearchType
+    ) -> dict:
+        """Load the first album, playlist or artist found.
+
+        Its tracks are used as they are when the node returned all of them,
+        otherwise its URL is loaded."""
+        self.requests += 1
+        field = LOADSEARCH_TYPES[search_type]
+        data = await node.send(
+            path="v4/loadsearch",
+            params={"query": search, "types": [field.removesuffix("s")]},
+        )
+        if not data or len(data.get(field) or ()) < 1:
+            return EMPTY_PAYLOAD
+        hit = data[field][0]
+        tracks = hit.get("tracks") or ()
+        total = (hit.get("pluginInfo") or {}).get("totalTracks")
+        if tracks and (total is None or total <= len(tracks)):
+            self.single_requests += 1
+            return {"loadType": "playlist", "data": hit}
+        url = wavelink.Playlist(hit).url
+        if url is None:
+            return EMPTY_PAYLOAD
+        return await self._load(node, url)
+
+
+search_service = SearchService()
+
+
+__all__ = [
+    "URL_REGEX",
+    "SearchService",
+    "normalize_query",
+    "normalize_source",
+    "search_service",
+    "to_search",
+]
@@ -0,0 +1,196 @@
+"""Pure-Python decoder for Lavalink encoded tracks.
+
+Lavalink encodes tracks with lavaplayer's ``MessageOutput`` format:
+
+- A message header: a big-endian int whose two high bits are flags and the
+  rest is the message size.
+- The track info fields. Newer versions append more fields (uri, artwork, isrc).
+- Source specific fields written by the source manager (e.g. LavaSrc).
+- The track position.
+"""
+
+import base64
+import binascii
+import hashlib
+import struct
+from typing import Iterable, Optional
+
+TRACK_INFO_VERSIONED = 1
+SUPPORTED_VERSIONS = frozenset({1, 2, 3})
+
+# Sources that don't write any extra field
+PLAIN_SOURCES = frozenset({"youtube", "soundcloud", "bandcamp", "vimeo", "twitch"})
+# Sources that write a probe info string (container format)
+PROBE_SOURCES = frozenset({"http", "local"})
+# LavaSrc sources, they write album/artist info used as ``pluginInfo``
+LAVASRC_SOURCES = frozenset(
+    {"spotify", "applemusic", "deezer", "yandexmusic", "vkmusic", "tidal", "qobuz"}
+)
+
+
+class TrackDecodeError(ValueError):
+    """The track can't be decoded locally and should be decoded by the node"""
+
+
+class _Reader:
+    __slots__ = ("data", "pos")
+
+    def __init__(self, data: bytes):
+        self.data = data
+        self.pos = 0
+
+    def _read(self, fmt: struct.Struct):
+        try:
+            value = fmt.unpack_from(self.data, self.pos)[0]
+        except struct.error as e:
+            raise TrackDecodeError("Unexpected end of data") from e
+        self.pos += fmt.size
+        return value
+
+    def read_byte(self) -> int:
+        return self._read(_UBYTE)
+
+    def read_bool(self) -> bool:
+        return self._read(_UBYTE) != 0
+
+    def read_int(self) -> int:
+        return self._read(_INT)
+
+    def read_long(self) -> int:
+        return self._read(_LONG)
+
+    def read_utf(self) -> str:
+        size = self._read(_USHORT)
+        end = self.pos + size
+        if end > len(self.data):
+            raise TrackDecodeError("Unexpected end of data")
+        raw = self.data[self.pos : end]
+        self.pos = end
+        return _decode_modified_utf8(raw)
+
+    def read_nullable_utf(self) -> Optional[str]:
+        return self.read_utf() if self.read_bool() else None
+
+
+_UBYTE = struct.Struct(">B")
+_USHORT = struct.Struct(">H")
+_INT = struct.Struct(">i")
+_LONG = struct.Struct(">q")
+
+
+def _decode_modified_utf8(raw: bytes) -> str:
+    """Decode java's modified UTF-8 (``DataOutput.writeUTF``)"""
+    try:
+        return raw.decode("utf-8")
+    except UnicodeDecodeError:
+        pass
+    # Null chars are written as C0 80 and supplementary chars as surrogate pairs
+    try:
+        text = raw.replace(b"\xc0\x80", b"\x00").decode("utf-8", "surrogatepass")
+        return text.encode("utf-16", "surrogatepass").decode("utf-16")
+    except UnicodeError as e:
+        raise TrackDecodeError("Invalid string") from e
+
+
+def _read_plugin_info(reader: _Reader, source: str) -> dict:
+    if source in PLAIN_SOURCES:
+        return {}
+    if source in PROBE_SOURCES:
+        reader.read_utf()
+        return {}
+    if source in LAVASRC_SOURCES:
+        return {
+            "albumName": reader.read_nullable_utf(),
+            "albumUrl": reader.read_nullable_utf(),
+            "artistUrl": reader.read_nullable_utf(),
+            "artistArtworkUrl": reader.read_nullable_utf(),
+            "previewUrl": reader.read_nullable_utf(),
+            "isPreview": reader.read_bool(),
+        }
+    raise TrackDecodeError(f"Unknown source: {source}")
+
+
+def track_hash(encoded: str) -> bytes:
+    """Hash of the raw bytes of a base64 track"""
+    try:
+        raw = base64.b64decode(encoded, validate=True)
+    except (binascii.Error, ValueError):
+        raw = encoded.encode()
+    return hashlib.blake2b(raw, digest_size=16).digest()
+
+
+def decode_track(encoded: str) -> dict:
+    """Decode a base64 track into a ``wavelink.Playable`` compatible dict.
+
+    Raises: TrackDecodeError
+    """
+    try:
+        data = base64.b64decode(encoded, validate=True)
+    except (binascii.Error, ValueError) as e:
+        raise TrackDecodeError("Invalid base64 data") from e
+    reader = _Reader(data)
+    header = reader.read_int()
+    flags = (header >> 30) & 0x3
+    size = header & 0x3FFFFFFF
+    if reader.pos + size != len(data):
+        raise TrackDecodeError("Message size mismatch")
+
+    version = reader.read_byte() if flags & TRACK_INFO_VERSIONED else 1
+    if version not in SUPPORTED_VERSIONS:
+        raise TrackDecodeError(f"Unsupported track version: {version}")
+
+    title = reader.read_utf()
+    author = reader.read_utf()
+    length = reader.read_long()
+    identifier = reader.read_utf()
+    is_stream = reader.read_bool()
+    uri = reader.read_nullable_utf() if version >= 2 else None
+    artwork_url = reader.read_nullable_utf() if version >= 3 else None
+    isrc = reader.read_nullable_utf() if version >= 3 else None
+    source = reader.read_utf()
+    plugin_info = _read_plugin_info(reader, source)
+    position = reader.read_long()
+    if reader.pos != len(data):
+        raise TrackDecodeError("Unexpected trailing data")
+
+    return {
+        "encoded": encoded,
+        "info": {
+            "identifier": identifier,
+            "isSeekable": not is_stream,
+            "author": author,
+            "length": length,
+            "isStream": is_stream,
+            "position": position,
+            "title": title,
+            "uri": uri,
+            "artworkUrl": artwork_url,
+            "isrc": isrc,
+            "sourceName": source,
+        },
+        "pluginInfo": plugin_info,
+        "userData": {},
+    }
+
+
+def decode_many(encoded: Iterable[str]) -> list[Optional[dict]]:
+    """Decode many tracks at once.
+
+    The result keeps the input order, tracks that can't be decoded locally are ``None``.
+    """
+    results: list[Optional[dict]] = []
+    append = results.append
+    for e in encoded:
+        try:
+            append(decode_track(e))
+        except TrackDecodeError:
+            append(None)
+    return results
+
+
+__all__ = [
+    "TrackDecodeError",
+    "track_hash",
+    "decode_track",
+    "decode_many",
+]
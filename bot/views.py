@@ -1,16 +1,18 @@
+import asyncio
+import io
+import logging
 import math
 import traceback
 import aiohttp
 import discord
 from wavelink import Playable
 import wavelink
-from bot.misc import (
-    get_color_from_source,
-    get_logo_path_from_source,
-    truncate_string,
-)
+from bot.misc import get_color_from_source, truncate_string
+from .cards import card_renderer
+from .edits import edit_scheduler
 from .player import CustomPlayer
-from easy_pil import Editor, Font, load_image_async
+
+logger = logging.getLogger("bot")
 
 API_URL = "http://localhost:8000"
 
@@ -135,6 +137,8 @@ class QueueView(BasePagination):
 
 
 class CustomPlaylistPagination(BasePagination):
+    PAGE_SIZE = 10
+
     def __init__(self, plid: int, userid: str):
         self.userid = userid
         self.current_pag: int = 1
@@ -146,8 +150,11 @@ class CustomPlaylistPagination(BasePagination):
         self.plname: str = None
         self.pldesc: str | None = None
         self.plartworkurl: str | None = None
-        self.tracks: list[tuple[dict]] = []
-        self.pltotaltracks: int = None
+        # Pages are fetched on demand: page number -> track metadata
+        self.tracks: dict[int, list[dict]] = {}
+        self.pltotaltracks: int = 0
+        self.has_next: dict[int, bool] = {}
+        self._loading: dict[int, asyncio.Task] = {}
 
     async def setup(self):
         async with aiohttp.ClientSession(API_URL) as session:
@@ -159,27 +166,62 @@ class CustomPlaylistPagination(BasePagination):
                 self.plname = pl_data[2]
                 self.pldesc = pl_data[3]
                 self.plartworkurl = pl_data[4]
-            async with session.get(f"/playlist/{self.plid}/tracks/") as response:
-                if response.status == 200:
-                    resp = await response.json()
-                    node = wavelink.Pool.get_node()
-                    b64tracks = tuple(t[1]["track"] for t in resp)
-                    if  b64tracks and len(b64tracks) > 0:   
-                        track_data = await node.send("POST",path="v4/decodetracks", data=b64tracks)
-                        self.tracks.extend(track_data)
-                self.pltotaltracks = len(self.tracks) if self.tracks else 0
-
+            async with session.get(f"/playlist/{self.plid}/summary") as response:
+                self.pltotaltracks = (await response.json())["total_tracks"]
+        await self._load_page(1)
         self._update_buttons()
 
-    def _update_buttons(self):
-        self.pages = math.ceil(self.pltotaltracks / 10)
-        if self.pages == 0:
-            self.pages = 1
+    def _load_page(self, page: int) -> asyncio.Task:
+        task = self._loading.get(page)
+        # Failed or cancelled fetches are retried
+        if task is None or (
+            task.done() and (task.cancelled() or task.exception() is not None)
+        ):
+            task = self._loading[page] = asyncio.create_task(self._fetch_page(page))
+            task.add_done_callback(self._page_loaded)
+        return task
+
+    def _page_loaded(self, task: asyncio.Task):
+        # Prefetched pages aren't awaited, their errors are retrieved here
+        if not task.cancelled() and task.exception() is not None:
+            logger.warning(
+                "Can't fetch a page of playlist %s: %r", self.plid, task.exception()
+            )
 
+    async def on_timeout(self):
+        for task in self._loading.values():
+            task.cancel()
+
+    async def _fetch_page(self, page: int):
+        # Keyset pagination: the page starts after the last track of the previous one
+        params = {"limit": self.PAGE_SIZE + 1}
+        if page > 1:
+            previous = self.tracks[page - 1]
+            if not previous:
+                # The tracks were deleted meanwhile
+                self.tracks[page] = []
+                self.has_next[page] = False
+                return
+            params["after"] = previous[-1]["id"]
+            params["after_position"] = previous[-1]["position"]
+        async with aiohttp.ClientSession(API_URL) as session:
+            async with session.get(
+                f"/playlist/{self.plid}/tracks", params=params
+            ) as response:
+                resp = await response.json() if response.status == 200 else []
+        self.tracks[page] = resp[: self.PAGE_SIZE]
+        self.has_next[page] = len(resp) > self.PAGE_SIZE
+
+    def _update_buttons(self):
         self.go_back.disabled = True if self.current_pag == 1 else False
-        self.go_next.disabled = True if self.current_pag == self.pages else False
+        self.go_next.disabled = not self.has_next.get(self.current_pag, False)
 
     async def get_embed(self):
+        await self._load_page(self.current_pag)
+        if self.has_next[self.current_pag]:
+            # Prefetch the next page
+            self._load_page(self.current_pag + 1)
+        self._update_buttons()
         return await self._generate_embed()
 
     async def _generate_embed(self) -> discord.Embed:
@@ -190,12 +232,18 @@ class CustomPlaylistPagination(BasePagination):
             description="Item | Title",
             color=discord.Color.random(),
         )
-        if self.pltotaltracks > 0:
-            for i, track in enumerate(
-                self.tracks[self.start : self.end], start=self.start
-            ):
-                embed.description += f"\n**{i+1}-** [{track['info']['title']}]({track['info']['uri']})"
-            embed.set_footer(text=f"Pag {self.current_pag} of {self.pages}")
+        tracks = self.tracks.get(self.current_pag)
+        if tracks:
+            for i, track in enumerate(tracks, start=self.start):
+                title = track["title"] or "Unknown track"
+                embed.description += (
+                    f"\n**{i+1}-** [{title}]({track['uri']})"
+                    if track["uri"]
+                    else f"\n**{i+1}-** `{title}`"
+                )
+            embed.set_footer(
+                text=f"Pag {self.current_pag} of {max(math.ceil(self.pltotaltracks / 10), 1)}"
+            )
         else:
             embed.description += "\nYour playlist is empty!"
         return embed
@@ -301,66 +349,22 @@ class PlayerButtons(discord.ui.View):
         self.player = player
         super().__init__(timeout=None)
 
-    async def get_img(self):
-        current = self.player.current
-
-        # Configuración de tamaños y posiciones
-        BG_SIZE = (350, 180)
-        LOGO_SIZE = (30, 30)
-        TRACK_IMG_SIZE = (100, 100)
-        BOT_LOGO_SIZE = (25, 25)
-
-        # Cargar la imagen de fondo
-        bg = Editor("./bot/img/track_start_bg.png").resize(BG_SIZE)
-
-        # Insertar logo de la fuente (Spotify, YouTube, etc.)
-        logo = (
-            Editor(get_logo_path_from_source(current.source))
-            .circle_image()
-            .resize(LOGO_SIZE)
+    async def get_img(self) -> bytes | None:
+        return await card_renderer.render(
+            self.player.current, self.player.client.user.display_avatar.url
         )
-        bg.paste(logo, (10, 10))
-
-        # Definir fuentes
-        font_bold = Font.poppins(variant="bold", size=15)
-        font_light = Font.poppins(size=16, variant="light")
-        font_italic = Font.poppins(size=14, variant="italic")
-
-        # Texto principal
-        bg.text((50, 17), "Now playing...", font=font_bold, color="white")
-
-        # Marco para la imagen del track
-        bg.rectangle((7, 47), width=105, height=106, color="lightgray", stroke_width=1)
-
-        # Barra de color lateral
-        color_rgb = get_color_from_source(current.source).to_rgb()
-        bg.rectangle((0, 0), width=3, height=180, color=color_rgb, stroke_width=1)
 
-        # Insertar imagen del track si está disponible
-        if current.artwork:
-            track_img = await load_image_async(current.artwork)
-            if track_img:
-                track_logo = Editor(track_img).resize(TRACK_IMG_SIZE)
-                bg.paste(track_logo, (10, 50))
-
-        # Insertar logo del bot
-        bot_logo_img = await load_image_async(
-            self.player.client.user.display_avatar.url
-        )
-        if bot_logo_img:
-            bot_logo = Editor(bot_logo_img).circle_image().resize(BOT_LOGO_SIZE)
-            bg.paste(bot_logo, (195, 145))
-
-        # Texto del pie
-        bg.text((225, 150), "RumbleBot", font=font_light, color="white")
-        bg.text(
-            (120, 70), truncate_string(current.title), font=font_light, color="white"
-        )
-        bg.text(
-            (120, 100), truncate_string(current.author), font=font_italic, color="white"
+    def get_text_embed(self) -> discord.Embed:
+        """Text-only now playing message, used when the card can't be rendered"""
+        current = self.player.current
+        embed = discord.Embed(
+            title="Now playing...",
+            description=f"💿 [{truncate_string(current.title, 40)}]({current.uri})\n{truncate_string(current.author, 40)}",
+            color=get_color_from_source(current.source),
         )
-
-        return bg
+        if current.artwork:
+            embed.set_thumbnail(url=current.artwork)
+        return embed
 
     def _update_buttons(self):
         self.prev_song.disabled = len(self.player.backpack) < 1
@@ -380,17 +384,26 @@ class PlayerButtons(discord.ui.View):
     async def update_menu(self):
         channel = self.player.fetch("channel")
         track_start_img = await self.get_img()
-        file = discord.File(fp=track_start_img.image_bytes, filename="img.png")
+        if track_start_img is None:
+            content = {"embed": self.get_text_embed()}
+        else:
+            content = {
+                "files": (
+                    discord.File(
+                        fp=io.BytesIO(track_start_img), filename=card_renderer.filename
+                    ),
+                )
+            }
 
         old_message: discord.Message = self.player.fetch("message")
         if old_message:
             self.player.remove_key("menu")
             self.player.remove_key("message")
-            await old_message.edit(view=None)
+            edit_scheduler.edit(old_message, view=None)
 
         buttons = PlayerButtons(self.player)
         buttons._update_buttons()
-        buttons.message = await channel.send(silent=True, view=buttons, files=(file,))
+        buttons.message = await channel.send(silent=True, view=buttons, **content)
         self.player.store("menu", buttons)
         self.player.store("message", buttons.message)
 
@@ -1,19 +1,26 @@
 import discord
-from fastapi import Header, FastAPI, Request, HTTPException
-import asqlite
+from fastapi import Header, FastAPI, Query, Request, HTTPException
+import bot.dbmanager as dbmanager
 from discord import Embed
 import wavelink
 from discord.ext import commands
 import yaml
 import asyncio
+import logging
 from uvicorn import Config, Server
 from pydantic import BaseModel
 
 
+logger = logging.getLogger("bot")
+
 # Misc
 
 with open("config.yml") as f:
-    MASTER_KEY = yaml.safe_load(f)["masterKey"]
+    CONFIG = yaml.safe_load(f)
+    MASTER_KEY = CONFIG["masterKey"]
+    PLAYLIST_TRACK_LIMIT: int = CONFIG.get("playlistTrackLimit", 5000)
+
+MAX_PAGE_SIZE = 100
 
 
 def format_result(data: list):
@@ -24,6 +31,18 @@ def format_result(data: list):
     }
 
 
+def format_track_metadata(data: list):
+    return {
+        "id": data[0],
+        "title": data[1],
+        "author": data[2],
+        "length_ms": data[3],
+        "source": data[4],
+        "uri": data[5],
+        "position": data[6],
+    }
+
+
 # Models
 
 
@@ -42,6 +61,12 @@ class CreatePlaylistPayload(BaseModel):
 class AddTrackPayload(BaseModel):
     user_id: str
     encoded: str
+    # Used when the track can't be decoded by the API
+    title: str | None = None
+    author: str | None = None
+    length_ms: int | None = None
+    source: str | None = None
+    uri: str | None = None
 
 
 class AddTracksPayload(BaseModel):
@@ -71,11 +96,43 @@ async def is_playlist_owner(cur, pl_id: int, user_id: str):
     return await cur.fetchone() is not None
 
 
+def track_row_metadata(track: AddTrackPayload) -> tuple:
+    """``(title, author, length_ms, source, uri)`` of a track to insert"""
+    metadata = dbmanager.track_metadata(track.encoded)
+    if metadata[0] is None:
+        return (track.title, track.author, track.length_ms, track.source, track.uri)
+    return metadata
+
+
+async def playlist_blob_ids(cur, pl_id: int) -> list[int]:
+    """Blob ids used by a playlist, they may be orphaned when it's cleared"""
+    await cur.execute("SELECT DISTINCT blob_id FROM tracks WHERE plid=?", (pl_id,))
+    return [r[0] for r in await cur.fetchall()]
+
+
+async def check_track_limit(cur, pl_id: int, new_tracks: int) -> int:
+    """Raise a HTTPException if the playlist can't fit ``new_tracks`` more tracks.
+
+    Returns the last track position of the playlist"""
+    await cur.execute(
+        "SELECT COUNT(*), COALESCE(MAX(position), 0) FROM tracks WHERE plid=?",
+        (pl_id,),
+    )
+    total, last_position = await cur.fetchone()
+    if total + new_tracks > PLAYLIST_TRACK_LIMIT:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Playlists can't have more than {PLAYLIST_TRACK_LIMIT} tracks.",
+        )
+    return last_position
+
+
 class RumbleBotAPI(commands.Cog):
     def __init__(self, bot: commands.Bot):
         super().__init__()
         self.bot = bot
         self.server: Server = None
+        self.backfill_task: asyncio.Task | None = None
 
     async def start_app(self):
         await self.bot.wait_until_ready()
@@ -88,7 +145,7 @@ class RumbleBotAPI(commands.Cog):
 
         @app.get("/playlist/{pl_id}")
         async def get_user_playlist(pl_id:int,data: GetPlaylistPayload):
-            async with asqlite.connect("userplaylists.db") as conn:
+            async with dbmanager.acquire(dbmanager.PLAYLISTS_DB) as conn:
                 async with conn.cursor() as cur:
                     if data.user_id is not None:
                         await cur.execute(
@@ -108,7 +165,7 @@ class RumbleBotAPI(commands.Cog):
 
         @app.post("/playlist/")
         async def create_playlist(payload: CreatePlaylistPayload):
-            async with asqlite.connect("userplaylists.db") as conn:
+            async with dbmanager.acquire(dbmanager.PLAYLISTS_DB) as conn:
                 async with conn.cursor() as cur:
                     await cur.execute(
                         "INSERT INTO playlists (userid, name, description, thumbnail_url) VALUES (?, ?, ?, ?)",
@@ -123,20 +180,77 @@ class RumbleBotAPI(commands.Cog):
                     return {"pl_id": cur.get_cursor().lastrowid}
 
         @app.get("/playlist/{pl_id}/tracks")
-        async def get_pl_tracks(pl_id: int):
-            async with asqlite.connect("userplaylists.db") as conn:
+        async def get_pl_tracks(
+            pl_id: int,
+            after: int | None = None,
+            after_position: int | None = None,
+            limit: int | None = Query(None, ge=1, le=MAX_PAGE_SIZE),
+        ):
+            """Tracks of a playlist, in order.
+
+            Use ``limit`` to fetch a single page, and ``after`` (a track id)
+            with ``after_position`` (its position) for the next pages. The
+            cursor still works when that track was deleted; without
+            ``after_position`` an unknown track is a 404."""
+            async with dbmanager.acquire(dbmanager.PLAYLISTS_DB) as conn:
                 async with conn.cursor() as cur:
-                    await cur.execute("SELECT * FROM tracks WHERE plid=?", (pl_id,))
+                    if after is None and limit is None:
+                        await cur.execute(
+                            """SELECT t.id, t.plid, t.userid, b.kind, b.data FROM tracks t
+                               JOIN track_blobs b ON b.id = t.blob_id
+                               WHERE t.plid=? ORDER BY t.position""",
+                            (pl_id,),
+                        )
+                    else:
+                        # Pages only return the track metadata
+                        limit = limit or MAX_PAGE_SIZE
+                        if after is None:
+                            await cur.execute(
+                                """SELECT id, title, author, length_ms, source, uri, position FROM tracks
+                                   WHERE plid=? ORDER BY position, id LIMIT ?""",
+                                (pl_id, limit),
+                            )
+                        else:
+                            if after_position is None:
+                                row = await conn.fetchone(
+                                    "SELECT position FROM tracks WHERE id=? AND plid=?",
+                                    (after, pl_id),
+                                )
+                                if row is None:
+                                    raise HTTPException(404)
+                                after_position = row[0]
+                            await cur.execute(
+                                """SELECT id, title, author, length_ms, source, uri, position FROM tracks
+                                   WHERE plid=? AND (position, id) > (?, ?)
+                                   ORDER BY position, id LIMIT ?""",
+                                (pl_id, after_position, after, limit),
+                            )
+                        return [format_track_metadata(r) for r in await cur.fetchall()]
                     result = await cur.fetchall()
                     if result is not None:
                         # r[0] = trackId 
                         # r[1:] = {"plId": 1234, "userId": '123', "track": "QAAA.."}
-                        data = ((r[0], format_result(r[1:])) for r in result)
+                        data = (
+                            (r[0], format_result((r[1], r[2], dbmanager.unpack_track(r[3], r[4]))))
+                            for r in result
+                        )
 
                         return tuple(data)
                     else:
                         raise HTTPException(404)
 
+        @app.get("/playlist/{pl_id}/summary")
+        async def get_pl_summary(pl_id: int):
+            async with dbmanager.acquire(dbmanager.PLAYLISTS_DB) as conn:
+                total_tracks, total_length_ms = await conn.fetchone(
+                    "SELECT COUNT(*), COALESCE(SUM(length_ms), 0) FROM tracks WHERE plid=?",
+                    (pl_id,),
+                )
+                return {
+                    "total_tracks": total_tracks,
+                    "total_length_ms": total_length_ms,
+                }
+
         @app.post("/playlist/{pl_id}/track")
         async def add_track_to_pl(
             pl_id: int,
@@ -148,19 +262,23 @@ class RumbleBotAPI(commands.Cog):
                     status_code=403, detail="Master key is missing or incorrect."
                 )
 
-            async with asqlite.connect("userplaylists.db") as conn:
-                async with conn.cursor() as cur:
+            async with dbmanager.acquire(dbmanager.PLAYLISTS_DB) as conn:
+                async with dbmanager.write_transaction(conn) as cur:
                     if await is_playlist_owner(cur, pl_id, payload.user_id):
-                        sql = (
-                            "INSERT INTO tracks(plid, userid, encoded) VALUES (?, ?, ?)"
+                        last_position = await check_track_limit(cur, pl_id, 1)
+                        (blob_id,) = await dbmanager.store_track_blobs(
+                            conn, (payload.encoded,)
                         )
+                        sql = """INSERT INTO tracks(plid, userid, blob_id, position, title, author, length_ms, source, uri)
+                                 VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)"""
                         params = (
                             pl_id,
                             payload.user_id,
-                            payload.encoded,
+                            blob_id,
+                            last_position + 1,
+                            *track_row_metadata(payload),
                         )
                         await cur.execute(sql, params)
-                        await conn.commit()
                         return 200
                     else:
                         return HTTPException(
@@ -177,21 +295,43 @@ class RumbleBotAPI(commands.Cog):
                 raise HTTPException(
                     status_code=403, detail="Master key is missing or incorrect."
                 )
-            async with asqlite.connect("userplaylists.db") as conn:
-                async with conn.cursor() as cur:
-                    if await is_playlist_owner(cur, pl_id, payload.user_id):
-                        for track in payload.tracks:
-                            sql = "INSERT INTO tracks(plid, userid, encoded) VALUES (?, ?, ?)"
-                            params = (
+            async with dbmanager.acquire(dbmanager.PLAYLISTS_DB) as conn:
+                # The whole payload is inserted in a single transaction
+                async with dbmanager.write_transaction(conn) as cur:
+                    if not await is_playlist_owner(cur, pl_id, payload.user_id):
+                        raise HTTPException(403, detail="You don't own that playlist")
+                    if not payload.tracks:
+                        return {"track_ids": []}
+                    last_position = await check_track_limit(
+                        cur, pl_id, len(payload.tracks)
+                    )
+                    blob_ids = await dbmanager.store_track_blobs(
+                        conn, [track.encoded for track in payload.tracks]
+                    )
+                    await cur.executemany(
+                        """INSERT INTO tracks(plid, userid, blob_id, position, title, author, length_ms, source, uri)
+                           VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+                        (
+                            (
                                 pl_id,
                                 payload.user_id,
-                                track.encoded,
+                                blob_id,
+                                position,
+                                *track_row_metadata(track),
                             )
-                            await cur.execute(sql, params)
-                            await conn.commit()
-                        return 200
-                    else:
-                        return HTTPException(403, detail="You don't own that playlist")
+                            for position, (track, blob_id) in enumerate(
+                                zip(payload.tracks, blob_ids), start=last_position + 1
+                            )
+                        ),
+                    )
+                    # Ids are consecutive, nothing else can write in this transaction
+                    await cur.execute("SELECT last_insert_rowid()")
+                    last_id = (await cur.fetchone())[0]
+                    return {
+                        "track_ids": list(
+                            range(last_id - len(payload.tracks) + 1, last_id + 1)
+                        )
+                    }
 
         @app.patch("/playlist/{pl_id}")
         async def edit_playlist(
@@ -209,7 +349,7 @@ class RumbleBotAPI(commands.Cog):
             set_clause = ', '.join([f'{k}=?' for k,v in data.items() if v])
             values = tuple(v for v in data.values() if v)
             query = f"UPDATE playlists SET {set_clause} WHERE id={pl_id}"
-            async with asqlite.connect("userplaylists.db") as db:
+            async with dbmanager.acquire(dbmanager.PLAYLISTS_DB) as db:
                 await db.execute(query, tuple(values))
                 await db.commit()
                 return {"edited": tuple(k for k,v in data.items() if v)}
@@ -225,10 +365,11 @@ class RumbleBotAPI(commands.Cog):
                 raise HTTPException(
                     status_code=403, detail="Master key is missing or incorrect."
                 )
-            async with asqlite.connect("userplaylists.db") as conn:
-                async with conn.cursor() as cur:
+            async with dbmanager.acquire(dbmanager.PLAYLISTS_DB) as conn:
+                async with dbmanager.write_transaction(conn) as cur:
                     if await is_playlist_owner(cur, pl_id, payload.user_id):
-                        await cur.execute("DELETE FROM tracks WHERE plid=?", (pl_id,))
+                        blob_ids = await playlist_blob_ids(cur, pl_id)
+                        # Tracks are deleted on cascade
                         await cur.execute(
                             "DELETE FROM playlists WHERE id=? AND userid=?",
                             (
@@ -236,9 +377,10 @@ class RumbleBotAPI(commands.Cog):
                                 payload.user_id,
                             ),
                         )
-                        return 200
                     else:
                         raise HTTPException(404)
+            await dbmanager.delete_orphan_blobs(blob_ids)
+            return 200
 
         @app.delete("/playlist/{pl_id}/tracks")
         async def clear_playlist_tracks(pl_id: int,payload: ClearPlaylistPayload,  master_key: str | None = Header(default=None, alias="master-key")):
@@ -246,10 +388,11 @@ class RumbleBotAPI(commands.Cog):
                 raise HTTPException(
                     status_code=403, detail="Master key is missing or incorrect."
                 )
-             async with asqlite.connect("userplaylists.db") as conn:
-                async with conn.cursor() as cur:
+             async with dbmanager.acquire(dbmanager.PLAYLISTS_DB) as conn:
+                async with dbmanager.write_transaction(conn) as cur:
+                    blob_ids = await playlist_blob_ids(cur, pl_id)
                     await cur.execute("DELETE FROM tracks WHERE plid=? AND userid=?", (pl_id,payload.user_id))
-                    await conn.commit()
+             await dbmanager.delete_orphan_blobs(blob_ids)
 
         @app.get("/player/")
         async def test(
@@ -268,6 +411,9 @@ class RumbleBotAPI(commands.Cog):
             else:
                 raise HTTPException(404)
 
+        self.backfill_task = asyncio.create_task(dbmanager.backfill_track_metadata())
+        self.backfill_task.add_done_callback(self._backfill_done)
+
         cfg = Config(app, host="0.0.0.0")
         server = Server(cfg)
         self.server = server
@@ -276,7 +422,17 @@ class RumbleBotAPI(commands.Cog):
     async def cog_load(self):
         self.bot.loop.create_task(self.start_app())
 
+    def _backfill_done(self, task: asyncio.Task):
+        if task.cancelled():
+            return
+        if task.exception() is not None:
+            logger.error("Track metadata backfill failed", exc_info=task.exception())
+        else:
+            logger.info("Track metadata backfill updated %s tracks", task.result())
+
     async def cog_unload(self):
+        if self.backfill_task is not None:
+            self.backfill_task.cancel()
         await self.server.shutdown()
 
 
@@ -3,6 +3,12 @@ import bot.player as customplayer
 import bot.views as views
 import bot.enums as misc_enums
 import bot.dbmanager as dbmanager
+from bot.edits import edit_scheduler
+from bot.artwork import artwork_fetcher
+from bot.cards import card_renderer
+from bot.search import search_service
+from bot.autocomplete import query_suggester
+from bot.nodes import node_scheduler
 from bot.misc import (
     cooldown_for_vote,
     cog_app_command_error_handler,
@@ -17,18 +23,16 @@ import wavelink
 import yaml
 from discord.ext import commands
 import discord
-import re
 import asyncio
+import logging
 from discord import app_commands
 
+logger = logging.getLogger("bot")
+
 
 with open("config.yml") as cfg:
     CONFIG = yaml.safe_load(cfg)
 
-URL_REGEX = re.compile(
-    r"https?:\/\/(www\.)?[-a-zA-Z0-9@:%._\+~#=]{1,256}\.[a-zA-Z0-9()]{1,6}\b([-a-zA-Z0-9()@:%_\+.~#?&//=]*)"
-)
-
 
 class Music(commands.Cog):
     def __init__(self, bot: commands.Bot):
@@ -36,18 +40,27 @@ class Music(commands.Cog):
 
     async def cog_load(self) -> None:
         print("[Music] Loading...")
-        await dbmanager.dbsetup()
+        if not len(query_suggester.index):
+            await query_suggester.load()
         if not wavelink.Pool.nodes:
             nodes = [wavelink.Node(**i) for i in CONFIG["llnodes"]]
             await wavelink.Pool.connect(nodes=nodes, client=self.bot)
         else:
             await wavelink.Pool.reconnect()
+        node_scheduler.start()
 
+        card_renderer.start(
+            workers=CONFIG.get("cardWorkers", 2),
+            image_format=CONFIG.get("cardFormat", "png"),
+        )
+        customplayer.CustomPlayer.history_depth = CONFIG.get("playerHistoryDepth", 50)
         print("[Music] Sucess!")
 
     async def cog_unload(self) -> None:
+        await card_renderer.close()
+        node_scheduler.stop()
+        # dbmanager isn't reloaded, its pools are owned by the bot
         importlib.reload(customplayer)
-        importlib.reload(dbmanager)
         importlib.reload(misc_enums)
         importlib.reload(views)
 
@@ -65,6 +78,33 @@ class Music(commands.Cog):
     @commands.Cog.listener()
     async def on_wavelink_node_ready(self, payload: wavelink.NodeReadyEventPayload):
         print(f"Node {payload.node.identifier} is ready!")
+        await node_scheduler.probe(payload.node)
+
+    @commands.Cog.listener()
+    async def on_wavelink_stats_update(self, payload: wavelink.StatsEventPayload):
+        node = node_scheduler.on_stats(payload)
+        if node is not None:
+            logger.warning("Node %s has a sustained frame deficit", node.identifier)
+            await node_scheduler.evacuate(node, self._node_players(node))
+
+    @commands.Cog.listener()
+    async def on_wavelink_node_disconnected(
+        self, payload: wavelink.NodeDisconnectedEventPayload
+    ):
+        players = self._node_players(payload.node)
+        if players:
+            logger.warning(
+                "Node %s disconnected, moving %s players", payload.node.identifier, len(players)
+            )
+            await node_scheduler.evacuate(payload.node, players, disconnect=True)
+
+    def _node_players(self, node: wavelink.Node) -> list[customplayer.CustomPlayer]:
+        # The node forgets its players when its websocket is closed
+        return [
+            vc
+            for vc in self.bot.voice_clients
+            if isinstance(vc, customplayer.CustomPlayer) and vc.node is node
+        ]
 
     @commands.Cog.listener()
     async def on_wavelink_track_start(self, payload: wavelink.TrackStartEventPayload):
@@ -74,6 +114,10 @@ class Music(commands.Cog):
         buttons = views.PlayerButtons(player)
         
         asyncio.create_task(buttons.update_menu())
+        query_suggester.add_track(payload.track)
+        # The next card is rendered without waiting for its artwork
+        if player.queue and (artwork := player.queue.peek(0).artwork):
+            artwork_fetcher.prefetch(artwork)
 
     @commands.Cog.listener()
     async def on_wavelink_track_end(self, payload: wavelink.TrackEndEventPayload):
@@ -81,14 +125,24 @@ class Music(commands.Cog):
         if player is None:
             return
         if payload.reason != "replaced":
-            player.backpack.append(payload.track)
+            player.remember(payload.track)
 
         if len(player.queue) == 0:
             menu = player.fetch("menu")
             message = player.fetch("message")
             if menu and message:
                 menu._update_buttons()
-                await message.edit(view=menu)
+                edit_scheduler.edit(message, view=menu)
+
+    @commands.Cog.listener()
+    async def on_player_queue_update(
+        self, player: customplayer.CustomPlayer, added: int
+    ):
+        menu = player.fetch("menu")
+        message = player.fetch("message")
+        if menu != None and message != None:
+            menu._update_buttons()
+            edit_scheduler.edit(message, view=menu)
 
     @commands.Cog.listener()
     async def on_wavelink_track_exception(
@@ -114,7 +168,7 @@ class Music(commands.Cog):
         message = player.fetch("message")
         if menu != None and message != None:
             menu.disable_buttons()
-            await message.edit(view=menu)
+            edit_scheduler.edit(message, view=menu)
         if channel:
             embed = discord.Embed(
                 title="Disconnected",
@@ -147,89 +201,25 @@ class Music(commands.Cog):
         """Play a song in a voice channel from a link or a search query"""
 
         player: customplayer.CustomPlayer = interaction.guild.voice_client
-        node: wavelink.Node = player.node
         await interaction.response.defer(thinking=True)
         if query.startswith(("https://www.youtube.com/watch", "https://youtu.be/")):
             return await interaction.followup.send(
                 "We don't support Youtube!", ephemeral=True
             )
         
-        lscompatible = {"spsearch:", "dzsearch:", "amsearch:"}
-        if not searchtype:
-            searchtype = misc_enums.SearchType.Track
-        if not re.match(URL_REGEX, query):
-            match searchtype:
-                case misc_enums.SearchType.Track:
-                    source = "spsearch:" if src is None else src.value
-                    result: wavelink.Search = await wavelink.Playable.search(
-                        query, source=source, node=node
-                    )
-                case misc_enums.SearchType.Album:
-                    source = (
-                        "spsearch:"
-                        if src is None or src.value not in lscompatible
-                        else src.value
-                    )
-                    search = f"{source}{query}"
-                    data = await node.send(
-                        path="v4/loadsearch",
-                        params={"query": search, "types": ["album"]},
-                    )
-                    if len(data["albums"]) < 1:
-                        return await interaction.followup.send(
-                            "Couldn't find anything. Try another search query."
-                        )
-                    result: wavelink.Search = await wavelink.Playable.search(
-                        wavelink.Playlist(data["albums"][0]).url, node=node
-                    )
-                case misc_enums.SearchType.Playlist:
-                    source = (
-                        "spsearch:"
-                        if src is None or src.value not in lscompatible
-                        else src.value
-                    )
-                    search = f"{source}{query}"
-                    data = await node.send(
-                        path="v4/loadsearch",
-                        params={"query": search, "types": ["playlist"]},
-                    )
-                    if len(data["playlists"]) < 1:
-                        return await interaction.followup.send(
-                            "Couldn't find anything. Try another search query."
-                        )
-                    result: wavelink.Search = await wavelink.Playable.search(
-                        wavelink.Playlist(data["playlists"][0]).url, node=node
-                    )
-                case misc_enums.SearchType.Artist:
-                    source = (
-                        "spsearch:"
-                        if src is None or src.value not in lscompatible
-                        else src.value
-                    )
-                    search = f"{source}{query}"
-                    data = await node.send(
-                        path="v4/loadsearch",
-                        params={"query": search, "types": ["artist"]},
-                    )
-                    if len(data["artists"]) < 1:
-                        return await interaction.followup.send(
-                            "Couldn't find anything. Try another search query."
-                        )
-                    result: wavelink.Search = await wavelink.Playable.search(
-                        wavelink.Playlist(data["artists"][0]).url, node=node
-                    )
-        else:
-            result = await wavelink.Playable.search(query, node=node)
+        result = await search_service.search(
+            query,
+            source=src.value if src else None,
+            search_type=searchtype or misc_enums.SearchType.Track,
+        )
 
         if len(result) == 0:
             return await interaction.followup.send(
                 "Couldn't find anything. Try another search query."
             )
+        extras = {"requester_id": interaction.user.id}
         if isinstance(result, wavelink.Playlist):
-
-            for track in result:
-                track.extras = {"requester_id": interaction.user.id}
-                await player.queue.put_wait(track)
+            await player.enqueue_many(result.tracks, extras=extras)
             embed = discord.Embed(
                 description=f"{get_emoji_from_source(result[0].source)} Added [{result.name}]({result.url}) - `{len(result)}` tracks",
                 color=get_color_from_source(result[0].source),
@@ -237,8 +227,7 @@ class Music(commands.Cog):
 
         else:
             track: wavelink.Playable = result[0]
-            track.extras = {"requester_id": interaction.user.id}
-            await player.queue.put_wait(track)
+            await player.enqueue_many((track,), extras=extras)
 
             embed = discord.Embed(
                 description=f"{get_emoji_from_source(track.source)} Added {player.get_formatted_track_author(track)} - {player.get_formatted_track_title(track)}",
@@ -246,14 +235,17 @@ class Music(commands.Cog):
             )
 
         await interaction.followup.send(embed=embed)
-        menu = player.fetch("menu")
-        message = player.fetch("message")
-        if menu != None and message != None:
-            menu._update_buttons()
-            await message.edit(view=menu)
         if not player.playing:
             await player.play(player.queue.get())
 
+    @playmusic.autocomplete("query")
+    async def playmusic_query_autocomplete(
+        self, interaction: discord.Interaction, current: str
+    ) -> list[app_commands.Choice[str]]:
+        return await query_suggester.suggest(
+            interaction.user.id, current, source=interaction.namespace.src
+        )
+
     @app_commands.command(name="nowplaying")
     @new_get_player()
     @app_commands.guild_only()
@@ -355,10 +347,12 @@ class Music(commands.Cog):
         await interaction.response.defer(thinking=True)
         if "audio" in track_file.content_type:
             player: customplayer.CustomPlayer = interaction.guild.voice_client
-            result = await wavelink.Playable.search(track_file.url)
+            # Loaded as a link, on the node picked by the scheduler
+            result = await search_service.search(track_file.url)
             track: wavelink.Playable = result[0]
-            track.extras = {"requester_id": interaction.user.id}
-            await player.queue.put_wait(track)
+            await player.enqueue_many(
+                (track,), extras={"requester_id": interaction.user.id}
+            )
             embed = discord.Embed(
                 description=f"Added `{track_file.filename}` to the queue",
                 color=discord.Color.blue(),
@@ -1,35 +1,54 @@
 import aiohttp
-import asqlite
 import discord
 import wavelink
 import importlib
 from bot.misc import cog_app_command_error_handler, cooldown_for_vote, new_get_player, SOURCES
-from typing import Optional
+from typing import Optional, Sequence
 import bot.player as customplayer
 import bot.views as views
 import bot.enums as misc_enums
 import bot.dbmanager as dbmanager
+from bot.decoder import DECODE_CHUNK_SIZE, decode_tracks, iter_decoded_chunks
+from bot.search import search_service
+from bot.nodes import node_scheduler
 from discord.ext import commands
 from discord import app_commands
-import re
+import asyncio
+import datetime
+import logging
 
-URL_REGEX = re.compile(
-    r"https?:\/\/(www\.)?[-a-zA-Z0-9@:%._\+~#=]{1,256}\.[a-zA-Z0-9()]{1,6}\b([-a-zA-Z0-9()@:%_\+.~#?&//=]*)"
-)
+logger = logging.getLogger("bot")
 
 API_URL = "http://localhost:8000"
 
 
+def track_payload(track: wavelink.Playable, user_id: str) -> dict:
+    """Track data sent to the playlist API"""
+    return {
+        "user_id": user_id,
+        "encoded": track.encoded,
+        "title": track.title,
+        "author": track.author,
+        "length_ms": track.length,
+        "source": track.source,
+        "uri": track.uri,
+    }
+
+
 @app_commands.guild_only()
 class CustomPlaylist(commands.GroupCog, group_name="playlist"):
     def __init__(self, bot: commands.Bot) -> None:
         self.bot = bot
         self.playlist_api = None
+        # Tasks queuing the rest of a custom playlist
+        self.loaders: set[asyncio.Task] = set()
         super().__init__()
 
     async def cog_unload(self) -> None:
+        for task in tuple(self.loaders):
+            task.cancel()
+        # dbmanager isn't reloaded, its pools are owned by the bot
         importlib.reload(customplayer)
-        importlib.reload(dbmanager)
         importlib.reload(misc_enums)
         importlib.reload(views)
 
@@ -81,80 +100,22 @@ class CustomPlaylist(commands.GroupCog, group_name="playlist"):
     ):
         """Add a song to a custom playlist"""
         await interaction.response.defer(thinking=True)
-        node: wavelink.Node = wavelink.Pool.get_node()
         if query.startswith(("https://www.youtube.com/watch", "https://youtu.be/")):
             return await interaction.followup.send(
                 "We don't support Youtube!", ephemeral=True
             )
-        lscompatible = {"spsearch:", "dzsearch:", "amsearch:"}
-        if not searchtype:
-            searchtype = misc_enums.SearchType.Track
-        if not re.match(URL_REGEX, query):
-            match searchtype:
-                case misc_enums.SearchType.Track:
-                    source = "spsearch:" if src is None else src.value
-                    result: wavelink.Search = await wavelink.Playable.search(
-                        query, source=source, node=node
-                    )
-                case misc_enums.SearchType.Album:
-                    source = (
-                        "spsearch:"
-                        if src is None or src.value not in lscompatible
-                        else src.value
-                    )
-                    search = f"{source}{query}"
-                    data = await node.send(
-                        path="v4/loadsearch",
-                        params={"query": search, "types": ["album"]},
-                    )
-                    if len(data["albums"]) < 1:
-                        return await interaction.followup.send("Couldn't find anything. Try another search query.")
-                    result: wavelink.Search = await wavelink.Playable.search(
-                        wavelink.Playlist(data["albums"][0]).url, node=node
-                    )
-                case misc_enums.SearchType.Playlist:
-                    source = (
-                        "spsearch:"
-                        if src is None or src.value not in lscompatible
-                        else src.value
-                    )
-                    search = f"{source}{query}"
-                    data = await node.send(
-                        path="v4/loadsearch",
-                        params={"query": search, "types": ["playlist"]},
-                    )
-                    if len(data["playlists"]) < 1:
-                        return await interaction.followup.send("Couldn't find anything. Try another search query.")
-                    result: wavelink.Search = await wavelink.Playable.search(
-                        wavelink.Playlist(data["playlists"][0]).url, node=node
-                    )
-                case misc_enums.SearchType.Artist:
-                    source = (
-                        "spsearch:"
-                        if src is None or src.value not in lscompatible
-                        else src.value
-                    )
-                    search = f"{source}{query}"
-                    data = await node.send(
-                        path="v4/loadsearch",
-                        params={"query": search, "types": ["artist"]},
-                    )
-                    if len(data["artists"]) < 1:
-                        return await interaction.followup.send("Couldn't find anything. Try another search query.")
-                    result: wavelink.Search = await wavelink.Playable.search(
-                        wavelink.Playlist(data["artists"][0]).url, node=node
-                    )
-        else:
-            result: wavelink.Search = await wavelink.Playable.search(query, node=node)
+        result = await search_service.search(
+            query,
+            source=src.value if src else None,
+            search_type=searchtype or misc_enums.SearchType.Track,
+        )
 
         if len(result) == 0:
             return await interaction.followup.send("Couldn't find anything. Try another search query.")
         if isinstance(result, wavelink.Playlist):
-            tracks_data = []
-            for track in result.tracks:
-                t_data = {"user_id": str(interaction.user.id)}
-                t_data.update({"encoded": track.raw_data.get("encoded")})
-                tracks_data.append(t_data)
+            tracks_data = [
+                track_payload(track, str(interaction.user.id)) for track in result.tracks
+            ]
 
             async with aiohttp.ClientSession(API_URL) as session:
                 async with session.post(
@@ -167,6 +128,10 @@ class CustomPlaylist(commands.GroupCog, group_name="playlist"):
                 ) as response:
                     if response.status == 200:
                         pass
+                    elif response.status == 400:
+                        return await interaction.followup.send(
+                            (await response.json())["detail"]
+                        )
                     else:
                         return await interaction.followup.send(
                             f"Unexpected backend error. `{response.status}`"
@@ -185,15 +150,16 @@ class CustomPlaylist(commands.GroupCog, group_name="playlist"):
 
                 async with session.post(
                      f"/playlist/{plid}/track/",
-                    json={
-                        "user_id": str(interaction.user.id),
-                        "encoded": track.raw_data.get("encoded"),
-                    },
+                    json=track_payload(track, str(interaction.user.id)),
                     headers={"master-key": self.bot.api_master_key}
                 ) as response:
                     print(await response.text())
                     if response.status == 200:
                         pass
+                    elif response.status == 400:
+                        return await interaction.followup.send(
+                            (await response.json())["detail"]
+                        )
                     else:
                         return await interaction.followup.send(
                             f"Unexpected error. {response.status}"
@@ -208,7 +174,7 @@ class CustomPlaylist(commands.GroupCog, group_name="playlist"):
     @app_commands.command(name="ls", description="Show your playlists")
     @app_commands.checks.dynamic_cooldown(cooldown_for_vote)
     async def show_all_pl(self, interaction: discord.Interaction):
-        async with asqlite.connect("userplaylists.db") as conn:
+        async with dbmanager.acquire(dbmanager.PLAYLISTS_DB) as conn:
             async with conn.cursor() as cur:
                 await cur.execute(
                     "SELECT * FROM playlists WHERE userid=?", (interaction.user.id,)
@@ -252,18 +218,28 @@ class CustomPlaylist(commands.GroupCog, group_name="playlist"):
                 plname = playlist[2]
                 thumbnail_url = playlist[4]
                 desc = playlist[3]
-            tracks: list[tuple[int, wavelink.Playable]] = []
-            for i in data:
-                raw = await player.node.send(
-                    path="v4/decodetrack", params={"encodedTrack": i[1]}
-                )
-                tracks.append((i[0], wavelink.Playable(raw)))
 
-        
         if not data:
             return await interaction.followup.send(
                 "Your playlist is empty or not found"
             )
+        pl_info = {
+            "plId": plid,
+            "name": plname,
+            "description": desc,
+            "ownerId": owner_id,
+            "totalTracks": len(data),
+            "artworkUrl": thumbnail_url,
+        }
+        # Start playing as soon as the first chunk is decoded,
+        # the rest of the playlist is loaded in background.
+        first, remaining = data[:DECODE_CHUNK_SIZE], data[DECODE_CHUNK_SIZE:]
+        decoded = await decode_tracks(
+            node_scheduler.best("decode"), tuple(t[1] for t in first)
+        )
+        await self._queue_pl_tracks(
+            player, first, decoded, interaction.user.id, pl_info
+        )
         embed = discord.Embed(
             description=f"Added custom playlist: **{plname}** - `{len(data)}` tracks.",
             color=discord.Color.random(),
@@ -272,28 +248,63 @@ class CustomPlaylist(commands.GroupCog, group_name="playlist"):
         embed.set_thumbnail(
             url=thumbnail_url if thumbnail_url else self.bot.user.display_avatar.url
         )
-        for tid, t in tracks:
-            t.extras = {
-                "requester_id": interaction.user.id,
-                "customPlaylist": {
-                    "plId": plid,
-                    "trackId": tid,
-                    "name": plname,
-                    "description": desc,
-                    "ownerId": owner_id,
-                    "totalTracks": len(tracks),
-                    "artworkUrl": thumbnail_url,
-                },
-            }
-            await player.queue.put_wait(t)
         await interaction.followup.send(embed=embed)
-        menu = player.fetch("menu")
-        message = player.fetch("message")
-        if menu != None and message != None:
-            menu._update_buttons()
-            await message.edit(view=menu)
-        if not player.playing:
+        if not player.playing and player.queue:
             await player.play(player.queue.get())
+        if remaining:
+            task = player.create_task(
+                self._stream_pl_tracks(player, remaining, interaction.user.id, pl_info),
+                name=f"playlist-{plid}",
+            )
+            self.loaders.add(task)
+            task.add_done_callback(self.loaders.discard)
+
+    async def _queue_pl_tracks(
+        self,
+        player: customplayer.CustomPlayer,
+        rows: Sequence[tuple[int, str]],
+        decoded: list[Optional[dict]],
+        requester_id: int,
+        pl_info: dict,
+    ):
+        tracks = []
+        for (tid, _), raw in zip(rows, decoded):
+            if raw is None:
+                # The node couldn't decode it
+                continue
+            t = wavelink.Playable(raw)
+            # The playlist info is shared by every track of the playlist,
+            # CustomPlayer.play puts the trackId in it for Lavalink
+            t.extras = wavelink.ExtrasNamespace(
+                requester_id=requester_id, trackId=tid, customPlaylist=pl_info
+            )
+            tracks.append(t)
+        await player.enqueue_many(tracks)
+
+    async def _stream_pl_tracks(
+        self,
+        player: customplayer.CustomPlayer,
+        rows: Sequence[tuple[int, str]],
+        requester_id: int,
+        pl_info: dict,
+    ):
+        """Decode and queue the remaining tracks of a custom playlist"""
+        offset = 0
+        try:
+            async for decoded in iter_decoded_chunks(
+                node_scheduler.best("decode"), tuple(t[1] for t in rows)
+            ):
+                if not player.connected:
+                    return
+                chunk = rows[offset : offset + len(decoded)]
+                offset += len(decoded)
+                await self._queue_pl_tracks(
+                    player, chunk, decoded, requester_id, pl_info
+                )
+        except Exception:
+            logger.exception(
+                "Couldn't load the remaining tracks of playlist %s", pl_info["plId"]
+            )
 
     @app_commands.command(
         name="manage", description="Manage a playlist"
@@ -314,9 +325,8 @@ class CustomPlaylist(commands.GroupCog, group_name="playlist"):
                     )
                 else:
                     return await interaction.followup.send(f"Unexpected backend error: {response.status}")
-            async with session.get(f"/playlist/{plid}/tracks") as response:
-                tracks = await response.json()
-                total_tracks = len(tracks) if tracks else 0
+            async with session.get(f"/playlist/{plid}/summary") as response:
+                summary = await response.json()
                 embed = discord.Embed(
                     
                     title=f"🗃️ {playlist_data[2]}", color=discord.Color.yellow()
@@ -327,11 +337,15 @@ class CustomPlaylist(commands.GroupCog, group_name="playlist"):
                     inline=False,
                 )
                 embed.add_field(
-                    name="🎵 Tracks", value=f"`{total_tracks}` tracks"
+                    name="🎵 Tracks", value=f"`{summary['total_tracks']}` tracks"
+                )
+                embed.add_field(
+                    name="⏰ Duration",
+                    value=f"`{datetime.timedelta(seconds=summary['total_length_ms'] // 1000)}`",
                 )
                 if playlist_data[4]:
                     embed.set_thumbnail(url=playlist_data[4])
-                view = views.ManageCustomPlMenu(plid, str(interaction.user.id))
+                view = views.ManagePlaylistMenu(plid, str(interaction.user.id))
                 view.message = await interaction.original_response()
                 await interaction.followup.send(
                     embed=embed,                               
@@ -1,24 +1,41 @@
 import asyncio
-import asqlite
-from discord.ext import commands
+import bot.dbmanager as dbmanager
+from discord.ext import commands, tasks
 from discord import app_commands
 from bot.misc import TopGGButton
 import discord
-from fastapi import FastAPI, Request
+from fastapi import FastAPI, HTTPException, Request
 import uvicorn
 import  yaml
 import topgg
 import  logging
 import time
-from bot.misc import cooldown_for_vote, cog_app_command_error_handler
+from bot.misc import cooldown_for_vote, cog_app_command_error_handler, vote_cache, VOTE_DURATION
 
 logger = logging.getLogger("topgg")
 
+# Votes received in this delay are stored in the same transaction
+VOTE_BATCH_DELAY = 0.5
+VOTE_BATCH_SIZE = 500
+# Minimum delay between two "thank you" DMs
+DM_INTERVAL = 1.0
+# Expired cooldowns deleted per transaction
+SWEEP_BATCH_SIZE = 1000
+
 class TopGGManager(commands.Cog):
     def __init__(self, bot: commands.Bot):
         self.bot = bot
         self.wh_server = None
         self.enabled = False
+        self.vote_queue: asyncio.Queue[tuple[int, float]] = asyncio.Queue()
+        self.dm_queue: asyncio.Queue[int] = asyncio.Queue()
+        self._workers: list[asyncio.Task] = []
+        self.votes_written = 0
+        self.vote_batches = 0
+        self.last_batch_latency = 0.0
+        self.max_batch_latency = 0.0
+        self.swept_cooldowns = 0
+        self.reclaimed_pages = 0
         with open("config.yml") as cfg:
             CONFIG: dict = yaml.safe_load(cfg)
 
@@ -40,6 +57,9 @@ class TopGGManager(commands.Cog):
         await cog_app_command_error_handler(interaction, error)
 
     async def cog_load(self):
+        # Votes are stored even if the integration is disabled now
+        await vote_cache.load()
+        self.sweep_cooldowns.start()
         if not self.enabled:
             return
         topgg_app = FastAPI()
@@ -49,61 +69,158 @@ class TopGGManager(commands.Cog):
             auth = request.headers.get("Authorization")
             if auth != self.topgg.webhook_auth:
                 logger.warning("Unauthorized webhook request received.")
-                return {"error": "Unauthorized"}, 401
+                raise HTTPException(status_code=401, detail="Unauthorized")
             data = await request.json()
-            user_id = data.get("user")
-            user = await self.bot.fetch_user(user_id)
-            logger.info("%s (%s) has voted for the bot! - %s", user.display_name,user.name, user.id)
-            # Check if the user is already in the database
-            async with asqlite.connect("dynamiccooldowns.db") as conn:
-                async with conn.cursor() as cursor:
-                    await cursor.execute(
-                        "SELECT * FROM cooldowns WHERE userid = ?",
-                        (user_id,),
-                    )
-                    row = await cursor.fetchone()
-                    if row:
-                        # If the user is already in the database, update the expiration time
-                        await cursor.execute(
-                            "UPDATE cooldowns SET expires_at = ? WHERE userid = ?",
-                            (time.time() + 43200, user_id),
-                        )
-                    else:
-                        # If the user is not in the database, insert a new row
-                        await cursor.execute(
-                            "INSERT INTO cooldowns (userid, expires_at) VALUES (?, ?)",
-                            (user_id, time.time() + 43200),
-                        )
-                    await conn.commit()
-            embed = discord.Embed(
-                title="Thank you for voting!",
-                description="You've gained a 50% cooldown reduction on all commands for 12 hours. More benefits coming soon.",
-                color=discord.Color.dark_red(),
-            )
-            embed.set_thumbnail(url=self.bot.user.display_avatar.url)
-            embed.set_footer(
-                text="No reply to this message. If you have any questions, please contact the bot owner.",
-            )
             try:
-                await user.send(embed=embed)
-            except discord.Forbidden as e:
-                logger.warning(
-                    "Can't send DM to user with id %s\nReason: %s", data["user"], e
-                )
-            except discord.HTTPException as e:
-                logger.warning(
-                    "Can't send DM to user with id %s\nReason: %s", data["user"], e
-                )
-
+                user_id = int(data["user"])
+            except (KeyError, TypeError, ValueError):
+                raise HTTPException(status_code=400, detail="Invalid vote")
+            expires_at = time.time() + VOTE_DURATION
+            vote_cache.set(user_id, expires_at)
+            # Stored and thanked by the workers, top.gg gets its answer right away
+            self.vote_queue.put_nowait((user_id, expires_at))
             return {"status": "ok"}
+
+        self._workers = [
+            asyncio.create_task(self._vote_writer()),
+            asyncio.create_task(self._dm_sender()),
+        ]
         config = uvicorn.Config(app=topgg_app, host="0.0.0.0", port=8001, log_level="info")
         self.wh_server = uvicorn.Server(config)
         asyncio.create_task(self.wh_server.serve())
 
     async def cog_unload(self):
+        self.sweep_cooldowns.cancel()
         if not self.enabled:
             return
         await self.wh_server.shutdown()
+        await self.topgg.close()
+        try:
+            # Store the votes that are still queued
+            await asyncio.wait_for(self.vote_queue.join(), timeout=5)
+        except asyncio.TimeoutError:
+            logger.warning("%d votes weren't stored", self.vote_queue.qsize())
+        for task in self._workers:
+            task.cancel()
+
+    @tasks.loop(hours=1)
+    async def sweep_cooldowns(self):
+        try:
+            deleted, pages = await self._sweep_cooldowns()
+        except Exception:
+            # An error would stop the loop
+            logger.exception("Can't sweep the expired cooldowns")
+            return
+        self.swept_cooldowns += deleted
+        self.reclaimed_pages += pages
+        if deleted or pages:
+            logger.info("Deleted %d expired cooldowns, reclaimed %d pages.", deleted, pages)
+
+    async def _sweep_cooldowns(self) -> tuple[int, int]:
+        now = time.time()
+        deleted = 0
+        while True:
+            async with dbmanager.acquire(dbmanager.COOLDOWNS_DB) as conn:
+                cur = await conn.execute(
+                    """DELETE FROM cooldowns WHERE userid IN (
+                           SELECT userid FROM cooldowns WHERE expires_at <= ? ORDER BY expires_at LIMIT ?
+                       )""",
+                    (now, SWEEP_BATCH_SIZE),
+                )
+                count = cur.get_cursor().rowcount
+            deleted += count
+            if count < SWEEP_BATCH_SIZE:
+                break
+            await asyncio.sleep(0)
+        return deleted, await dbmanager.incremental_vacuum(dbmanager.COOLDOWNS_DB)
+
+    async def _vote_writer(self):
+        while True:
+            batch = [await self.vote_queue.get()]
+            await asyncio.sleep(VOTE_BATCH_DELAY)
+            while len(batch) < VOTE_BATCH_SIZE and not self.vote_queue.empty():
+                batch.append(self.vote_queue.get_nowait())
+            try:
+                await self._write_votes(batch)
+            except Exception:
+                logger.exception("Can't store %d votes", len(batch))
+            finally:
+                for _ in batch:
+                    self.vote_queue.task_done()
+
+    async def _write_votes(self, batch: list[tuple[int, float]]):
+        # Only the latest vote of every user is written
+        votes = dict(batch)
+        start = time.perf_counter()
+        async with (
+            dbmanager.acquire(dbmanager.COOLDOWNS_DB) as conn,
+            conn.transaction(),
+        ):
+            await conn.executemany(
+                """INSERT INTO cooldowns (userid, expires_at) VALUES (?, ?)
+                   ON CONFLICT (userid) DO UPDATE SET expires_at = excluded.expires_at""",
+                votes.items(),
+            )
+        latency = time.perf_counter() - start
+        self.last_batch_latency = latency
+        self.max_batch_latency = max(self.max_batch_latency, latency)
+        self.vote_batches += 1
+        self.votes_written += len(votes)
+        for user_id in votes:
+            self.dm_queue.put_nowait(user_id)
+
+    async def _dm_sender(self):
+        while True:
+            user_id = await self.dm_queue.get()
+            try:
+                await self._send_vote_dm(user_id)
+            except Exception:
+                logger.exception("Can't thank user with id %s", user_id)
+            finally:
+                self.dm_queue.task_done()
+            await asyncio.sleep(DM_INTERVAL)
+
+    async def _send_vote_dm(self, user_id: int):
+        try:
+            user = await self.bot.fetch_user(user_id)
+        except discord.HTTPException as e:
+            logger.warning("Can't fetch user with id %s\nReason: %s", user_id, e)
+            return
+        logger.info("%s (%s) has voted for the bot! - %s", user.display_name,user.name, user.id)
+        embed = discord.Embed(
+            title="Thank you for voting!",
+            description="You've gained a 50% cooldown reduction on all commands for 12 hours. More benefits coming soon.",
+            color=discord.Color.dark_red(),
+        )
+        embed.set_thumbnail(url=self.bot.user.display_avatar.url)
+        embed.set_footer(
+            text="No reply to this message. If you have any questions, please contact the bot owner.",
+        )
+        try:
+            await user.send(embed=embed)
+        except discord.Forbidden as e:
+            logger.warning(
+                "Can't send DM to user with id %s\nReason: %s", user_id, e
+            )
+        except discord.HTTPException as e:
+            logger.warning(
+                "Can't send DM to user with id %s\nReason: %s", user_id, e
+            )
+
+    @commands.command()
+    @commands.is_owner()
+    async def vote_stats(self, ctx: commands.Context):
+        desc = f"""
+Vote queue: `{self.vote_queue.qsize()}`
+DM queue: `{self.dm_queue.qsize()}`
+Stored votes: `{self.votes_written}` in `{self.vote_batches}` batches
+Batch latency: `{self.last_batch_latency * 1000:.1f}ms` (max `{self.max_batch_latency * 1000:.1f}ms`)
+Cached votes: `{len(vote_cache)}`
+Swept cooldowns: `{self.swept_cooldowns}` (`{self.reclaimed_pages}` pages reclaimed)
+"""
+        if self.enabled:
+            desc += f"Top.gg requests: `{self.topgg.requests}` (check-vote cache: `{self.topgg.votes.hit_ratio:.1%}` hit ratio)"
+        await ctx.send(embed=discord.Embed(title="Top.gg votes", description=desc))
 
     @app_commands.command(name="check-vote", description="Check if you have voted or not.")
     @app_commands.checks.dynamic_cooldown(cooldown_for_vote)
@@ -6,6 +6,12 @@ from discord import app_commands
 import wavelink
 from bot.misc import cog_app_command_error_handler, cooldown_for_vote
 import bot.player as customplayer
+from bot.decoder import decode_cache
+from bot.artwork import artwork_fetcher
+from bot.cards import card_renderer
+from bot.edits import edit_scheduler
+from bot.search import search_service
+from bot.nodes import node_scheduler
 
 
 async def reload_cogs(bot: commands.Bot):
@@ -41,11 +47,29 @@ class Utils(commands.Cog):
         nodes = wavelink.Pool.nodes
         embed = discord.Embed(title="Lavalink Nodes")
         for name, node in nodes.items():
+            load = node_scheduler.load(node)
+            placed = ", ".join(
+                f"{purpose}: {count}"
+                for (purpose, identifier), count in node_scheduler.counts.items()
+                if identifier == name
+            )
+            latency = f"{load.latency:.0f}ms" if load.latency is not None else "?"
             desc = f"""
-Players: `{len(node.players)}`
+Players: `{len(node.players)}` (`{load.playing}`/`{load.players}` playing on the node)
 LL version: `{await node.fetch_version()}`
+CPU: `{load.system_load:.0%}` system, `{load.lavalink_load:.0%}` lavalink
+Frames: `{load.deficit}` deficit, `{load.nulled}` nulled
+Latency: `{latency}`
+Score: `{node_scheduler.score(node):.1f}` {"healthy" if node_scheduler.healthy(node) else "**unhealthy**"}
+Placed: `{placed or "nothing"}`
 """
             embed.add_field(name=name, value=desc)
+        recent = "\n".join(
+            f"<t:{int(t)}:T> {purpose} -> `{identifier}` ({score:.1f})"
+            for t, purpose, identifier, score in list(reversed(node_scheduler.placements))[:10]
+        )
+        embed.add_field(name="Recent placements", value=recent or "None", inline=False)
+        embed.add_field(name="Failover", value=f"`{node_scheduler.migrations}` players moved, `{node_scheduler.failed_migrations}` failed.", inline=False)
         await ctx.send(embed=embed)
 
     @commands.command()
@@ -119,6 +143,11 @@ __**Features**__
         embed.add_field(name="🗃️ Guilds",value=f"{len(self.bot.guilds)} discord guilds!",inline=False)
         embed.add_field(name="🔗 Lavalink nodes", value=f"{len(wavelink.Pool.nodes)} nodes.", inline=False)
         embed.add_field(name="📡 Ping", value=f"{round(self.bot.latency * 1000)}ms", inline=False)
+        embed.add_field(name="💾 Track cache", value=f"{decode_cache.hit_ratio:.1%} hit ratio, {decode_cache.bytes_saved / 1024:.1f} KiB saved.", inline=False)
+        embed.add_field(name="🖼️ Card cache", value=f"{card_renderer.cache.hit_ratio:.1%} hit ratio, {len(card_renderer.cache)} cards ({card_renderer.cache.nbytes / 1024:.1f} KiB), {card_renderer.overloads + card_renderer.failures} text fallbacks ({card_renderer.failures} failed renders).", inline=False)
+        embed.add_field(name="🎨 Artwork cache", value=f"{artwork_fetcher.hits} hits, {artwork_fetcher.misses} downloads, {artwork_fetcher.coalesced} coalesced, {artwork_fetcher.failures} failures.", inline=False)
+        embed.add_field(name="🔎 Search cache", value=f"{search_service.hit_ratio:.1%} hit ratio, {len(search_service.cache)} results, {search_service.requests} Lavalink requests, {search_service.coalesced} coalesced.", inline=False)
+        embed.add_field(name="✏️ Menu edits", value=f"{edit_scheduler.requested} requested, {edit_scheduler.sent} sent, {edit_scheduler.coalesced} coalesced.", inline=False)
         await interaction.response.send_message(embed=embed)
         
 
@@ -3,6 +3,7 @@ import yaml
 import random
 from typing import Literal
 from discord.ext import commands, tasks
+import bot.dbmanager as dbmanager
 import logging
 import os
 
@@ -13,7 +14,15 @@ intents.message_content = True
 intents.members = True
 intents.guilds = True
 
-bot = commands.Bot(command_prefix="!", help_command=None, intents=intents)
+
+class RumbleBot(commands.Bot):
+    async def close(self):
+        await super().close()
+        # The database pools are shared by every cog, they're closed last
+        await dbmanager.close_pools()
+
+
+bot = RumbleBot(command_prefix="!", help_command=None, intents=intents)
 
 logger = logging.getLogger("bot")
 
@@ -55,6 +64,7 @@ async def before_refresh_rpc():
 @bot.event
 async def setup_hook():
     refresh_rpc.start()
+    await dbmanager.dbsetup()
     logger.info("Loading commands...") 
     await load_cogs()
     logger.info("All commands have loaded sucessfully!")
@@ -0,0 +1,23 @@
+import os
+import tempfile
+import unittest
+from bot import dbmanager
+
+
+class DatabaseTestCase(unittest.IsolatedAsyncioTestCase):
+    """Runs every test in an empty directory, with the databases set up"""
+
+    async def asyncSetUp(self):
+        self._cwd = os.getcwd()
+        self._tmp = tempfile.TemporaryDirectory()
+        os.chdir(self._tmp.name)
+        self.create_databases()
+        await dbmanager.dbsetup()
+
+    def create_databases(self):
+        """Create database files before ``dbsetup`` runs"""
+
+    async def asyncTearDown(self):
+        await dbmanager.close_pools()
+        os.chdir(self._cwd)
+        self._tmp.cleanup()
@@ -0,0 +1,66 @@
+import asyncio
+import io
+import tempfile
+import unittest
+from aiohttp import web
+from PIL import Image
+from bot.artwork import ArtworkFetcher
+
+
+def png() -> bytes:
+    output = io.BytesIO()
+    Image.new("RGB", (300, 300), "red").save(output, "PNG")
+    return output.getvalue()
+
+
+class ArtworkFetcherTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.requests = 0
+        image = png()
+
+        async def serve_image(request):
+            self.requests += 1
+            return web.Response(body=image, content_type="image/png")
+
+        app = web.Application()
+        app.router.add_get("/{name}", serve_image)
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.base_url = f"http://127.0.0.1:{port}"
+        self.tmp = tempfile.TemporaryDirectory()
+
+    async def asyncTearDown(self):
+        await self.runner.cleanup()
+        self.tmp.cleanup()
+
+    def fetcher(self, max_files: int = 100) -> ArtworkFetcher:
+        fetcher = ArtworkFetcher(self.tmp.name, max_files)
+        self.addAsyncCleanup(fetcher.close)
+        return fetcher
+
+    async def test_thumbnails_are_cached(self):
+        fetcher = self.fetcher()
+        url = f"{self.base_url}/a.png"
+        first = await fetcher.get(url)
+        second = await fetcher.get(url)
+        self.assertEqual(first, second)
+        self.assertEqual(Image.open(io.BytesIO(first)).size, (100, 100))
+        self.assertEqual((fetcher.misses, fetcher.hits, self.requests), (1, 1, 1))
+
+        fetcher.prefetch(url)
+        await asyncio.gather(*fetcher._inflight.values())
+        self.assertEqual(self.requests, 1)
+
+    async def test_least_recently_used_are_evicted(self):
+        fetcher = self.fetcher(max_files=5)
+        await asyncio.gather(*(fetcher.get(f"{self.base_url}/{n}.png") for n in range(8)))
+        files = list(fetcher.directory.glob("*.png"))
+        self.assertLessEqual(len(files), 5)
+        self.assertEqual(fetcher._files, len(files))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,50 @@
+import unittest
+from types import SimpleNamespace
+from bot.cards import CardRenderer
+
+AVATAR_URL = "https://example.com/avatar.png"
+
+
+def track(n: int) -> SimpleNamespace:
+    return SimpleNamespace(
+        identifier=f"id{n}", source="youtube", title=f"Track {n}", author="Artist", artwork=None
+    )
+
+
+class CardRendererTest(unittest.IsolatedAsyncioTestCase):
+    def renderer(self, workers: int) -> CardRenderer:
+        renderer = CardRenderer()
+        renderer.start(workers)
+        self.addCleanup(renderer.shutdown)
+        # No avatar download
+        renderer._avatar_url = AVATAR_URL
+        return renderer
+
+    async def test_render_error_falls_back(self):
+        renderer = self.renderer(0)
+        broken = track(1)
+        broken.title = None
+        with self.assertLogs("bot", "WARNING"):
+            self.assertIsNone(await renderer.render(broken, AVATAR_URL))
+        self.assertEqual(renderer.failures, 1)
+        self.assertEqual(renderer.pending, 0)
+        self.assertIsNotNone(await renderer.render(track(2), AVATAR_URL))
+
+    async def test_dead_worker_restarts_pool(self):
+        renderer = self.renderer(1)
+        self.assertIsNotNone(await renderer.render(track(1), AVATAR_URL))
+        executor = renderer._executor
+        for process in executor._processes.values():
+            process.kill()
+            process.join()
+
+        with self.assertLogs("bot", "WARNING") as logs:
+            self.assertIsNone(await renderer.render(track(2), AVATAR_URL))
+        self.assertIn("BrokenProcessPool", logs.output[0])
+        self.assertEqual(renderer.failures, 1)
+        self.assertIsNot(renderer._executor, executor)
+        self.assertIsNotNone(await renderer.render(track(3), AVATAR_URL))
+
+
+if __name__ == "__main__":
+    unittest.main()
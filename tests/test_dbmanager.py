@@ -0,0 +1,103 @@
+import asyncio
+import sqlite3
+import unittest
+from bot import dbmanager
+from ._utils import DatabaseTestCase
+
+WRITERS = 8
+TRACKS_PER_WRITER = 200
+
+
+class WriteTransactionTest(DatabaseTestCase):
+    async def asyncSetUp(self):
+        await super().asyncSetUp()
+        async with dbmanager.acquire() as conn:
+            await conn.execute(
+                "INSERT INTO playlists (id, userid, name) VALUES (1, '1', 'playlist')"
+            )
+
+    async def add_tracks(self, writer: int) -> list[int]:
+        # Same statements as the bulk insert endpoint: reads, then writes
+        async with dbmanager.acquire() as conn, dbmanager.write_transaction(conn) as cur:
+            await cur.execute("SELECT * FROM playlists WHERE userid=? AND id=?", ("1", 1))
+            self.assertIsNotNone(await cur.fetchone())
+            await cur.execute(
+                "SELECT COUNT(*), COALESCE(MAX(position), 0) FROM tracks WHERE plid=?", (1,)
+            )
+            _, last_position = await cur.fetchone()
+            await asyncio.sleep(0)
+            blob_ids = await dbmanager.store_track_blobs(
+                conn, [f"writer{writer}-track{i}" for i in range(TRACKS_PER_WRITER)]
+            )
+            await cur.executemany(
+                "INSERT INTO tracks (plid, userid, blob_id, position) VALUES (?, ?, ?, ?)",
+                (
+                    (1, 1, blob_id, position)
+                    for position, blob_id in enumerate(blob_ids, start=last_position + 1)
+                ),
+            )
+            await cur.execute("SELECT last_insert_rowid()")
+            last_id = (await cur.fetchone())[0]
+        return list(range(last_id - TRACKS_PER_WRITER + 1, last_id + 1))
+
+    async def test_concurrent_bulk_inserts(self):
+        results = await asyncio.gather(
+            *(self.add_tracks(w) for w in range(WRITERS)), return_exceptions=True
+        )
+        errors = [r for r in results if isinstance(r, BaseException)]
+        self.assertEqual(errors, [])
+
+        async with dbmanager.acquire() as conn:
+            rows = await conn.fetchall("SELECT id, position FROM tracks ORDER BY position")
+        self.assertEqual(len(rows), WRITERS * TRACKS_PER_WRITER)
+        # Every writer saw the positions of the previous ones
+        self.assertEqual([r[1] for r in rows], list(range(1, len(rows) + 1)))
+        self.assertEqual(
+            sorted(i for ids in results for i in ids), sorted(r[0] for r in rows)
+        )
+
+    async def test_rollback_on_error(self):
+        with self.assertRaises(sqlite3.IntegrityError):
+            async with dbmanager.acquire() as conn, dbmanager.write_transaction(conn) as cur:
+                await cur.execute(
+                    "INSERT INTO playlists (id, userid, name) VALUES (2, '1', 'other')"
+                )
+                await cur.execute(
+                    "INSERT INTO playlists (id, userid, name) VALUES (2, '1', 'other')"
+                )
+        async with dbmanager.acquire() as conn:
+            row = await conn.fetchone("SELECT COUNT(*) FROM playlists")
+        self.assertEqual(row[0], 1)
+
+
+# A YouTube track encoded by Lavalink
+ENCODED_TRACK = (
+    "QAAAjQIAJVJpY2sgQXN0bGV5IC0gTmV2ZXIgR29ubmEgR2l2ZSBZb3UgVXAADlJpY2tBc3RsZXlWRVZPAAAAAAADPCAAC2RRdzR3"
+    "OVdnWGNRAAEAK2h0dHBzOi8vd3d3LnlvdXR1YmUuY29tL3dhdGNoP3Y9ZFF3NHc5V2dYY1EAB3lvdXR1YmUAAAAAAAAAAA=="
+)
+
+
+class BackfillTest(DatabaseTestCase):
+    async def test_undecodable_tracks_are_tried_once(self):
+        async with dbmanager.acquire() as conn, dbmanager.write_transaction(conn) as cur:
+            await cur.execute("INSERT INTO playlists (id, userid, name) VALUES (1, '1', 'p')")
+            blob_ids = await dbmanager.store_track_blobs(conn, [ENCODED_TRACK, "not a track"])
+            await cur.executemany(
+                "INSERT INTO tracks (plid, userid, blob_id, position) VALUES (1, 1, ?, ?)",
+                [(b, i) for i, b in enumerate(blob_ids)],
+            )
+
+        self.assertEqual(await dbmanager.backfill_track_metadata(), 1)
+        self.assertEqual(await dbmanager.backfill_track_metadata(), 0)
+        async with dbmanager.acquire() as conn:
+            rows = await conn.fetchall(
+                "SELECT title, source, metadata_failed FROM tracks ORDER BY position"
+            )
+        self.assertEqual(
+            [tuple(r) for r in rows],
+            [("Rick Astley - Never Gonna Give You Up", "youtube", 0), (None, None, 1)],
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
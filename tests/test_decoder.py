@@ -0,0 +1,81 @@
+import asyncio
+import unittest
+from unittest import mock
+from bot import dbmanager
+from bot.decoder import DecodeCache, decode_cache, decode_tracks
+from ._utils import DatabaseTestCase
+
+
+def decoded(n: int) -> dict:
+    return {"encoded": f"track{n}", "info": {"title": f"t{n}"}, "pluginInfo": {}}
+
+
+class DecodeCacheTest(DatabaseTestCase):
+    async def count_rows(self) -> int:
+        async with dbmanager.acquire(dbmanager.DECODE_CACHE_DB) as conn:
+            return (await conn.fetchone("SELECT COUNT(*) FROM decoded_tracks"))[0]
+
+    async def test_evicts_least_recently_used(self):
+        cache = DecodeCache(maxsize=1, max_rows=10)
+        with mock.patch("bot.decoder.time.time", return_value=100):
+            await cache.put_many([decoded(n) for n in range(10)])
+        with mock.patch("bot.decoder.time.time", return_value=200):
+            # The oldest tracks are the most recently used ones
+            cache.memory.clear()
+            found = await cache.get_many([f"track{n}" for n in range(3)])
+            self.assertTrue(all(found))
+            await cache.put_many([decoded(n) for n in range(10, 12)])
+
+        self.assertEqual(cache._rows, await self.count_rows())
+        self.assertEqual(cache._rows, 9)
+        cache.memory.clear()
+        found = await cache.get_many([f"track{n}" for n in range(12)])
+        kept = [n for n, track in enumerate(found) if track is not None]
+        self.assertEqual(kept, [0, 1, 2, 6, 7, 8, 9, 10, 11])
+
+    async def test_counts_rows_once(self):
+        cache = DecodeCache(max_rows=100)
+        await cache.put_many([decoded(n) for n in range(5)])
+        # Already stored tracks aren't counted twice
+        await cache.put_many([decoded(n) for n in range(3, 8)])
+        self.assertEqual(cache._rows, 8)
+        self.assertEqual(await self.count_rows(), 8)
+
+
+class ShortNode:
+    """Drops the first track of every ``v4/decodetracks`` request"""
+
+    identifier = "short"
+
+    def __init__(self):
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def send(self, method: str = "GET", *, path: str, data=None, params=None):
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        await asyncio.sleep(0.01)
+        self.in_flight -= 1
+        return [decoded(int(e.removeprefix("track"))) for e in data[1:]]
+
+
+class DecodeTracksTest(DatabaseTestCase):
+    async def test_missing_tracks_are_none(self):
+        decode_cache.memory.clear()
+        node = ShortNode()
+        encoded = [f"track{n}" for n in range(10)]
+        with self.assertLogs("bot", "WARNING"):
+            result = await decode_tracks(node, encoded, chunk_size=2, concurrency=2)
+        self.assertEqual(len(result), 10)
+        self.assertEqual(
+            [t and t["encoded"] for t in result],
+            [None if n % 2 == 0 else f"track{n}" for n in range(10)],
+        )
+        self.assertEqual(node.max_in_flight, 2)
+        # Only the decoded tracks are cached
+        found = await decode_cache.get_many(encoded)
+        self.assertEqual(sum(t is not None for t in found), 5)
+
+
+if __name__ == "__main__":
+    unittest.main()
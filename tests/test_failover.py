@@ -0,0 +1,237 @@
+import asyncio
+import logging
+import time
+import unittest
+from types import SimpleNamespace
+from aiohttp import web
+import wavelink
+from benchmarks._fixtures import encode_tracks
+from bot.nodes import NodeScheduler
+from bot.player import CustomPlayer
+from bot.trackcodec import decode_many
+
+GUILD_ID = 1234
+
+
+def playlist_tracks(count: int) -> list[wavelink.Playable]:
+    pl_info = {"plId": 1, "name": "Playlist", "totalTracks": count}
+    tracks = []
+    for tid, raw in enumerate(decode_many(encode_tracks(count)), start=1):
+        track = wavelink.Playable(raw)
+        track.extras = wavelink.ExtrasNamespace(
+            requester_id=7, trackId=tid, customPlaylist=pl_info
+        )
+        tracks.append(track)
+    return tracks
+
+
+class StandInNode:
+    """A local stand-in for the Lavalink v4 REST and websocket endpoints.
+
+    Player updates are recorded in ``patches``."""
+
+    def __init__(self, uptime: int):
+        self.uptime = uptime
+        self.patches: list[dict] = []
+        self.sockets: set[web.WebSocketResponse] = set()
+        self.runner: web.AppRunner | None = None
+        self.port: int = 0
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_get("/v4/websocket", self.websocket)
+        app.router.add_get("/v4/info", self.info)
+        app.router.add_get("/v4/stats", self.stats)
+        app.router.add_patch("/v4/sessions/{session}", self.session)
+        app.router.add_patch("/v4/sessions/{session}/players/{guild}", self.update_player)
+        app.router.add_delete("/v4/sessions/{session}/players/{guild}", self.destroy_player)
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, "127.0.0.1", 0)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]
+
+    async def kill(self):
+        """Stop like a crashed node: connections are dropped without a close frame"""
+        for ws in tuple(self.sockets):
+            ws._req.transport.abort()
+        await self.runner.cleanup()
+
+    async def websocket(self, request: web.Request):
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        self.sockets.add(ws)
+        await ws.send_json({"op": "ready", "resumed": False, "sessionId": f"session{self.port}"})
+        try:
+            async for _ in ws:
+                pass
+        finally:
+            self.sockets.discard(ws)
+        return ws
+
+    async def info(self, request: web.Request):
+        return web.json_response(
+            {
+                "version": {
+                    "semver": "4.0.0",
+                    "major": 4,
+                    "minor": 0,
+                    "patch": 0,
+                    "preRelease": None,
+                    "build": None,
+                },
+                "buildTime": 0,
+                "git": {"branch": "", "commit": "", "commitTime": 0},
+                "jvm": "",
+                "lavaplayer": "",
+                "sourceManagers": ["spotify"],
+                "filters": [],
+                "plugins": [],
+            }
+        )
+
+    async def stats(self, request: web.Request):
+        return web.json_response(
+            {
+                "players": 0,
+                "playingPlayers": 0,
+                "uptime": self.uptime,
+                "memory": {"free": 0, "used": 0, "allocated": 0, "reservable": 0},
+                "cpu": {"cores": 4, "systemLoad": 0.1, "lavalinkLoad": 0.05},
+            }
+        )
+
+    async def session(self, request: web.Request):
+        return web.json_response({"resuming": False, "timeout": 60})
+
+    async def update_player(self, request: web.Request):
+        self.patches.append(await request.json())
+        return web.json_response(
+            {
+                "guildId": request.match_info["guild"],
+                "track": None,
+                "volume": 100,
+                "paused": False,
+                "state": {"time": 0, "position": 0, "connected": True, "ping": 0},
+                "voice": {"token": "", "endpoint": "", "sessionId": ""},
+                "filters": {},
+            }
+        )
+
+    async def destroy_player(self, request: web.Request):
+        return web.Response(status=204)
+
+
+class FakeClient:
+    def __init__(self):
+        self.user = SimpleNamespace(id=42)
+        self.voice_clients: list = []
+        self.disconnected = asyncio.Event()
+
+    def dispatch(self, event: str, *args):
+        if event == "wavelink_node_disconnected":
+            self.disconnected.set()
+
+
+class FailoverTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        # The crashed node's reconnection errors are expected
+        wavelink_logger = logging.getLogger("wavelink")
+        self.addCleanup(wavelink_logger.setLevel, wavelink_logger.level)
+        wavelink_logger.setLevel(logging.CRITICAL)
+        self.stand_ins = [StandInNode(3_600_000), StandInNode(7_200_000)]
+        for stand_in in self.stand_ins:
+            await stand_in.start()
+        self.client = FakeClient()
+        nodes = [
+            wavelink.Node(
+                uri=f"http://127.0.0.1:{s.port}",
+                password="password",
+                identifier=f"node{i}",
+                retries=0,
+            )
+            for i, s in enumerate(self.stand_ins)
+        ]
+        await wavelink.Pool.connect(nodes=nodes, client=self.client)
+        for _ in range(50):
+            if all(n.status is wavelink.NodeStatus.CONNECTED for n in nodes):
+                break
+            await asyncio.sleep(0.05)
+        self.nodes = nodes
+
+    async def asyncTearDown(self):
+        # Websockets are closed first, the servers wait for them otherwise
+        await wavelink.Pool.close()
+        for stand_in in self.stand_ins:
+            if stand_in.runner.server is not None:
+                await stand_in.runner.cleanup()
+
+    async def connect_player(self, node: wavelink.Node) -> CustomPlayer:
+        channel = SimpleNamespace(id=99, guild=SimpleNamespace(id=GUILD_ID, me=None))
+        player = CustomPlayer(self.client, channel, nodes=[node])
+        player._guild = channel.guild
+        player._voice_state = {
+            "voice": {"session_id": "voice", "token": "token", "endpoint": "endpoint"},
+            "channel_id": str(channel.id),
+        }
+        await player._dispatch_voice_update()
+        node._players[GUILD_ID] = player
+        self.client.voice_clients.append(player)
+        return player
+
+    async def test_player_survives_a_node_crash(self):
+        source, target = self.stand_ins
+        CustomPlayer.history_depth, depth = 3, CustomPlayer.history_depth
+        try:
+            player = await self.connect_player(self.nodes[0])
+        finally:
+            CustomPlayer.history_depth = depth
+        await player.enqueue_many(playlist_tracks(10))
+        for _ in range(5):
+            player.remember(player.queue.get())
+        player.store("channel", "CHANNEL")
+        player.store("menu", "MENU")
+        player.store("message", "MESSAGE")
+        await player.play(player.queue.get())
+        filters = wavelink.Filters()
+        filters.timescale.set(speed=1.2)
+        await player.set_filters(filters)
+        await player.pause(True)
+        # Lavalink reported 42s into the track
+        player._last_position = 42_000
+        player._last_update = time.monotonic_ns()
+
+        current = player.current.encoded
+        queue = [t.encoded for t in player.queue]
+        backpack = [t.encoded for t in player.backpack]
+        history = len(player.queue.history)
+
+        await source.kill()
+        await asyncio.wait_for(self.client.disconnected.wait(), 10)
+        scheduler = NodeScheduler()
+        moved = await scheduler.evacuate(self.nodes[0], [player], disconnect=True)
+
+        self.assertEqual(moved, 1)
+        self.assertIs(player.node, self.nodes[1])
+        resumed = [p for p in target.patches if "track" in p][-1]
+        self.assertEqual(resumed["track"]["encoded"], current)
+        self.assertEqual(
+            resumed["track"]["userData"]["customPlaylist"]["trackId"],
+            player.current.extras.customPlaylist["trackId"],
+        )
+        self.assertGreaterEqual(resumed["position"], 42_000)
+        self.assertIs(resumed["paused"], True)
+        self.assertEqual(resumed["filters"]["timescale"]["speed"], 1.2)
+        self.assertTrue(player.paused)
+        self.assertEqual([t.encoded for t in player.queue], queue)
+        self.assertEqual([t.encoded for t in player.backpack], backpack)
+        self.assertEqual(player.backpack.maxlen, 3)
+        self.assertEqual(len(player.queue.history), history)
+        self.assertEqual(
+            [player.fetch(k) for k in ("channel", "menu", "message")],
+            ["CHANNEL", "MENU", "MESSAGE"],
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,111 @@
+import sqlite3
+import unittest
+from bot import dbmanager
+from ._utils import DatabaseTestCase
+
+# Queries run on every playlist request, with their parameters. Keep them in
+# sync with cogs/RumblingAPI.py, cogs/playlist.py and bot/dbmanager.py.
+HOT_QUERIES = {
+    "playlist owner": ("SELECT * FROM playlists WHERE userid=? AND id=?", ("1", 1)),
+    "playlist": ("SELECT * FROM playlists WHERE id=?", (1,)),
+    "user playlists": ("SELECT * FROM playlists WHERE userid=?", (1,)),
+    "all tracks": (
+        """SELECT t.id, t.plid, t.userid, b.kind, b.data FROM tracks t
+           JOIN track_blobs b ON b.id = t.blob_id
+           WHERE t.plid=? ORDER BY t.position""",
+        (1,),
+    ),
+    "first page": (
+        """SELECT id, title, author, length_ms, source, uri, position FROM tracks
+           WHERE plid=? ORDER BY position, id LIMIT ?""",
+        (1, 100),
+    ),
+    "page cursor": ("SELECT position FROM tracks WHERE id=? AND plid=?", (1, 1)),
+    "next page": (
+        """SELECT id, title, author, length_ms, source, uri, position FROM tracks
+           WHERE plid=? AND (position, id) > (?, ?)
+           ORDER BY position, id LIMIT ?""",
+        (1, 1, 1, 100),
+    ),
+    "summary": (
+        "SELECT COUNT(*), COALESCE(SUM(length_ms), 0) FROM tracks WHERE plid=?",
+        (1,),
+    ),
+    "track limit": (
+        "SELECT COUNT(*), COALESCE(MAX(position), 0) FROM tracks WHERE plid=?",
+        (1,),
+    ),
+    "playlist blobs": ("SELECT DISTINCT blob_id FROM tracks WHERE plid=?", (1,)),
+    "blob ids": ("SELECT hash, id FROM track_blobs WHERE hash IN (?, ?)", (b"a", b"b")),
+    "clear playlist": ("DELETE FROM tracks WHERE plid=? AND userid=?", (1, 1)),
+    "delete playlist": ("DELETE FROM playlists WHERE id=? AND userid=?", (1, "1")),
+    "missing metadata": (
+        """SELECT t.id, b.kind, b.data FROM tracks t JOIN track_blobs b ON b.id = t.blob_id
+           WHERE t.id > ? AND t.title IS NULL AND t.metadata_failed = 0
+           ORDER BY t.id LIMIT ?""",
+        (0, 500),
+    ),
+    "orphan blobs": (
+        """DELETE FROM track_blobs WHERE id IN (?, ?)
+           AND NOT EXISTS (SELECT 1 FROM tracks WHERE blob_id = track_blobs.id)""",
+        (1, 2),
+    ),
+}
+
+
+class MigrationsTest(DatabaseTestCase):
+    def create_databases(self):
+        # The schema before the first migration, with a track of a deleted playlist
+        conn = sqlite3.connect(dbmanager.PLAYLISTS_DB)
+        conn.executescript(
+            """CREATE TABLE playlists (
+                   id INTEGER PRIMARY KEY AUTOINCREMENT NOT NULL,
+                   userid VARCHAR(100) NOT NULL,
+                   name VARCHAR(80) NOT NULL,
+                   description VARCHAR(100),
+                   thumbnail_url VARCHAR(255)
+               );
+               CREATE TABLE tracks (
+                   id INTEGER PRIMARY KEY AUTOINCREMENT NOT NULL,
+                   plid INTEGER NOT NULL,
+                   userid INTEGER NOT NULL,
+                   encoded VARCHAR(255) NOT NULL
+               );
+               INSERT INTO playlists (id, userid, name) VALUES (1, '1', 'playlist');
+               INSERT INTO tracks (plid, userid, encoded) VALUES (1, 1, 'QUFB'), (1, 1, 'QkJC'), (2, 1, 'Q0ND');"""
+        )
+        conn.commit()
+        conn.close()
+
+    async def test_schema_version(self):
+        async with dbmanager.acquire() as conn:
+            version = (await conn.fetchone("PRAGMA user_version"))[0]
+            rows = await conn.fetchall(
+                """SELECT t.plid, t.position, b.kind, b.data FROM tracks t
+                   JOIN track_blobs b ON b.id = t.blob_id ORDER BY t.position"""
+            )
+        self.assertEqual(version, dbmanager.MIGRATIONS[dbmanager.PLAYLISTS_DB][-1][0])
+        self.assertEqual(
+            [(r[0], r[1], dbmanager.unpack_track(r[2], r[3])) for r in rows],
+            [(1, 1, "QUFB"), (1, 2, "QkJC")],
+        )
+
+    async def test_hot_queries_use_indexes(self):
+        async with dbmanager.acquire() as conn:
+            for name, (query, params) in HOT_QUERIES.items():
+                with self.subTest(name):
+                    plan = [
+                        r[3]
+                        for r in await conn.fetchall(f"EXPLAIN QUERY PLAN {query}", params)
+                    ]
+                    lookups = [d for d in plan if d.startswith(("SCAN", "SEARCH"))]
+                    self.assertTrue(lookups, plan)
+                    for detail in lookups:
+                        self.assertFalse(detail.startswith("SCAN"), plan)
+                        self.assertRegex(
+                            detail, r"USING (COVERING )?INDEX|USING INTEGER PRIMARY KEY", plan
+                        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,101 @@
+import unittest
+from types import SimpleNamespace
+from typing import Optional
+from unittest import mock
+import wavelink
+from bot.nodes import DEGRADED_REPORTS, FRAMES_PER_MINUTE, NodeScheduler
+
+
+def stats_data(uptime: int, playing: int, deficit: Optional[int]) -> dict:
+    data = {
+        "players": playing,
+        "playingPlayers": playing,
+        "uptime": uptime,
+        "memory": {"free": 0, "used": 0, "allocated": 0, "reservable": 0},
+        "cpu": {"cores": 4, "systemLoad": 0.1, "lavalinkLoad": 0.05},
+    }
+    if deficit is not None:
+        data["frameStats"] = {
+            "sent": FRAMES_PER_MINUTE * playing - deficit,
+            "nulled": 0,
+            "deficit": deficit,
+        }
+    return data
+
+
+class FakeNode:
+    def __init__(self, identifier: str, uptime: int):
+        self.identifier = identifier
+        self.uptime = uptime
+        self.status = wavelink.NodeStatus.CONNECTED
+        self.players: dict[int, "FakePlayer"] = {}
+
+
+class FakePlayer:
+    def __init__(self, guild_id: int, node: FakeNode):
+        self.guild = SimpleNamespace(id=guild_id)
+        self.node = node
+        node.players[guild_id] = self
+
+    async def migrate(self, node: FakeNode):
+        del self.node.players[self.guild.id]
+        node.players[self.guild.id] = self
+        self.node = node
+
+
+class NodeFailoverTest(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.scheduler = NodeScheduler()
+        self.a = FakeNode("a", 3_600_000)
+        self.b = FakeNode("b", 7_200_000)
+        nodes = {n.identifier: n for n in (self.a, self.b)}
+        patcher = mock.patch.dict(wavelink.Pool._Pool__nodes, nodes, clear=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        # Probes give the start time used to match stats events to nodes
+        for node in (self.a, self.b):
+            self.scheduler.load(node).update(
+                wavelink.StatsResponsePayload(stats_data(node.uptime, 0, None))
+            )
+
+    def event(self, node: FakeNode, playing: int, deficit: Optional[int]):
+        return self.scheduler.on_stats(
+            wavelink.StatsEventPayload(stats_data(node.uptime, playing, deficit))
+        )
+
+    async def test_degraded_node_is_evacuated_then_recovers(self):
+        players = [FakePlayer(guild_id, self.a) for guild_id in range(4)]
+        for _ in range(DEGRADED_REPORTS - 1):
+            self.assertIsNone(self.event(self.a, 4, FRAMES_PER_MINUTE))
+        self.event(self.b, 0, None)
+        self.assertIs(self.event(self.a, 4, FRAMES_PER_MINUTE), self.a)
+        self.assertFalse(self.scheduler.healthy(self.a))
+        self.assertIs(self.scheduler.best("player"), self.b)
+
+        moved = await self.scheduler.evacuate(self.a, players)
+        self.assertEqual(moved, 4)
+        self.assertTrue(all(p.node is self.b for p in players))
+        self.assertEqual((len(self.a.players), len(self.b.players)), (0, 4))
+
+        # Once nothing plays on it, the deficit is forgotten
+        self.assertIsNone(self.event(self.a, 0, None))
+        self.assertTrue(self.scheduler.healthy(self.a))
+        self.assertIs(self.scheduler.best("player"), self.a)
+
+    def test_probe_without_players_resets_the_deficit(self):
+        for _ in range(DEGRADED_REPORTS):
+            self.event(self.a, 2, FRAMES_PER_MINUTE)
+        self.assertTrue(self.scheduler.load(self.a).degraded)
+        # REST stats never have frame stats, they only reset an idle node
+        self.scheduler.load(self.a).update(
+            wavelink.StatsResponsePayload(stats_data(self.a.uptime, 2, None))
+        )
+        self.assertTrue(self.scheduler.load(self.a).degraded)
+        self.scheduler.load(self.a).update(
+            wavelink.StatsResponsePayload(stats_data(self.a.uptime, 0, None))
+        )
+        self.assertFalse(self.scheduler.load(self.a).degraded)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,28 @@
+import unittest
+import wavelink
+from bot.player import user_data_extras
+
+
+class UserDataTest(unittest.TestCase):
+    def test_track_id_is_sent_inside_custom_playlist(self):
+        pl_info = {"plId": 1, "name": "Playlist"}
+        extras = wavelink.ExtrasNamespace(
+            requester_id=7, trackId=3, customPlaylist=pl_info
+        )
+        sent = user_data_extras(extras)
+        self.assertEqual(
+            dict(sent),
+            {"requester_id": 7, "customPlaylist": {"plId": 1, "name": "Playlist", "trackId": 3}},
+        )
+        # The shared playlist info isn't modified
+        self.assertEqual(pl_info, {"plId": 1, "name": "Playlist"})
+        # Playing the track again sends the same userData
+        self.assertIs(user_data_extras(sent), sent)
+
+    def test_other_extras_are_unchanged(self):
+        extras = wavelink.ExtrasNamespace(requester_id=7)
+        self.assertIs(user_data_extras(extras), extras)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,35 @@
+import unittest
+import wavelink
+from bot.queue import QueueEntry
+
+
+def entry(encoded: str, identifier: str) -> QueueEntry:
+    return QueueEntry(
+        encoded,
+        identifier,
+        "Title",
+        "Author",
+        200_000,
+        False,
+        None,
+        None,
+        "youtube",
+        wavelink.ExtrasNamespace(),
+    )
+
+
+class QueueEntryTest(unittest.TestCase):
+    def test_equality_matches_hash(self):
+        a = entry("QAAA1", "same")
+        b = entry("QAAA2", "same")
+        self.assertNotEqual(a, b)
+        self.assertEqual(len({a, b}), 2)
+
+        c = entry("QAAA1", "other")
+        self.assertEqual(a, c)
+        self.assertEqual(hash(a), hash(c))
+        self.assertEqual(len({a, c}), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,27 @@
+import unittest
+from bot.search import SearchService
+
+
+class RecordingNode:
+    identifier = "fake"
+
+    def __init__(self):
+        self.identifiers: list[str] = []
+
+    async def send(self, method: str = "GET", *, path: str, data=None, params=None):
+        self.identifiers.append(params["identifier"])
+        return {"loadType": "empty", "data": {}}
+
+
+class SearchServiceTest(unittest.IsolatedAsyncioTestCase):
+    async def test_query_is_only_normalised_for_the_cache(self):
+        service = SearchService()
+        node = RecordingNode()
+        await service.search("  Daft  PUNK ", node=node)
+        await service.search("daft punk", node=node)
+        self.assertEqual(node.identifiers, ["spsearch:Daft  PUNK"])
+        self.assertEqual(service.cache.hits, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
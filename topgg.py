@@ -1,7 +1,21 @@
 import asyncio
+import random
+from typing import Optional
 from discord.ext.commands import Bot
 import aiohttp
 import logging
+from bot.cache import TTLCache
+from bot.misc import vote_cache
+
+API_URL = "https://top.gg/api"
+# Total time budget of a request, retries excluded
+REQUEST_TIMEOUT = aiohttp.ClientTimeout(total=5, connect=2)
+MAX_RETRIES = 3
+RETRY_BASE_DELAY = 0.5
+# How long check_vote answers are cached
+VOTED_TTL = 600
+NOT_VOTED_TTL = 30
+
 
 class TopGG:
     def __init__(
@@ -17,23 +31,82 @@ class TopGG:
         self.topgg_token = topgg_token
         self.webhook_port = webhook_port
         self.webhook_auth = webhook_auth
+        self.votes = TTLCache(10_000, VOTED_TTL)
+        self.requests: int = 0
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._servercount: Optional[asyncio.Task] = None
         if autopost_servercount and bot.mode == "normal":
-            asyncio.create_task(self._servercount_task())
+            self._servercount = asyncio.create_task(self._servercount_task())
+
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        """The keep-alive session used for every top.gg request"""
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                headers={"Authorization": self.topgg_token},
+                timeout=REQUEST_TIMEOUT,
+                connector=aiohttp.TCPConnector(limit=10, keepalive_timeout=60),
+            )
+        return self._session
+
+    async def close(self):
+        """|coro|
+
+        Stop posting the server count and close the session"""
+        if self._servercount is not None:
+            self._servercount.cancel()
+        if self._session is not None:
+            await self._session.close()
+
+    async def _request(self, method: str, path: str, **kwargs) -> dict:
+        """|coro|
+
+        Send a request to the top.gg API, it's retried with exponential
+        backoff and jitter on connection errors, 429 and 5xx responses"""
+        for attempt in range(MAX_RETRIES + 1):
+            self.requests += 1
+            try:
+                async with self.session.request(
+                    method, f"{API_URL}/{path}", **kwargs
+                ) as response:
+                    if response.status != 429 and response.status < 500:
+                        response.raise_for_status()
+                        return await response.json(content_type=None)
+                    error = aiohttp.ClientResponseError(
+                        response.request_info,
+                        response.history,
+                        status=response.status,
+                        message=response.reason or "",
+                    )
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+                error = e
+            if attempt == MAX_RETRIES:
+                raise error
+            delay = random.uniform(0, RETRY_BASE_DELAY * 2**attempt)
+            self.logger.warning(
+                "top.gg request failed (%s), retrying in %.2fs", error, delay
+            )
+            await asyncio.sleep(delay)
 
     async def check_vote(self, user_id: int) -> bool:
         """Checks if a user has voted or not"""
-        url = f"https://top.gg/api/bots/{self.bot.user.id}/check?userId={user_id}"
-        headers = {"Authorization": self.topgg_token}
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url, headers=headers) as response:
-                json_response = await response.json()
-                return bool(json_response["voted"])
+        # Votes received by the webhook
+        if vote_cache.has_voted(user_id):
+            return True
+        voted = self.votes.get(user_id)
+        if voted is not None:
+            return voted
+        data = await self._request(
+            "GET", f"bots/{self.bot.user.id}/check", params={"userId": user_id}
+        )
+        voted = bool(data["voted"])
+        self.votes.set(user_id, voted, ttl=None if voted else NOT_VOTED_TTL)
+        return voted
 
 
     async def _servercount_task(self):
         await self.bot.wait_until_ready()
-        url = f"https://top.gg/api/bots/{self.bot.user.id}/stats"
-        headers = {"Authorization": self.topgg_token}
+        path = f"bots/{self.bot.user.id}/stats"
         while True:
             try:
                 guilds = len(self.bot.guilds)
@@ -41,18 +114,12 @@ class TopGG:
                 self.logger.info(
                     f"Sending POST request to topgg using payload: {str(payload)}"
                 )
-                async with aiohttp.ClientSession() as session:
-                    async with session.post(
-                        url, json=payload, headers=headers
-                    ) as response:
-                        if response.status == 200:
-                            self.logger.debug("Server count updated successfully.")
-                        else:
-                            self.logger.info(session.headers)
-                            self.logger.error(
-                                f"Failed to update server count. Status: {response.status}"
-                            )
-                            self.logger.error(response.content.read_nowait())
+                await self._request("POST", path, json=payload)
+                self.logger.debug("Server count updated successfully.")
+            except aiohttp.ClientResponseError as e:
+                self.logger.error(
+                    f"Failed to update server count. Status: {e.status}"
+                )
             except Exception as e:
                 self.logger.exception(
                     f"An error occurred while updating server count: {e}"